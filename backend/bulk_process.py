@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import contextlib
+import glob
+import json
+import mimetypes
+import os
+import signal
+import sys
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Set
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.models import ProcessingResult, DocumentCategory
+from config import settings
+
+SUPPORTED_PREFIXES = ("image/", "application/pdf")
+SHARD_PREFIX = "results-"
+
+
+def make_document(source_id: str, path: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    # File ids derive from the source so a resumed run recognises documents
+    # already written, whichever shard they landed in.
+    filename = entry.get("filename") or os.path.basename(path)
+    return {
+        "file_id": entry.get("file_id") or str(uuid.uuid5(uuid.NAMESPACE_URL, source_id)),
+        "path": path,
+        "filename": filename,
+        "content_type": entry.get("content_type") or mimetypes.guess_type(filename)[0]
+    }
+
+
+def iter_documents(source: str) -> Iterator[Dict[str, Any]]:
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                content_type = mimetypes.guess_type(name)[0]
+                if not content_type or not content_type.startswith(SUPPORTED_PREFIXES):
+                    continue
+                path = os.path.join(root, name)
+                yield make_document(os.path.relpath(path, source), path, {"content_type": content_type})
+        return
+
+    # JSONL manifest: one {"path": ..., "file_id"?, "filename"?, "content_type"?}
+    # object per line, relative paths resolved against the manifest's directory.
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            yield make_document(entry["path"], os.path.join(base, entry["path"]), entry)
+
+
+def shard_paths(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, f"{SHARD_PREFIX}*.jsonl")))
+
+
+def load_checkpoint(directory: str, retry_errors: bool) -> Set[str]:
+    # The shards are the checkpoint: every line is flushed as soon as its
+    # document finishes, and a line torn by a crash simply fails to parse.
+    done = set()
+    for path in shard_paths(directory):
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if retry_errors and record.get("error"):
+                    continue
+                done.add(record["file_id"])
+    return done
+
+
+class ShardWriter:
+    # Appends one ProcessingResult per line and rolls over every shard_size
+    # records. Each run starts a new shard, so it never appends after a torn line.
+    def __init__(self, directory: str, shard_size: int):
+        self.directory = directory
+        self.shard_size = shard_size
+        existing = [
+            int(os.path.basename(path)[len(SHARD_PREFIX):-len(".jsonl")])
+            for path in shard_paths(directory)
+        ]
+        self.index = max(existing) + 1 if existing else 0
+        self.count = 0
+        self._handle = None
+
+    def write(self, result: ProcessingResult):
+        if self._handle is None or self.count >= self.shard_size:
+            self._roll()
+        self._handle.write(result.model_dump_json() + "\n")
+        self._handle.flush()
+        self.count += 1
+
+    def _roll(self):
+        self.close()
+        path = os.path.join(self.directory, f"{SHARD_PREFIX}{self.index:05d}.jsonl")
+        self._handle = open(path, "w", encoding="utf-8")
+        self.index += 1
+        self.count = 0
+
+    def close(self):
+        if self._handle is not None:
+            os.fsync(self._handle.fileno())
+            self._handle.close()
+            self._handle = None
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class Progress:
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.start_time = time.perf_counter()
+
+    def add(self, result: ProcessingResult):
+        self.done += 1
+        if result.error:
+            self.errors += 1
+        elif result.cache_hit or result.near_duplicate:
+            self.cache_hits += 1
+
+    def line(self) -> str:
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.done
+        eta = format_duration(remaining / rate) if rate > 0 else "?"
+        return (
+            f"{self.done}/{self.total} documents ({self.skipped} already done), "
+            f"{rate:.2f} docs/s, {self.errors} errors, {self.cache_hits} reused, "
+            f"elapsed {format_duration(elapsed)}, ETA {eta}"
+        )
+
+
+async def report(progress: Progress, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        print(progress.line(), file=sys.stderr, flush=True)
+
+
+async def process_document(processor, document: Dict[str, Any]) -> ProcessingResult:
+    start_time = time.time()
+    try:
+        file_content = await asyncio.to_thread(read_file, document["path"])
+        return await processor.process_document(
+            file_content=file_content,
+            filename=document["filename"],
+            content_type=document["content_type"] or "application/octet-stream",
+            file_id=document["file_id"],
+            started_at=start_time,
+            upload_read_seconds=time.time() - start_time
+        )
+    except Exception as e:
+        return ProcessingResult(
+            file_id=document["file_id"],
+            filename=document["filename"],
+            category=DocumentCategory.OTHER,
+            confidence=0.0,
+            processing_time=time.time() - start_time,
+            error=str(e)
+        )
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as handle:
+        return handle.read()
+
+
+async def run(args: argparse.Namespace, documents: List[Dict[str, Any]], skipped: int) -> bool:
+    # Imported here so --help and argument errors do not pay for the
+    # OpenAI client and image stack.
+    from document_processor import DocumentProcessor
+    from llm_client import LLMClient
+    import llm_scheduler
+
+    processor = DocumentProcessor()
+    # Enough documents in flight to keep every preprocessing worker and
+    # every LLM slot busy at once.
+    concurrency = args.concurrency or settings.LLM_MAX_CONCURRENCY + processor.preprocess_pool.workers
+    writer = ShardWriter(args.output, args.shard_size)
+    progress = Progress(len(documents), skipped)
+    pending = iter(documents)
+
+    async def worker():
+        with llm_scheduler.lane(llm_scheduler.LANE_BULK):
+            for document in pending:
+                result = await process_document(processor, document)
+                writer.write(result)
+                progress.add(result)
+
+    print(f"Processing {len(documents)} documents ({skipped} already done) "
+          f"with {concurrency} in flight", file=sys.stderr, flush=True)
+    reporter = asyncio.create_task(report(progress, args.report_interval))
+    workers = asyncio.gather(*[worker() for _ in range(concurrency)])
+    # SIGINT/SIGTERM cancel the workers once; the cleanup below must run to
+    # completion or forked preprocessing workers are left behind.
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(signum, workers.cancel)
+    try:
+        await workers
+        return True
+    except asyncio.CancelledError:
+        return False
+    finally:
+        reporter.cancel()
+        writer.close()
+        processor.preprocess_pool.shutdown()
+        if processor.entity_index is not None:
+            processor.entity_index.close()
+        if processor.results_store is not None:
+            processor.results_store.close()
+        await LLMClient.aclose()
+        print(progress.line(), file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Process a directory or JSONL manifest of documents into sharded JSONL results, "
+                    "resuming where a previous run into the same output directory stopped"
+    )
+    parser.add_argument("source", help="directory to scan recursively, or a JSONL manifest with a \"path\" per line")
+    parser.add_argument("--output", required=True, help="directory for results-NNNNN.jsonl shards")
+    parser.add_argument("--shard-size", type=int, default=10000, help="results per shard")
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="documents in flight (default: LLM_MAX_CONCURRENCY + preprocessing workers)")
+    parser.add_argument("--retry-errors", action="store_true", help="reprocess documents whose last result was an error")
+    parser.add_argument("--limit", type=int, default=0, help="process at most this many pending documents")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    done = load_checkpoint(args.output, args.retry_errors)
+    documents = []
+    skipped = 0
+    for document in iter_documents(args.source):
+        if document["file_id"] in done:
+            skipped += 1
+            continue
+        # Manifests may list a document twice; it is processed once.
+        done.add(document["file_id"])
+        documents.append(document)
+    if args.limit:
+        documents = documents[:args.limit]
+    if not documents:
+        print(f"Nothing to do ({skipped} already done)", file=sys.stderr)
+        return
+
+    if not asyncio.run(run(args, documents, skipped)):
+        print("Interrupted; rerun the same command to resume", file=sys.stderr)
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
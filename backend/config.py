@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -8,6 +9,114 @@ class Settings:
     OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
     BACKEND_HOST = os.getenv("BACKEND_HOST", "localhost")
     BACKEND_PORT = int(os.getenv("BACKEND_PORT", "8000"))
+    BACKEND_WORKERS = int(os.getenv("BACKEND_WORKERS", "0"))
+    BACKEND_GRACEFUL_TIMEOUT = int(os.getenv("BACKEND_GRACEFUL_TIMEOUT", "30"))
+    SHARED_STATE_DB_PATH = os.getenv("SHARED_STATE_DB_PATH", "")
+    SHARED_STATE_SYNC_INTERVAL = float(os.getenv("SHARED_STATE_SYNC_INTERVAL", "0.25"))
+    WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    WARMUP_FILES = os.getenv("WARMUP_FILES", "true").lower() == "true"
+    WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+    WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "2"))
     FRONTEND_PORT = int(os.getenv("FRONTEND_PORT", "8501"))
+    LLM_VISION_MODEL = os.getenv("LLM_VISION_MODEL", "anthropic/claude-3.5-sonnet")
+    LLM_TEXT_MODEL = os.getenv("LLM_TEXT_MODEL", "anthropic/claude-3.5-sonnet")
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "16"))
+    LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+    LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+    LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+    LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "8"))
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+    LLM_PROMPT_CACHE = os.getenv("LLM_PROMPT_CACHE", "true").lower() == "true"
+    LLM_PROMPT_CACHE_MODELS = [
+        prefix.strip() for prefix in os.getenv("LLM_PROMPT_CACHE_MODELS", "anthropic/").split(",") if prefix.strip()
+    ]
+    HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+    HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+    HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "2.0"))
+    HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "15"))
+    HEDGE_MODELS = json.loads(os.getenv("HEDGE_MODELS", "{}"))
+    HEDGE_BASE_URL = os.getenv("HEDGE_BASE_URL", "")
+    HEDGE_API_KEY = os.getenv("HEDGE_API_KEY", "")
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+    RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+    RESULT_CACHE_DB_PATH = os.getenv("RESULT_CACHE_DB_PATH", "")
+    RESULT_CACHE_DB_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_DB_MAX_ENTRIES", "100000"))
+    RESULT_CACHE_LEASE_SECONDS = float(os.getenv("RESULT_CACHE_LEASE_SECONDS", "180"))
+    PHASH_INDEX_ENABLED = os.getenv("PHASH_INDEX_ENABLED", "true").lower() == "true"
+    PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+    PHASH_MODE = os.getenv("PHASH_MODE", "reuse")
+    PHASH_INDEX_DB_PATH = os.getenv("PHASH_INDEX_DB_PATH", "")
+    ENTITY_INDEX_ENABLED = os.getenv("ENTITY_INDEX_ENABLED", "true").lower() == "true"
+    ENTITY_INDEX_DB_PATH = os.getenv("ENTITY_INDEX_DB_PATH", "entities.db")
+    ENTITY_DEFAULT_COUNTRY_CODE = os.getenv("ENTITY_DEFAULT_COUNTRY_CODE", "").lstrip("+")
+    ENTITY_QUERY_LIMIT = int(os.getenv("ENTITY_QUERY_LIMIT", "100"))
+    RESULTS_STORE_ENABLED = os.getenv("RESULTS_STORE_ENABLED", "false").lower() == "true"
+    RESULTS_STORE_DIR = os.getenv("RESULTS_STORE_DIR", "results")
+    RESULTS_STORE_SEGMENT_BYTES = int(os.getenv("RESULTS_STORE_SEGMENT_BYTES", str(256 * 1024 * 1024)))
+    RESULTS_STORE_ZSTD_LEVEL = int(os.getenv("RESULTS_STORE_ZSTD_LEVEL", "3"))
+    RESULTS_STORE_DICT_SAMPLES = int(os.getenv("RESULTS_STORE_DICT_SAMPLES", "1000"))
+    RESULTS_STORE_FSYNC = os.getenv("RESULTS_STORE_FSYNC", "false").lower() == "true"
+    RESULTS_STORE_RETENTION_DAYS = float(os.getenv("RESULTS_STORE_RETENTION_DAYS", "90"))
+    RESULTS_STORE_MAX_BYTES = int(os.getenv("RESULTS_STORE_MAX_BYTES", str(10 * 1024 ** 3)))
+    BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+    PREPROCESS_EXECUTOR = os.getenv("PREPROCESS_EXECUTOR", "process")
+    PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "0"))
+    PREPROCESS_MAX_TASK_BYTES = int(os.getenv("PREPROCESS_MAX_TASK_BYTES", str(50 * 1024 * 1024)))
+    PREPROCESS_TIMEOUT = float(os.getenv("PREPROCESS_TIMEOUT", "30"))
+    PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "200000"))
+    PDF_MAX_TOKENS = int(os.getenv("PDF_MAX_TOKENS", "0"))
+    CHARS_PER_TOKEN = int(os.getenv("CHARS_PER_TOKEN", "4"))
+    PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+    PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+    PDF_MIN_PAGE_CHARS = int(os.getenv("PDF_MIN_PAGE_CHARS", "20"))
+    PDF_RASTERIZE = os.getenv("PDF_RASTERIZE", "true").lower() == "true"
+    PDF_RASTER_MIN_TEXTLESS_FRACTION = float(os.getenv("PDF_RASTER_MIN_TEXTLESS_FRACTION", "0.5"))
+    PDF_RASTER_MAX_PAGES = int(os.getenv("PDF_RASTER_MAX_PAGES", "4"))
+    PDF_RASTER_SCAN_PAGES = int(os.getenv("PDF_RASTER_SCAN_PAGES", "32"))
+    PDF_RASTER_DPI = int(os.getenv("PDF_RASTER_DPI", "150"))
+    LONG_DOCUMENT_TOKENS = int(os.getenv("LONG_DOCUMENT_TOKENS", "8000"))
+    CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "3000"))
+    CHUNK_MAX_OUTPUT_TOKENS = int(os.getenv("CHUNK_MAX_OUTPUT_TOKENS", "1024"))
+    CATEGORIZATION_HEAD_CHARS = int(os.getenv("CATEGORIZATION_HEAD_CHARS", "2000"))
+    IMAGE_TOKEN_BUDGET = int(os.getenv("IMAGE_TOKEN_BUDGET", "1400"))
+    IMAGE_BYTE_BUDGET = int(os.getenv("IMAGE_BYTE_BUDGET", "400000"))
+    IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1568"))
+    IMAGE_JPEG_QUALITIES = [
+        int(quality) for quality in os.getenv("IMAGE_JPEG_QUALITIES", "85,75,60").split(",")
+    ]
+    IMAGE_TILE_ASPECT = float(os.getenv("IMAGE_TILE_ASPECT", "2.0"))
+    IMAGE_MAX_TILES = int(os.getenv("IMAGE_MAX_TILES", "4"))
+    IMAGE_AUTOCROP = os.getenv("IMAGE_AUTOCROP", "true").lower() == "true"
+    IMAGE_AUTO_GRAYSCALE = os.getenv("IMAGE_AUTO_GRAYSCALE", "false").lower() == "true"
+    ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+    SMALL_MODEL = os.getenv("SMALL_MODEL", "anthropic/claude-3-haiku")
+    ROUTER_HEURISTIC_THRESHOLDS = json.loads(
+        os.getenv("ROUTER_HEURISTIC_THRESHOLDS", '{"default": 0.95}')
+    )
+    ROUTER_SMALL_MODEL_THRESHOLDS = json.loads(
+        os.getenv("ROUTER_SMALL_MODEL_THRESHOLDS", '{"default": 0.85, "other": 0.95}')
+    )
+    RESPONSE_FORMAT = os.getenv("RESPONSE_FORMAT", "compact")
+    TRANSCRIPT_MAX_CHARS = int(os.getenv("TRANSCRIPT_MAX_CHARS", "1000"))
+    JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+    JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 86400)))
+    JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", "60"))
+    JOB_RECOVER_ON_START = os.getenv("JOB_RECOVER_ON_START", "true").lower() == "true"
+    JOB_DRAIN_SECONDS = float(os.getenv("JOB_DRAIN_SECONDS", "20"))
+    PROFILE_SLOW_REQUESTS_SECONDS = float(os.getenv("PROFILE_SLOW_REQUESTS_SECONDS", "0"))
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "1.0"))
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
 
 settings = Settings()
\ No newline at end of file
@@ -1,82 +1,529 @@
+import asyncio
+import hashlib
+import sqlite3
 import sys
 import os
-from typing import Dict, Any
+import time
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from shared.models import ProcessingResult, DocumentCategory
+from shared.models import ProcessingResult, DocumentCategory, ExtractedContent
 from file_processor import FileProcessor
-from llm_client import LLMClient
+from llm_client import LLMClient, PROMPT_VERSION
+from result_cache import ResultCache, make_cache_key
+from perceptual_index import PerceptualIndex
+from entity_index import EntityIndex
+from results_store import ResultsStore
+from preprocess_pool import PreprocessPool
+from router import ModelRouter
+from config import settings
+import metrics
 
 
 class DocumentProcessor:
     def __init__(self):
         self.file_processor = FileProcessor()
         self.llm_client = LLMClient()
+        self.preprocess_pool = PreprocessPool()
+        self.router = ModelRouter(self.llm_client)
+        self.result_cache = ResultCache() if settings.RESULT_CACHE_ENABLED else None
+        # Near-duplicate lookups resolve to entries of the result cache, so the
+        # index is only useful alongside it.
+        self.phash_index = None
+        if self.result_cache is not None and settings.PHASH_INDEX_ENABLED:
+            self.phash_index = PerceptualIndex()
+        self.entity_index = EntityIndex() if settings.ENTITY_INDEX_ENABLED else None
+        self.results_store = ResultsStore() if settings.RESULTS_STORE_ENABLED else None
     
     async def process_document(
         self, 
         file_content: bytes, 
         filename: str, 
         content_type: str, 
-        file_id: str
+        file_id: str,
+        started_at: Optional[float] = None,
+        upload_read_seconds: float = 0.0
     ) -> ProcessingResult:
+        # started_at and upload_read_seconds let callers that read the upload
+        # themselves have it counted in the result before it is stored.
+        with metrics.document_context() as stats, metrics.DOCUMENTS_IN_FLIGHT.track():
+            start_time = started_at or time.time()
+            if upload_read_seconds:
+                metrics.record_stage("upload_read", upload_read_seconds)
+            content_hash = hashlib.sha256(file_content).hexdigest()
+            result = await self._process_cached(file_content, filename, content_type, file_id, content_hash)
+            await self._index_entities(result)
+            self._finalize(result, stats, start_time)
+            await self._store_result(result, content_hash)
+            return result
+    
+    async def stream_document(
+        self, 
+        file_content: bytes, 
+        filename: str, 
+        content_type: str, 
+        file_id: str,
+        started_at: Optional[float] = None,
+        upload_read_seconds: float = 0.0
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        # The pipeline runs in its own task (and so its own metrics context);
+        # events are handed over through a queue until the final "result".
+        # The task is watched alongside the queue, so a pipeline that dies
+        # before its result still ends the stream with an error result.
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self._stream_into(
+            queue, file_content, filename, content_type, file_id, started_at, upload_read_seconds
+        ))
+        getter = None
         try:
-            file_info = self.file_processor.get_file_info(
-                filename, content_type, len(file_content)
-            )
-            
-            if file_info["is_image"]:
-                base64_image, error = self.file_processor.process_image(
-                    file_content, content_type
-                )
-                if error:
-                    raise Exception(error)
-                
-                analysis = await self.llm_client.analyze_document(
-                    content="", 
-                    is_image=True, 
-                    base64_image=base64_image
+            while True:
+                if queue.empty() and task.done():
+                    error = task.exception() if not task.cancelled() else None
+                    yield "result", self._error_result(
+                        file_id, filename, error or RuntimeError("Processing was cancelled")
+                    )
+                    return
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait((getter, task), return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                event, data = getter.result()
+                yield event, data
+                if event == "result":
+                    return
+        finally:
+            if getter is not None:
+                getter.cancel()
+            task.cancel()
+    
+    async def _stream_into(
+        self, 
+        queue: asyncio.Queue, 
+        file_content: bytes, 
+        filename: str, 
+        content_type: str, 
+        file_id: str,
+        started_at: Optional[float],
+        upload_read_seconds: float
+    ):
+        with metrics.document_context() as stats, metrics.DOCUMENTS_IN_FLIGHT.track():
+            started_at = started_at or time.time()
+            if upload_read_seconds:
+                metrics.record_stage("upload_read", upload_read_seconds)
+            start_time = time.perf_counter()
+            category_sent = False
+            result = None
+            content_hash = hashlib.sha256(file_content).hexdigest()
+            try:
+                file_info = self.file_processor.get_file_info(
+                    filename, content_type, len(file_content)
                 )
+                cache_key = None
+                if self.result_cache is not None:
+                    cache_key = make_cache_key(
+                        content_hash, self.router.cache_namespace(file_info["is_image"]), PROMPT_VERSION
+                    )
+                    cached = await self.result_cache.get(cache_key)
+                    if cached is not None:
+                        metrics.record_stage("cache_lookup", time.perf_counter() - start_time)
+                        result = self._from_cache(cached, file_id, filename, file_info)
                 
-            elif file_info["is_pdf"]:
-                text_content, error = self.file_processor.process_pdf(file_content)
-                if error:
-                    raise Exception(error)
+                if result is None:
+                    text_content, base64_images = await self._prepare(file_content, content_type, file_info)
+                    if cache_key is not None:
+                        result = await self._near_duplicate(file_id, filename, file_info, cache_key)
                 
-                analysis = await self.llm_client.analyze_document(
-                    content=text_content, 
-                    is_image=False
+                if result is None:
+                    if base64_images is not None:
+                        events = self.router.stream_image(
+                            base64_images, text=text_content or "", **self._vision_input(file_info)
+                        )
+                    else:
+                        events = self.router.stream_text(text_content)
+                    
+                    async for event, data in events:
+                        if event == "analysis":
+                            result = self._build_result(
+                                file_id, filename, file_info, data["analysis"], data["model_tier"]
+                            )
+                            continue
+                        if event == "category" and not category_sent:
+                            category_sent = True
+                            metrics.record_stage("time_to_category", time.perf_counter() - start_time)
+                        queue.put_nowait((event, data))
+                    
+                    if cache_key is not None:
+                        value = result.model_dump(mode="json")
+                        if self._cacheable(value):
+                            await self.result_cache.set(cache_key, value)
+                            await self._index_result(value, cache_key)
+                        
+            except Exception as e:
+                result = self._error_result(file_id, filename, e)
+            
+            if not category_sent:
+                metrics.record_stage("time_to_category", time.perf_counter() - start_time)
+                queue.put_nowait(("category", {
+                    "category": result.category.value,
+                    "confidence": result.confidence
+                }))
+            await self._index_entities(result)
+            self._finalize(result, stats, started_at)
+            await self._store_result(result, content_hash)
+            queue.put_nowait(("result", result))
+    
+    async def _index_entities(self, result: ProcessingResult):
+        # The analysis is already done; a failed index write is counted
+        # rather than turned into a failed document. A near-duplicate carries
+        # the matched document's entities, which were never read from this
+        # file, so indexing them would link it into that document's rings.
+        if self.entity_index is None or result.error or result.near_duplicate:
+            return
+        with metrics.stage("entity_index"):
+            try:
+                await asyncio.to_thread(
+                    self.entity_index.add,
+                    result.file_id,
+                    result.filename,
+                    result.category.value,
+                    result.extracted_content.key_entities.model_dump()
+                )
+                metrics.ENTITY_INDEX_WRITES_TOTAL.inc(status="ok")
+            except sqlite3.Error:
+                metrics.ENTITY_INDEX_WRITES_TOTAL.inc(status="error")
+    
+    async def _store_result(self, result: ProcessingResult, content_hash: str):
+        # Like the entity index, a failed append does not fail the document.
+        # A cache hit repeats a stored analysis; it is found by content hash.
+        if self.results_store is None or result.cache_hit:
+            return
+        with metrics.stage("results_store"):
+            try:
+                await asyncio.to_thread(
+                    self.results_store.append, result.model_dump(mode="json"), content_hash
                 )
+                metrics.RESULTS_STORE_WRITES_TOTAL.inc(status="ok")
+            except (sqlite3.Error, OSError):
+                metrics.RESULTS_STORE_WRITES_TOTAL.inc(status="error")
+    
+    def _finalize(self, result: ProcessingResult, stats: dict, start_time: float):
+        result.processing_time = time.time() - start_time
+        result.stage_timings = {
+            name: round(seconds, 6) for name, seconds in stats["stages"].items()
+        }
+        result.token_usage = dict(stats["usage"])
+        if stats["model"]:
+            result.llm_model = stats["model"]
+            result.hedged = stats["hedged"]
+        
+        if result.cache_hit:
+            outcome = "cache_hit"
+        elif result.near_duplicate:
+            outcome = "near_duplicate"
+        elif result.error:
+            outcome = "error"
+        else:
+            outcome = stats["outcome"]
+        metrics.DOCUMENTS_TOTAL.inc(category=result.category.value, outcome=outcome)
+    
+    async def _process_cached(
+        self, 
+        file_content: bytes, 
+        filename: str, 
+        content_type: str, 
+        file_id: str,
+        content_hash: str
+    ) -> ProcessingResult:
+        if self.result_cache is None:
+            return await self._process_uncached(file_content, filename, content_type, file_id)
+        
+        lookup_start = time.perf_counter()
+        file_info = self.file_processor.get_file_info(
+            filename, content_type, len(file_content)
+        )
+        cache_key = make_cache_key(
+            content_hash, self.router.cache_namespace(file_info["is_image"]), PROMPT_VERSION
+        )
+        
+        computed: List[ProcessingResult] = []
+        
+        async def compute() -> Dict[str, Any]:
+            result = await self._process_uncached(
+                file_content, filename, content_type, file_id, cache_key
+            )
+            computed.append(result)
+            return result.model_dump(mode="json")
+        
+        value, cache_hit = await self.result_cache.get_or_compute(
+            cache_key, compute, should_store=self._cacheable
+        )
+        if not cache_hit:
+            if not computed:
+                # Shared with a concurrent upload of the same content whose
+                # result was not cached (an error or fallback answer).
+                if not value.get("error"):
+                    metrics.mark_outcome(
+                        "llm_error" if value["extracted_content"]["metadata"].get("document_type") == "error"
+                        else "fallback"
+                    )
+                return self._from_cache(value, file_id, filename, file_info, cache_hit=False)
+            if self._cacheable(value):
+                await self._index_result(value, cache_key)
+            # Computed here, so the model exists already; no need to validate it back.
+            return computed[0]
+        
+        metrics.record_stage("cache_lookup", time.perf_counter() - lookup_start)
+        return self._from_cache(value, file_id, filename, file_info)
+    
+    def _cacheable(self, value: Dict[str, Any]) -> bool:
+        # Fallback and LLM-error answers carry no error field; the document's
+        # outcome records whether the analysis actually succeeded.
+        stats = metrics.current_stats()
+        return not value.get("error") and (stats is None or stats["outcome"] == "ok")
+    
+    def _from_cache(
+        self, 
+        value: Dict[str, Any], 
+        file_id: str, 
+        filename: str, 
+        file_info: Dict[str, Any],
+        cache_hit: bool = True
+    ) -> ProcessingResult:
+        result = ProcessingResult(**value)
+        result.file_id = file_id
+        result.filename = filename
+        result.extracted_content.file_info = file_info
+        result.cache_hit = cache_hit
+        return result
+    
+    async def _near_duplicate(
+        self, 
+        file_id: str, 
+        filename: str, 
+        file_info: Dict[str, Any], 
+        cache_key: str
+    ) -> Optional[ProcessingResult]:
+        phash = file_info.get("image", {}).get("phash")
+        if self.phash_index is None or not phash:
+            return None
+        
+        with metrics.stage("phash_lookup"):
+            # A locked or unreadable index only costs the near-duplicate check.
+            try:
+                matches = await asyncio.to_thread(self.phash_index.search, int(phash, 16))
+            except sqlite3.Error:
+                return None
+            # Only reuse results produced under the same models and prompt.
+            namespace = cache_key.split(":", 1)[1]
+            for distance, match_key in matches:
+                if match_key.split(":", 1)[1] != namespace:
+                    continue
+                value = await self.result_cache.get(match_key)
+                if value is None:
+                    continue
                 
+                result = self._from_cache(value, file_id, filename, file_info)
+                result.cache_hit = False
+                result.near_duplicate = {
+                    "file_id": value["file_id"],
+                    "filename": value["filename"],
+                    "distance": distance
+                }
+                if settings.PHASH_MODE == "flag":
+                    result.extracted_content.metadata.fraud_risk_indicators.append(
+                        f"Near-duplicate of previously analysed document {value['filename']} "
+                        f"(known campaign match, hash distance {distance})"
+                    )
+                return result
+        return None
+    
+    async def _index_result(self, value: Dict[str, Any], cache_key: str):
+        # Results that were themselves near-duplicates are not indexed, so
+        # matches always point at an analysis the model actually produced.
+        if self.phash_index is None or value.get("near_duplicate"):
+            return
+        phash = value["extracted_content"].get("file_info", {}).get("image", {}).get("phash")
+        if phash:
+            try:
+                await asyncio.to_thread(self.phash_index.add, int(phash, 16), cache_key)
+            except sqlite3.Error:
+                pass
+    
+    async def _process_uncached(
+        self, 
+        file_content: bytes, 
+        filename: str, 
+        content_type: str, 
+        file_id: str,
+        cache_key: Optional[str] = None
+    ) -> ProcessingResult:
+        try:
+            file_info = self.file_processor.get_file_info(
+                filename, content_type, len(file_content)
+            )
+            
+            text_content, base64_images = await self._prepare(file_content, content_type, file_info)
+            if cache_key is not None:
+                result = await self._near_duplicate(file_id, filename, file_info, cache_key)
+                if result is not None:
+                    return result
+            
+            if base64_images is not None:
+                analysis, model_tier = await self.router.analyze_image(
+                    base64_images, text=text_content or "", **self._vision_input(file_info)
+                )
             else:
-                raise Exception(f"Unsupported file type: {content_type}")
+                analysis, model_tier = await self.router.analyze_text(text_content)
             
-            category = self._map_category(analysis.get("category", "other"))
-            confidence = float(analysis.get("confidence", 0.0))
-            extracted_content = analysis.get("extracted_content", {})
+            return self._build_result(file_id, filename, file_info, analysis, model_tier)
             
-            extracted_content["file_info"] = file_info
+        except Exception as e:
+            return self._error_result(file_id, filename, e)
+    
+    async def _prepare(
+        self, 
+        file_content: bytes, 
+        content_type: str, 
+        file_info: Dict[str, Any]
+    ) -> Tuple[Optional[str], Optional[List[str]]]:
+        if file_info["is_image"]:
+            with metrics.stage("preprocess"):
+                base64_images, image_info, error = await self.preprocess_pool.run(
+                    FileProcessor.process_image, file_content, content_type
+                )
+            if error:
+                raise Exception(error)
+            file_info["image"] = image_info
+            return None, base64_images
             
-            return ProcessingResult(
-                file_id=file_id,
-                filename=filename,
-                category=category,
-                confidence=confidence,
-                extracted_content=extracted_content,
-                processing_time=0.0
-            )
+        elif file_info["is_pdf"]:
+            with metrics.stage("preprocess"):
+                text_content, pdf_info, error = await self._extract_pdf(file_content)
+            if error:
+                raise Exception(error)
+            file_info["pdf"] = pdf_info
+            
+            # Mostly-text PDFs stay on the text path; a scanned signature page
+            # is not worth sending the whole document to the vision model.
+            textless_pages = pdf_info.get("textless_pages", [])
+            base64_images = None
+            if settings.PDF_RASTERIZE and textless_pages and (
+                not text_content
+                or len(textless_pages) >= settings.PDF_RASTER_MIN_TEXTLESS_FRACTION * pdf_info["pages_extracted"]
+            ):
+                with metrics.stage("rasterize"):
+                    base64_images, raster_info, error = await self.preprocess_pool.run(
+                        FileProcessor.rasterize_pdf_pages, file_content, textless_pages
+                    )
+                if error and not text_content:
+                    raise Exception(error)
+                pdf_info["raster"] = {"error": error} if error else raster_info
+                base64_images = base64_images or None
+                if base64_images is not None:
+                    # The text layer rides along in the image prompt, which has
+                    # no chunked long-document path.
+                    text_content = text_content[:settings.LONG_DOCUMENT_TOKENS * settings.CHARS_PER_TOKEN]
             
+            # Nothing to read and nothing to look at: no model call can help.
+            if not text_content and base64_images is None:
+                raise Exception("PDF has no extractable text")
+            return text_content, base64_images
+            
+        else:
+            raise Exception(f"Unsupported file type: {content_type}")
+    
+    def _vision_input(self, file_info: Dict[str, Any]) -> Dict[str, Any]:
+        # Scanned PDFs are sized by their first rendered page.
+        raster = file_info.get("pdf", {}).get("raster")
+        if raster:
+            width, height = raster["original_size"]
+            return {"width": width, "height": height, "pdf_pages": raster["pages"]}
+        width, height = file_info["image"]["original_size"]
+        return {"width": width, "height": height}
+    
+    def _build_result(
+        self, 
+        file_id: str, 
+        filename: str, 
+        file_info: Dict[str, Any], 
+        analysis: Dict[str, Any], 
+        model_tier: str
+    ) -> ProcessingResult:
+        category = self._map_category(analysis.get("category", "other"))
+        confidence = float(analysis.get("confidence", 0.0))
+        extracted_content = analysis.get("extracted_content")
+        extracted_content = ExtractedContent.model_validate(
+            extracted_content if isinstance(extracted_content, dict) else {}
+        )
+        extracted_content.file_info = file_info
+        
+        return ProcessingResult(
+            file_id=file_id,
+            filename=filename,
+            category=category,
+            confidence=confidence,
+            extracted_content=extracted_content,
+            processing_time=0.0,
+            model_tier=model_tier
+        )
+    
+    def _error_result(self, file_id: str, filename: str, error: Exception) -> ProcessingResult:
+        return ProcessingResult(
+            file_id=file_id,
+            filename=filename,
+            category=DocumentCategory.OTHER,
+            confidence=0.0,
+            extracted_content={"error_details": str(error)},
+            processing_time=0.0,
+            error=str(error)
+        )
+    
+    async def _extract_pdf(self, file_content: bytes) -> Tuple[str, dict, Optional[str]]:
+        max_chars = self._pdf_char_budget()
+        try:
+            page_count = await self.preprocess_pool.run(FileProcessor.count_pdf_pages, file_content)
         except Exception as e:
-            return ProcessingResult(
-                file_id=file_id,
-                filename=filename,
-                category=DocumentCategory.OTHER,
-                confidence=0.0,
-                extracted_content={"error_details": str(e)},
-                processing_time=0.0,
-                error=str(e)
-            )
+            return "", {}, f"Error processing PDF: {str(e)}"
+        
+        if page_count < settings.PDF_PARALLEL_MIN_PAGES or self.preprocess_pool.workers < 2:
+            return await self.preprocess_pool.run(FileProcessor.process_pdf, file_content, max_chars)
+        
+        start_time = time.perf_counter()
+        step = settings.PDF_PAGES_PER_TASK
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        
+        pages = []
+        total_chars = 0
+        try:
+            for window_start in range(0, len(ranges), self.preprocess_pool.workers):
+                window = ranges[window_start:window_start + self.preprocess_pool.workers]
+                remaining = max_chars - total_chars if max_chars else 0
+                results = await asyncio.gather(*[
+                    self.preprocess_pool.run(
+                        FileProcessor.extract_pdf_pages, file_content, start, stop, remaining
+                    )
+                    for start, stop in window
+                ])
+                for range_pages in results:
+                    pages.extend(range_pages)
+                    total_chars += sum(page["chars"] + 1 for page in range_pages)
+                if max_chars and total_chars >= max_chars:
+                    break
+        except Exception as e:
+            return "", {}, f"Error processing PDF: {str(e)}"
+        
+        text_content, pdf_info = FileProcessor.assemble_pdf_text(pages, page_count, max_chars)
+        pdf_info["extraction_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+        return text_content, pdf_info, None
+    
+    def _pdf_char_budget(self) -> int:
+        budgets = [settings.PDF_MAX_CHARS]
+        if settings.PDF_MAX_TOKENS:
+            budgets.append(settings.PDF_MAX_TOKENS * settings.CHARS_PER_TOKEN)
+        budgets = [budget for budget in budgets if budget > 0]
+        return min(budgets) if budgets else 0
     
     def _map_category(self, category_str: str) -> DocumentCategory:
         category_mapping = {
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import orjson
+
+from config import settings
+from shared_state import ForkSafeConnection
+
+PHONE, EMAIL, DOMAIN, COMPANY, AMOUNT = "phone", "email", "domain", "company", "amount"
+KINDS = (PHONE, EMAIL, DOMAIN, COMPANY, AMOUNT)
+
+# key_entities group -> entity kind
+ENTITY_FIELDS = {
+    "phone_numbers": PHONE,
+    "email_addresses": EMAIL,
+    "urls": DOMAIN,
+    "company_names": COMPANY,
+    "amounts": AMOUNT
+}
+
+# Email domains shared by unrelated people link nothing, so they are not
+# indexed as domains (the full address still is).
+FREE_MAIL_DOMAINS = {
+    "gmail.com", "googlemail.com", "yahoo.com", "hotmail.com", "outlook.com", "live.com",
+    "icloud.com", "me.com", "aol.com", "proton.me", "protonmail.com", "gmx.com", "mail.ru",
+    "yandex.ru", "qq.com", "163.com"
+}
+
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR", "₽": "RUB", "₿": "BTC"}
+CURRENCY_CODE = re.compile(r"\b([A-Z]{3,4})\b")
+# Active ISO 4217 codes plus the crypto tickers scams quote amounts in;
+# other capitalised words next to an amount ("VAT", "DUE", "INV") are not currencies.
+CURRENCY_CODES = frozenset("""
+    AED AFN ALL AMD ANG AOA ARS AUD AWG AZN BAM BBD BDT BGN BHD BIF BMD BND BOB BRL BSD BTN BWP
+    BYN BZD CAD CDF CHF CLP CNY COP CRC CUP CVE CZK DJF DKK DOP DZD EGP ERN ETB EUR FJD FKP GBP
+    GEL GHS GIP GMD GNF GTQ GYD HKD HNL HTG HUF IDR ILS INR IQD IRR ISK JMD JOD JPY KES KGS KHR
+    KMF KPW KRW KWD KYD KZT LAK LBP LKR LRD LSL LYD MAD MDL MGA MKD MMK MNT MOP MRU MUR MVR MWK
+    MXN MYR MZN NAD NGN NIO NOK NPR NZD OMR PAB PEN PGK PHP PKR PLN PYG QAR RON RSD RUB RWF SAR
+    SBD SCR SDG SEK SGD SHP SLE SOS SRD SSP STN SVC SYP SZL THB TJS TMT TND TOP TRY TTD TWD TZS
+    UAH UGX USD UYU UZS VES VND VUV WST XAF XCD XOF XPF YER ZAR ZMW ZWL
+    BTC ETH USDT USDC XMR LTC
+""".split())
+NUMBER = re.compile(r"\d(?:[\d.,' ]*\d)?")
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+PHONE_EXTENSION = re.compile(r"\s*(?:ext|x)\.?\s*\d+\s*$", re.IGNORECASE)
+
+COMPANY_SUFFIXES = {
+    "ltd", "limited", "llc", "llp", "lp", "inc", "incorporated", "corp", "corporation",
+    "co", "company", "plc", "gmbh", "ag", "sa", "srl", "bv", "pty"
+}
+
+INSERT_BATCH = 10000
+
+
+def normalize_phone(value: str) -> Optional[str]:
+    # E.164 when the country is known: "+44 (0)73 7761-8918", "0044 7377 618918"
+    # and "07377 618918" (with ENTITY_DEFAULT_COUNTRY_CODE=44) all become
+    # +447377618918. Numbers without a country code are otherwise kept as digits.
+    value = PHONE_EXTENSION.sub("", value.replace("(0)", "")).strip()
+    digits = re.sub(r"\D", "", value)
+    if value.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif settings.ENTITY_DEFAULT_COUNTRY_CODE:
+        digits = settings.ENTITY_DEFAULT_COUNTRY_CODE + (digits[1:] if digits.startswith("0") else digits)
+    else:
+        return digits if 7 <= len(digits) <= 15 else None
+    return "+" + digits if 8 <= len(digits) <= 15 else None
+
+
+def normalize_email(value: str) -> Optional[str]:
+    value = value.strip().strip("<>").lower()
+    if value.startswith("mailto:"):
+        value = value[len("mailto:"):]
+    return value if EMAIL_PATTERN.match(value) else None
+
+
+def normalize_domain(value: str) -> Optional[str]:
+    # Host of a URL or bare domain, lowercased, without "www." and in
+    # punycode so look-alike Unicode domains stay distinct and matchable.
+    value = value.strip().lower()
+    if "://" not in value:
+        value = "//" + value
+    try:
+        host = urlsplit(value).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    host = host.rstrip(".")
+    if host.startswith("www."):
+        host = host[len("www."):]
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        pass
+    return host if "." in host else None
+
+
+def normalize_company(value: str) -> Optional[str]:
+    words = re.sub(r"[^\w]+", " ", value.casefold()).split()
+    while len(words) > 1 and words[-1] in COMPANY_SUFFIXES:
+        words.pop()
+    return " ".join(words) or None
+
+
+def _parse_number(raw: str) -> Decimal:
+    raw = raw.replace(" ", "").replace("'", "")
+    last_dot, last_comma = raw.rfind("."), raw.rfind(",")
+    if last_dot >= 0 and last_comma >= 0:
+        decimal_separator = "." if last_dot > last_comma else ","
+    elif last_dot >= 0 or last_comma >= 0:
+        separator = "." if last_dot >= 0 else ","
+        head, _, tail = raw.rpartition(separator)
+        # "1,500", "1.500" and "1,000,000" group thousands; "0.500" and "12,50" are decimals.
+        grouped = raw.count(separator) > 1 or (len(tail) == 3 and head.strip("0"))
+        decimal_separator = None if grouped else separator
+    else:
+        decimal_separator = None
+    for separator in ".,":
+        if separator != decimal_separator:
+            raw = raw.replace(separator, "")
+    if decimal_separator:
+        raw = raw.replace(decimal_separator, ".")
+    return Decimal(raw)
+
+
+def normalize_amount(value: str) -> Optional[str]:
+    # "$1,500.00", "USD 1500" and "1.500 $" all become "USD 1500".
+    match = NUMBER.search(value)
+    if match is None:
+        return None
+    try:
+        number = _parse_number(match.group())
+    except InvalidOperation:
+        return None
+    amount = format(number.normalize(), "f")
+
+    currency = next((code for symbol, code in CURRENCY_SYMBOLS.items() if symbol in value), None)
+    if currency is None:
+        currency = next(
+            (code for code in CURRENCY_CODE.findall(value) if code in CURRENCY_CODES), None
+        )
+    return f"{currency} {amount}" if currency else amount
+
+
+NORMALIZERS = {
+    PHONE: normalize_phone,
+    EMAIL: normalize_email,
+    DOMAIN: normalize_domain,
+    COMPANY: normalize_company,
+    AMOUNT: normalize_amount
+}
+
+
+def normalize(kind: str, value: str) -> Optional[str]:
+    return NORMALIZERS[kind](value)
+
+
+def extract_entities(key_entities: Dict[str, Any]) -> Set[Tuple[str, str]]:
+    entities = set()
+    for field, kind in ENTITY_FIELDS.items():
+        values = key_entities.get(field) or []
+        if isinstance(values, str):
+            values = [values]
+        for value in values:
+            if not isinstance(value, str):
+                continue
+            normalized = normalize(kind, value)
+            if normalized is None:
+                continue
+            entities.add((kind, normalized))
+            if kind == EMAIL:
+                domain = normalize_domain(normalized.rsplit("@", 1)[1])
+                if domain and domain not in FREE_MAIL_DOMAINS:
+                    entities.add((DOMAIN, domain))
+    return entities
+
+
+def result_entities(result: Dict[str, Any]) -> Optional[Tuple[str, str, str, Set[Tuple[str, str]]]]:
+    # Near-duplicates carry the matched document's entities, not their own.
+    if result.get("error") or result.get("near_duplicate") or not result.get("file_id"):
+        return None
+    key_entities = (result.get("extracted_content") or {}).get("key_entities") or {}
+    return (
+        result["file_id"],
+        result.get("filename") or "",
+        result.get("category") or "other",
+        extract_entities(key_entities)
+    )
+
+
+class EntityIndex:
+    # Postings are keyed (kind, value, doc) in a WITHOUT ROWID table, so a
+    # lookup is one B-tree range scan whatever the index size. doc is the
+    # integer row of entity_documents, newest highest, which keeps postings
+    # small and lets queries return the most recent documents first.
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.connection = ForkSafeConnection(
+            db_path if db_path is not None else settings.ENTITY_INDEX_DB_PATH, self._create_tables
+        )
+        self._lock = self.connection.lock
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entity_documents ("
+            "doc INTEGER PRIMARY KEY, file_id TEXT NOT NULL UNIQUE, filename TEXT NOT NULL, "
+            "category TEXT NOT NULL, indexed_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entity_postings ("
+            "kind TEXT NOT NULL, value TEXT NOT NULL, doc INTEGER NOT NULL, "
+            "PRIMARY KEY (kind, value, doc)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entity_postings_doc ON entity_postings (doc)")
+
+    def add(self, file_id: str, filename: str, category: str, key_entities: Dict[str, Any]):
+        # Re-adding a file_id replaces its previous entities.
+        entities = extract_entities(key_entities)
+        with self._lock:
+            conn = self.connection.get()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT doc FROM entity_documents WHERE file_id = ?", (file_id,)).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM entity_postings WHERE doc = ?", row)
+                    conn.execute("DELETE FROM entity_documents WHERE doc = ?", row)
+                if entities:
+                    doc = conn.execute(
+                        "INSERT INTO entity_documents (file_id, filename, category, indexed_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (file_id, filename, category, time.time())
+                    ).lastrowid
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO entity_postings (kind, value, doc) VALUES (?, ?, ?)",
+                        [(kind, value, doc) for kind, value in entities]
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def search(self, kind: str, value: str, limit: int) -> Optional[Dict[str, Any]]:
+        # None when the value does not normalize to anything indexable.
+        normalized = normalize(kind, value)
+        if normalized is None:
+            return None
+        with self._lock:
+            rows = self.connection.get().execute(
+                "SELECT d.file_id, d.filename, d.category, d.indexed_at "
+                "FROM entity_postings p JOIN entity_documents d ON d.doc = p.doc "
+                "WHERE p.kind = ? AND p.value = ? ORDER BY p.doc DESC LIMIT ?",
+                (kind, normalized, limit + 1)
+            ).fetchall()
+        return {
+            "kind": kind,
+            "value": normalized,
+            "documents": [self._document(row) for row in rows[:limit]],
+            "truncated": len(rows) > limit
+        }
+
+    def related(self, file_id: str, limit: int) -> Optional[Dict[str, Any]]:
+        # Documents sharing at least one entity with file_id, most shared
+        # entities first. Each entity contributes at most `limit` documents,
+        # so one very common value (a round amount) cannot dominate the cost.
+        with self._lock:
+            conn = self.connection.get()
+            row = conn.execute("SELECT doc FROM entity_documents WHERE file_id = ?", (file_id,)).fetchone()
+            if row is None:
+                return None
+            doc = row[0]
+            entities = conn.execute(
+                "SELECT kind, value FROM entity_postings WHERE doc = ? ORDER BY kind, value", (doc,)
+            ).fetchall()
+
+            shared: Dict[int, List[Dict[str, str]]] = {}
+            for kind, value in entities:
+                for (other,) in conn.execute(
+                    "SELECT doc FROM entity_postings WHERE kind = ? AND value = ? AND doc != ? "
+                    "ORDER BY doc DESC LIMIT ?",
+                    (kind, value, doc, limit)
+                ):
+                    shared.setdefault(other, []).append({"kind": kind, "value": value})
+
+            ranked = sorted(shared, key=lambda other: (len(shared[other]), other), reverse=True)[:limit]
+            documents = {}
+            if ranked:
+                placeholders = ",".join("?" * len(ranked))
+                for row in conn.execute(
+                    f"SELECT doc, file_id, filename, category, indexed_at FROM entity_documents "
+                    f"WHERE doc IN ({placeholders})",
+                    ranked
+                ):
+                    documents[row[0]] = self._document(row[1:])
+
+        return {
+            "file_id": file_id,
+            "entities": [{"kind": kind, "value": value} for kind, value in entities],
+            "documents": [
+                dict(documents[other], shared_entities=shared[other])
+                for other in ranked if other in documents
+            ]
+        }
+
+    @staticmethod
+    def _document(row: Tuple[str, str, str, float]) -> Dict[str, Any]:
+        file_id, filename, category, indexed_at = row
+        return {"file_id": file_id, "filename": filename, "category": category, "indexed_at": indexed_at}
+
+    def rebuild(self, documents: Iterable[Tuple[str, str, str, Set[Tuple[str, str]]]]) -> Tuple[int, int]:
+        # Replaces the whole index. Everything is staged unsorted into temp
+        # tables, outside the write lock while the documents are parsed, then
+        # copied over in key order with the doc index built last, which is
+        # far cheaper than random inserts into every B-tree. Only the copy
+        # holds the write lock; documents that serving workers add meanwhile
+        # are carried over and, being newest, win over older results for the
+        # same file_id. Readers keep seeing the old index until it commits.
+        started_at = time.time()
+        conn = self.connection.get()
+        with self._lock:
+            conn.execute("DROP TABLE IF EXISTS temp.entity_staged_documents")
+            conn.execute("DROP TABLE IF EXISTS temp.entity_staged_postings")
+            conn.execute(
+                "CREATE TEMP TABLE entity_staged_documents ("
+                "doc INTEGER PRIMARY KEY, file_id TEXT, filename TEXT, category TEXT)"
+            )
+            conn.execute("CREATE TEMP TABLE entity_staged_postings (kind TEXT, value TEXT, doc INTEGER)")
+
+        staged_documents, staged_postings = [], []
+        last_doc = 0
+        for last_doc, (file_id, filename, category, entities) in enumerate(documents, 1):
+            if not entities:
+                continue
+            staged_documents.append((last_doc, file_id, filename, category))
+            staged_postings.extend((kind, value, last_doc) for kind, value in entities)
+            if len(staged_postings) >= INSERT_BATCH:
+                self._stage(conn, staged_documents, staged_postings)
+                staged_documents, staged_postings = [], []
+        self._stage(conn, staged_documents, staged_postings)
+
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO entity_staged_documents (doc, file_id, filename, category) "
+                    "SELECT doc + ?, file_id, filename, category FROM entity_documents WHERE indexed_at >= ?",
+                    (last_doc, started_at)
+                )
+                conn.execute(
+                    "INSERT INTO entity_staged_postings (kind, value, doc) "
+                    "SELECT p.kind, p.value, p.doc + ? FROM entity_postings p "
+                    "JOIN entity_documents d ON d.doc = p.doc WHERE d.indexed_at >= ?",
+                    (last_doc, started_at)
+                )
+                conn.execute("DROP TABLE IF EXISTS entity_postings")
+                conn.execute("DROP TABLE IF EXISTS entity_documents")
+                self._create_tables(conn)
+                conn.execute("DROP INDEX idx_entity_postings_doc")
+                # A later result for the same file_id wins.
+                conn.execute(
+                    "INSERT INTO entity_documents (doc, file_id, filename, category, indexed_at) "
+                    "SELECT doc, file_id, filename, category, ? FROM entity_staged_documents "
+                    "WHERE doc IN (SELECT MAX(doc) FROM entity_staged_documents GROUP BY file_id)",
+                    (time.time(),)
+                )
+                conn.execute(
+                    "INSERT INTO entity_postings (kind, value, doc) "
+                    "SELECT kind, value, doc FROM entity_staged_postings "
+                    "WHERE doc IN (SELECT doc FROM entity_documents) ORDER BY kind, value, doc"
+                )
+                conn.execute("CREATE INDEX idx_entity_postings_doc ON entity_postings (doc)")
+                conn.execute("DROP TABLE entity_staged_documents")
+                conn.execute("DROP TABLE entity_staged_postings")
+                counts = conn.execute(
+                    "SELECT (SELECT COUNT(*) FROM entity_documents), (SELECT COUNT(*) FROM entity_postings)"
+                ).fetchone()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return counts
+
+    def _stage(self, conn: sqlite3.Connection, documents: List[tuple], postings: List[tuple]):
+        # Only temp tables are written, so this takes no lock on the index file.
+        with self._lock:
+            conn.execute("BEGIN")
+            try:
+                conn.executemany("INSERT INTO entity_staged_documents VALUES (?, ?, ?, ?)", documents)
+                conn.executemany("INSERT INTO entity_staged_postings VALUES (?, ?, ?)", postings)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        self.connection.close()
+
+
+def iter_result_files(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        if is_results_store(path):
+            yield path
+        elif os.path.isdir(path):
+            for pattern in ("*.json", "*.jsonl", "*.db"):
+                yield from sorted(glob.glob(os.path.join(path, "**", pattern), recursive=True))
+        else:
+            yield path
+
+
+def is_results_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, "index.db")) and bool(glob.glob(os.path.join(path, "segment-*")))
+
+
+def load_results(path: str) -> List[Tuple[str, str, str, Set[Tuple[str, str]]]]:
+    # One stored-result source: a ProcessingResult (or a list of them) as
+    # .json, one per line as .jsonl (bulk_process.py shards), the results
+    # column of a job database, or a results store directory.
+    if is_results_store(path):
+        from results_store import ResultsStore
+
+        store = ResultsStore(path)
+        try:
+            results = (result for _, _, result in store.iter_records(latest_only=True))
+            return [entry for entry in map(result_entities, results) if entry]
+        finally:
+            store.close()
+
+    if path.endswith(".db"):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            results = (orjson.loads(row[0]) for row in conn.execute(
+                "SELECT result FROM jobs WHERE result IS NOT NULL ORDER BY finished_at"
+            ))
+            return [entry for entry in map(result_entities, results) if entry]
+        except sqlite3.OperationalError:
+            return []
+        finally:
+            conn.close()
+
+    with open(path, "rb") as handle:
+        if path.endswith(".jsonl"):
+            results = []
+            for line in handle:
+                try:
+                    results.append(orjson.loads(line))
+                except ValueError:
+                    continue
+        else:
+            loaded = orjson.loads(handle.read())
+            results = loaded if isinstance(loaded, list) else [loaded]
+    return [entry for entry in map(result_entities, results) if entry]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild the entity index from stored results: .json/.jsonl files, "
+                    "directories of them, a job database or a results store directory"
+    )
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--db", default=settings.ENTITY_INDEX_DB_PATH, help="index database (default: ENTITY_INDEX_DB_PATH)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes parsing result files")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    files = list(iter_result_files(args.paths))
+    index = EntityIndex(args.db)
+    # Files are parsed in parallel but indexed in the order given, so the
+    # newest results stay the newest documents.
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        documents = (entry for entries in pool.map(load_results, files) for entry in entries)
+        document_count, posting_count = index.rebuild(documents)
+    index.close()
+    print(
+        f"Indexed {document_count} documents, {posting_count} postings from {len(files)} files "
+        f"in {time.perf_counter() - start_time:.1f}s",
+        file=sys.stderr
+    )
+
+
+if __name__ == "__main__":
+    main()
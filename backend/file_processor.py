@@ -1,52 +1,359 @@
 import base64
 import io
-from PIL import Image
-import PyPDF2
-from typing import Tuple, Optional
+import math
+import threading
+import time
+from PIL import Image, ImageChops, ImageStat
+from typing import List, Tuple, Optional
+from config import settings
+from perceptual_index import dhash
+
+VISION_TOKEN_PIXELS = 750
+REDUCING_GAP = 2.0
+TILE_OVERLAP = 0.04
+AUTOCROP_TOLERANCE = 16
+AUTOCROP_PADDING = 0.02
+GRAYSCALE_MAX_SATURATION = 20
+RASTER_THUMBNAIL_EDGE = 128
+RASTER_BLANK_STDDEV = 8
+
+# pdfium is not thread-safe; in a process pool each worker has its own copy.
+_pdfium_lock = threading.Lock()
 
 
 class FileProcessor:
     
     @staticmethod
-    def process_image(file_content: bytes, content_type: str) -> Tuple[str, Optional[str]]:
+    def process_image(file_content: bytes, content_type: str) -> Tuple[List[str], dict, Optional[str]]:
         try:
             image = Image.open(io.BytesIO(file_content))
+            original_size = image.size
+            
+            tile_count = FileProcessor._plan_tiles(image.size)
+            image = FileProcessor._decode_reduced(
+                image, FileProcessor._budget_scale(image.size, tile_count)
+            )
+            image = FileProcessor._flatten(image)
+            
+            crop_box = None
+            if settings.IMAGE_AUTOCROP:
+                image, crop_box = FileProcessor._autocrop(image)
+            phash = dhash(image)
+            
+            grayscale = settings.IMAGE_AUTO_GRAYSCALE and FileProcessor._is_text_only(image)
+            if grayscale:
+                image = image.convert('L')
             
-            if image.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'P':
-                    image = image.convert('RGBA')
-                background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
+            tile_count = FileProcessor._plan_tiles(image.size)
+            scale = FileProcessor._budget_scale(image.size, tile_count)
+            if scale < 1.0:
+                image = image.resize(
+                    (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                    Image.Resampling.LANCZOS
+                )
+            tiles = FileProcessor._split_tiles(image, tile_count)
             
-            max_size = (1024, 1024)
-            image.thumbnail(max_size, Image.Resampling.LANCZOS)
+            encoded, quality, within_budget = FileProcessor._encode_within_budget(tiles)
+            base64_images = [base64.b64encode(data).decode("ascii") for data in encoded]
             
-            buffered = io.BytesIO()
-            image.save(buffered, format="JPEG", quality=85)
+            image_info = {
+                "original_size": list(original_size),
+                "crop_box": list(crop_box) if crop_box else None,
+                "phash": f"{phash:016x}",
+                "grayscale": grayscale,
+                "tiles": len(base64_images),
+                "tile_sizes": [list(tile.size) for tile in tiles],
+                "jpeg_quality": quality,
+                "vision_tokens": sum(
+                    math.ceil(tile.width * tile.height / VISION_TOKEN_PIXELS) for tile in tiles
+                ),
+                "image_bytes": sum(len(data) for data in encoded),
+                "over_budget": not within_budget,
+                "payload_bytes": sum(len(data) for data in base64_images)
+            }
+            
+            return base64_images, image_info, None
+            
+        except Exception as e:
+            return [], {}, f"Error processing image: {str(e)}"
+    
+    @staticmethod
+    def _plan_tiles(size: Tuple[int, int]) -> int:
+        width, height = size
+        aspect_ratio = height / max(width, 1)
+        if aspect_ratio <= settings.IMAGE_TILE_ASPECT:
+            return 1
+        return min(settings.IMAGE_MAX_TILES, math.ceil(aspect_ratio / settings.IMAGE_TILE_ASPECT))
+    
+    @staticmethod
+    def _budget_scale(size: Tuple[int, int], tile_count: int) -> float:
+        width, height = size
+        overlap = 1 + TILE_OVERLAP if tile_count > 1 else 1
+        token_scale = math.sqrt(
+            settings.IMAGE_TOKEN_BUDGET * VISION_TOKEN_PIXELS / max(width * height * overlap, 1)
+        )
+        edge_scale = settings.IMAGE_MAX_EDGE / max(width, height / tile_count, 1)
+        return min(token_scale, edge_scale, 1.0)
+    
+    @staticmethod
+    def _decode_reduced(image: Image.Image, scale: float) -> Image.Image:
+        # Shrink by an integer factor while decoding (JPEG draft mode) or right
+        # after it (reduce), leaving at least REDUCING_GAP x the target size for
+        # the final LANCZOS pass, so conversion and alpha compositing never
+        # touch the full-resolution image.
+        factor = int(1 / (scale * REDUCING_GAP))
+        
+        if image.format == 'JPEG':
+            if factor > 1:
+                image.draft('RGB', (image.width // factor, image.height // factor))
+            return image
+        
+        if image.mode == 'P':
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        elif image.mode not in ('RGB', 'RGBA', 'LA', 'L'):
+            image = image.convert('RGB')
+        
+        if factor > 1:
+            image = image.reduce(factor)
+        return image
+    
+    @staticmethod
+    def _flatten(image: Image.Image) -> Image.Image:
+        if image.mode in ('RGBA', 'LA'):
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        if image.mode != 'RGB':
+            return image.convert('RGB')
+        return image
+    
+    @staticmethod
+    def _autocrop(image: Image.Image) -> Tuple[Image.Image, Optional[Tuple[int, int, int, int]]]:
+        width, height = image.size
+        corners = [
+            image.getpixel((0, 0)),
+            image.getpixel((width - 1, 0)),
+            image.getpixel((0, height - 1)),
+            image.getpixel((width - 1, height - 1))
+        ]
+        border = max(set(corners), key=corners.count)
+        
+        difference = ImageChops.difference(image, Image.new(image.mode, image.size, border))
+        mask = difference.convert('L').point(lambda value: 255 if value > AUTOCROP_TOLERANCE else 0)
+        bbox = mask.getbbox()
+        if bbox is None:
+            return image, None
+        
+        pad_x = int(width * AUTOCROP_PADDING)
+        pad_y = int(height * AUTOCROP_PADDING)
+        left, top, right, bottom = bbox
+        bbox = (
+            max(left - pad_x, 0),
+            max(top - pad_y, 0),
+            min(right + pad_x, width),
+            min(bottom + pad_y, height)
+        )
+        cropped_area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+        if cropped_area > 0.95 * width * height:
+            return image, None
+        return image.crop(bbox), bbox
+    
+    @staticmethod
+    def _is_text_only(image: Image.Image) -> bool:
+        sample = image.copy()
+        sample.thumbnail((64, 64))
+        saturation = ImageStat.Stat(sample.convert('HSV').getchannel('S')).mean[0]
+        return saturation <= GRAYSCALE_MAX_SATURATION
+    
+    @staticmethod
+    def _split_tiles(image: Image.Image, tile_count: int) -> List[Image.Image]:
+        if tile_count <= 1:
+            return [image]
+        
+        tile_height = math.ceil(image.height / tile_count)
+        overlap = int(tile_height * TILE_OVERLAP)
+        tiles = []
+        for index in range(tile_count):
+            top = max(index * tile_height - overlap, 0)
+            bottom = min((index + 1) * tile_height, image.height)
+            tiles.append(image.crop((0, top, image.width, bottom)))
+        return tiles
+    
+    @staticmethod
+    def _encode_within_budget(tiles: List[Image.Image]) -> Tuple[List[bytes], int, bool]:
+        # Returns the encoded tiles, their quality and whether they fit the
+        # budget; tiles are shrunk in place, so they always match the bytes.
+        qualities = settings.IMAGE_JPEG_QUALITIES
+        attempts = 4
+        for attempt in range(attempts):
+            for quality in qualities:
+                encoded = []
+                for tile in tiles:
+                    buffered = io.BytesIO()
+                    tile.save(buffered, format="JPEG", quality=quality)
+                    encoded.append(buffered.getvalue())
+                if sum(len(data) for data in encoded) <= settings.IMAGE_BYTE_BUDGET:
+                    return encoded, quality, True
+            if attempt == attempts - 1:
+                break
             
-            base64_image = base64.b64encode(buffered.getvalue()).decode()
+            tiles[:] = [
+                tile.resize(
+                    (max(1, int(tile.width * 0.75)), max(1, int(tile.height * 0.75))),
+                    Image.Resampling.LANCZOS
+                )
+                for tile in tiles
+            ]
+        return encoded, qualities[-1], False
+    
+    @staticmethod
+    def process_pdf(file_content: bytes, max_chars: int = 0) -> Tuple[str, dict, Optional[str]]:
+        try:
+            start_time = time.perf_counter()
+            page_count = FileProcessor.count_pdf_pages(file_content)
+            pages = FileProcessor.extract_pdf_pages(file_content, 0, page_count, max_chars)
+            text_content, pdf_info = FileProcessor.assemble_pdf_text(pages, page_count, max_chars)
+            pdf_info["extraction_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
             
-            return base64_image, None
+            return text_content, pdf_info, None
             
         except Exception as e:
-            return "", f"Error processing image: {str(e)}"
+            return "", {}, f"Error processing PDF: {str(e)}"
     
     @staticmethod
-    def process_pdf(file_content: bytes) -> Tuple[str, Optional[str]]:
+    def count_pdf_pages(file_content: bytes) -> int:
+        # PyPDF2 is imported on first use; image-only paths and tools that
+        # only need the image helpers never load it.
+        import PyPDF2
+        return len(PyPDF2.PdfReader(io.BytesIO(file_content)).pages)
+    
+    @staticmethod
+    def extract_pdf_pages(file_content: bytes, start: int, stop: int, max_chars: int = 0) -> List[dict]:
+        import PyPDF2
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
+        
+        pages = []
+        total_chars = 0
+        for page_number in range(start, min(stop, len(pdf_reader.pages))):
+            page_start = time.perf_counter()
+            text = pdf_reader.pages[page_number].extract_text() or ""
+            pages.append({
+                "page": page_number,
+                "text": text,
+                "chars": len(text),
+                # Scanned pages yield nothing, or a few stray glyphs.
+                "textless": len(text.strip()) < settings.PDF_MIN_PAGE_CHARS,
+                "ms": round((time.perf_counter() - page_start) * 1000, 2)
+            })
+            
+            total_chars += len(text) + 1
+            if max_chars and total_chars >= max_chars:
+                break
+        
+        return pages
+    
+    @staticmethod
+    def assemble_pdf_text(pages: List[dict], page_count: int, max_chars: int = 0) -> Tuple[str, dict]:
+        pages = sorted(pages, key=lambda page: page["page"])
+        
+        parts = []
+        used_pages = []
+        total_chars = 0
+        truncated = False
+        for page in pages:
+            text = page["text"]
+            if max_chars and total_chars + len(text) > max_chars:
+                text = text[:max(max_chars - total_chars, 0)]
+                truncated = True
+            parts.append(text)
+            used_pages.append({
+                "page": page["page"], "chars": page["chars"], "textless": page["textless"], "ms": page["ms"]
+            })
+            total_chars += len(text) + 1
+            if truncated:
+                break
+        
+        if len(used_pages) < page_count:
+            truncated = True
+        
+        pdf_info = {
+            "page_count": page_count,
+            "pages_extracted": len(used_pages),
+            "chars_extracted": max(total_chars - 1, 0),
+            "truncated": truncated,
+            "textless_pages": [page["page"] for page in used_pages if page["textless"]],
+            "pages": used_pages
+        }
+        return "\n".join(parts).strip(), pdf_info
+    
+    @staticmethod
+    def rasterize_pdf_pages(file_content: bytes, page_numbers: List[int]) -> Tuple[List[str], dict, Optional[str]]:
+        # Renders the pages without extractable text for the vision path.
+        # Each candidate is first rendered as a small thumbnail and scored
+        # by contrast; blank pages are dropped and only the
+        # PDF_RASTER_MAX_PAGES most informative ones are rendered in full,
+        # at PDF_RASTER_DPI bounded by the per-image token budget.
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
+            import pypdfium2 as pdfium
+        except ImportError:
+            return [], {}, "Rendering scanned PDF pages requires pypdfium2"
+        
+        try:
+            start_time = time.perf_counter()
+            with _pdfium_lock:
+                pdf = pdfium.PdfDocument(file_content)
+                try:
+                    scores = {}
+                    for page_number in page_numbers[:settings.PDF_RASTER_SCAN_PAGES]:
+                        page = pdf[page_number]
+                        width, height = page.get_size()
+                        thumbnail = page.render(scale=RASTER_THUMBNAIL_EDGE / max(width, height, 1)).to_pil()
+                        stddev = ImageStat.Stat(thumbnail.convert('L')).stddev[0]
+                        if stddev >= RASTER_BLANK_STDDEV:
+                            scores[page_number] = stddev
+                    
+                    selected = sorted(sorted(scores, key=scores.get, reverse=True)[:settings.PDF_RASTER_MAX_PAGES])
+                    images = []
+                    for page_number in selected:
+                        page = pdf[page_number]
+                        width, height = page.get_size()
+                        scale = settings.PDF_RASTER_DPI / 72
+                        scale *= FileProcessor._budget_scale((width * scale, height * scale), 1)
+                        images.append(FileProcessor._flatten(page.render(scale=scale).to_pil()))
+                finally:
+                    pdf.close()
+            
+            scanned = min(len(page_numbers), settings.PDF_RASTER_SCAN_PAGES)
+            if not images:
+                return [], {"pages": [], "blank_pages": scanned}, None
             
-            text_content = ""
-            for page in pdf_reader.pages:
-                text_content += page.extract_text() + "\n"
+            # The routing heuristics see the page as rendered, not its cropped text block.
+            original_size = list(images[0].size)
+            if settings.IMAGE_AUTOCROP:
+                images = [FileProcessor._autocrop(image)[0] for image in images]
+            grayscale = settings.IMAGE_AUTO_GRAYSCALE and all(FileProcessor._is_text_only(image) for image in images)
+            if grayscale:
+                images = [image.convert('L') for image in images]
             
-            return text_content.strip(), None
+            encoded, quality, within_budget = FileProcessor._encode_within_budget(images)
+            raster_info = {
+                "pages": selected,
+                "original_size": original_size,
+                "blank_pages": scanned - len(scores),
+                "grayscale": grayscale,
+                "page_sizes": [list(image.size) for image in images],
+                "jpeg_quality": quality,
+                "vision_tokens": sum(
+                    math.ceil(image.width * image.height / VISION_TOKEN_PIXELS) for image in images
+                ),
+                "image_bytes": sum(len(data) for data in encoded),
+                "over_budget": not within_budget,
+                "raster_ms": round((time.perf_counter() - start_time) * 1000, 2)
+            }
+            return [base64.b64encode(data).decode("ascii") for data in encoded], raster_info, None
             
         except Exception as e:
-            return "", f"Error processing PDF: {str(e)}"
+            return [], {}, f"Error rasterizing PDF: {str(e)}"
     
     @staticmethod
     def get_file_info(filename: str, content_type: str, file_size: int) -> dict:
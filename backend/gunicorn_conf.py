@@ -0,0 +1,22 @@
+import multiprocessing
+
+from config import settings
+
+bind = f"0.0.0.0:{settings.BACKEND_PORT}"
+workers = settings.BACKEND_WORKERS or multiprocessing.cpu_count()
+worker_class = "uvicorn_worker.UvicornWorker"
+# Import the app (and build the processor, caches and perceptual index) once
+# in the master, so workers fork with it already loaded.
+preload_app = True
+graceful_timeout = settings.BACKEND_GRACEFUL_TIMEOUT
+# Requests can legitimately wait minutes on a rate-limited LLM; the heartbeat
+# only needs to catch hung workers.
+timeout = 300
+keepalive = 5
+
+
+def on_starting(server):
+    # Workers skip job recovery (JOB_RECOVER_ON_START=false); it runs here once.
+    from main import job_queue
+
+    job_queue.recover()
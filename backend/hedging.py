@@ -0,0 +1,39 @@
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from config import settings
+
+
+class LatencyTracker:
+    # Recent successful call latencies per model; the hedge fires once a call
+    # has run longer than HEDGE_PERCENTILE of them.
+
+    def __init__(self, window: Optional[int] = None):
+        self.window = window or settings.HEDGE_WINDOW
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float):
+        samples = self._samples.get(model)
+        if samples is None:
+            samples = self._samples[model] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, model: str, percentile: float) -> Optional[float]:
+        samples = self._samples.get(model)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        if not settings.HEDGE_ENABLED:
+            return None
+
+        samples = self._samples.get(model)
+        if samples is None or len(samples) < settings.HEDGE_MIN_SAMPLES:
+            return settings.HEDGE_DEFAULT_DELAY or None
+        return max(self.percentile(model, settings.HEDGE_PERCENTILE), settings.HEDGE_MIN_DELAY)
+
+
+def hedge_model(model: str) -> str:
+    return settings.HEDGE_MODELS.get(model, model)
@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.models import JobInfo, JobStatus, ProcessingResult
+from config import settings
+import llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = (JobStatus.COMPLETED.value, JobStatus.FAILED.value)
+
+JOB_COLUMNS = (
+    "job_id, status, filename, created_at, started_at, finished_at, "
+    "queue_depth_at_submit, seq, result, error"
+)
+
+
+class JobQueue:
+    def __init__(self, processor, path: Optional[str] = None, workers: Optional[int] = None):
+        self.processor = processor
+        self.path = path or settings.JOB_DB_PATH
+        self.workers = workers or settings.JOB_WORKERS
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._job_events: Dict[str, Set[asyncio.Event]] = {}
+        self._draining = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None, timeout=10
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "job_id TEXT UNIQUE NOT NULL, status TEXT NOT NULL, "
+                "filename TEXT NOT NULL, content_type TEXT NOT NULL, file_content BLOB, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+                "queue_depth_at_submit INTEGER NOT NULL DEFAULT 0, "
+                "result TEXT, error TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_seq ON jobs (status, seq)")
+        return self._conn
+
+    async def _db(self, fn, *args):
+        def run():
+            with self._lock:
+                return fn(self._connect(), *args)
+        return await asyncio.to_thread(run)
+
+    async def start(self):
+        # Under a multi-worker server the master recovers once before forking
+        # (see recover()); a worker doing it would requeue its siblings' jobs.
+        if settings.JOB_RECOVER_ON_START:
+            await self._db(self._recover)
+        self._draining = False
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{index}")
+            for index in range(self.workers)
+        ]
+
+    async def stop(self):
+        # Stop claiming, give running jobs JOB_DRAIN_SECONDS to finish, then
+        # cancel the rest; cancelled jobs go back on the queue.
+        self._draining = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._worker_tasks:
+            _, pending = await asyncio.wait(self._worker_tasks, timeout=settings.JOB_DRAIN_SECONDS)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def recover(self):
+        with self._lock:
+            self._recover(self._connect())
+            self._conn.close()
+            self._conn = None
+
+    def _recover(self, conn: sqlite3.Connection):
+        # Jobs left running by a previous process never finished; run them again.
+        conn.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+            (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+        )
+        if settings.JOB_RETENTION_SECONDS > 0:
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (*TERMINAL_STATUSES, time.time() - settings.JOB_RETENTION_SECONDS)
+            )
+
+    async def submit(self, file_content: bytes, filename: str, content_type: str) -> JobInfo:
+        job_id = str(uuid.uuid4())
+
+        def insert(conn: sqlite3.Connection):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                depth = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ?", (JobStatus.QUEUED.value,)
+                ).fetchone()[0]
+                conn.execute(
+                    "INSERT INTO jobs (job_id, status, filename, content_type, file_content, "
+                    "created_at, queue_depth_at_submit) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, JobStatus.QUEUED.value, filename, content_type,
+                     file_content, time.time(), depth)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        await self._db(insert)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> Optional[JobInfo]:
+        return await self._db(self._load, job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[JobInfo]:
+        deadline = time.monotonic() + timeout
+        job = await self.get(job_id)
+        while job is not None and job.status.value not in TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await self.wait_for_change(job_id, remaining)
+            job = await self.get(job_id)
+        return job
+
+    async def wait_for_change(self, job_id: str, timeout: float):
+        # Events only fire for jobs run by this process; polling covers the rest.
+        # Each waiter removes its own event, so jobs finished elsewhere leave nothing behind.
+        event = asyncio.Event()
+        events = self._job_events.setdefault(job_id, set())
+        events.add(event)
+        try:
+            await asyncio.wait_for(
+                event.wait(), timeout=min(timeout, settings.JOB_POLL_INTERVAL)
+            )
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            events.discard(event)
+            if not events and self._job_events.get(job_id) is events:
+                del self._job_events[job_id]
+
+    def _notify(self, job_id: str):
+        for event in self._job_events.pop(job_id, ()):
+            event.set()
+
+    def _load(self, conn: sqlite3.Connection, job_id: str) -> Optional[JobInfo]:
+        row = conn.execute(
+            f"SELECT {JOB_COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        (job_id, status, filename, created_at, started_at, finished_at,
+         queue_depth_at_submit, seq, result, error) = row
+        now = time.time()
+
+        queue_position = None
+        if status == JobStatus.QUEUED.value:
+            queue_position = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND seq < ?",
+                (JobStatus.QUEUED.value, seq)
+            ).fetchone()[0]
+
+        return JobInfo(
+            job_id=job_id,
+            status=JobStatus(status),
+            filename=filename,
+            created_at=created_at,
+            started_at=started_at,
+            finished_at=finished_at,
+            queue_depth_at_submit=queue_depth_at_submit,
+            queue_position=queue_position,
+            wait_time=(started_at or now) - created_at,
+            run_time=((finished_at or now) - started_at) if started_at else None,
+            result=ProcessingResult.model_validate_json(result) if result else None,
+            error=error
+        )
+
+    def _claim(self, conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT job_id, filename, content_type, file_content FROM jobs "
+                "WHERE status = ? ORDER BY seq LIMIT 1",
+                (JobStatus.QUEUED.value,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ? WHERE job_id = ?",
+                    (JobStatus.RUNNING.value, time.time(), row[0])
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        if row is None:
+            return None
+        job_id, filename, content_type, file_content = row
+        return {
+            "job_id": job_id,
+            "filename": filename,
+            "content_type": content_type,
+            "file_content": file_content
+        }
+
+    def _requeue(self, conn: sqlite3.Connection, job_id: str):
+        conn.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE job_id = ?",
+            (JobStatus.QUEUED.value, job_id)
+        )
+
+    def _finish(self, conn: sqlite3.Connection, job_id: str, result: Optional[ProcessingResult], error: Optional[str]):
+        status = JobStatus.FAILED if error else JobStatus.COMPLETED
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?, "
+            "file_content = NULL WHERE job_id = ?",
+            (status.value, time.time(), result.model_dump_json() if result else None, error, job_id)
+        )
+
+    async def _db_retry(self, fn, *args):
+        # jobs.db is shared by every worker process; a lock held past the busy
+        # timeout is waited out rather than ending the worker or leaving a
+        # finished job marked running.
+        delay = settings.JOB_POLL_INTERVAL
+        while True:
+            try:
+                return await self._db(fn, *args)
+            except sqlite3.Error as e:
+                logger.warning("Job queue %s failed, retrying in %.1fs: %s", fn.__name__.lstrip("_"), delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def _worker(self):
+        while not self._draining:
+            try:
+                job = await self._db(self._claim)
+            except sqlite3.Error as e:
+                logger.warning("Job queue claim failed: %s", e)
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+                continue
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._notify(job["job_id"])
+            start_time = time.time()
+            result, error = None, None
+            try:
+                with llm_scheduler.lane(llm_scheduler.LANE_BULK):
+                    result = await self.processor.process_document(
+                        file_content=job["file_content"],
+                        filename=job["filename"],
+                        content_type=job["content_type"],
+                        file_id=job["job_id"],
+                        started_at=start_time
+                    )
+                error = result.error
+            except asyncio.CancelledError:
+                # If this fails too, recovery on the next start requeues it.
+                try:
+                    await self._db(self._requeue, job["job_id"])
+                except sqlite3.Error as e:
+                    logger.warning("Job queue requeue failed: %s", e)
+                raise
+            except Exception as e:
+                error = str(e)
+
+            await self._db_retry(self._finish, job["job_id"], result, error)
+            self._notify(job["job_id"])
@@ -0,0 +1,241 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+PathItem = Union[str, int]
+Event = Tuple[Tuple[PathItem, ...], Any]
+
+
+class _Frame:
+    __slots__ = ("kind", "start", "path", "key", "index", "expect_key")
+
+    def __init__(self, kind: str, start: int, path: Tuple[PathItem, ...]):
+        self.kind = kind
+        self.start = start
+        self.path = path
+        self.key: Optional[str] = None
+        self.index = 0
+        self.expect_key = kind == "object"
+
+
+class IncrementalJSONParser:
+    # Scans the first JSON object in a streamed model response and reports each
+    # value as soon as it is complete, as (path, value) pairs no deeper than
+    # max_depth. Text before the opening brace (e.g. "Here is the JSON:") is skipped.
+    def __init__(self, max_depth: int = 3):
+        self.max_depth = max_depth
+        self.result: Optional[Any] = None
+        self.done = False
+        self._buffer = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._scalar_start: Optional[int] = None
+
+    @property
+    def text(self) -> str:
+        return self._buffer
+
+    def feed(self, chunk: str) -> List[Event]:
+        self._buffer += chunk
+        events: List[Event] = []
+        buffer = self._buffer
+        while self._pos < len(buffer) and not self.done:
+            char = buffer[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string(events)
+                self._pos += 1
+                continue
+
+            if self._scalar_start is not None:
+                if char not in ",}] \t\r\n":
+                    self._pos += 1
+                    continue
+                self._emit(self._child_path(), self._scalar_start, self._pos, events)
+                self._scalar_start = None
+
+            if not self._stack:
+                if char == "{":
+                    self._stack.append(_Frame("object", self._pos, ()))
+                self._pos += 1
+                continue
+
+            frame = self._stack[-1]
+            if char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif char in "{[":
+                self._stack.append(
+                    _Frame("object" if char == "{" else "array", self._pos, self._child_path())
+                )
+            elif char in "}]":
+                self._stack.pop()
+                self._emit(frame.path, frame.start, self._pos + 1, events)
+                if not self._stack:
+                    self.done = True
+            elif char == ":":
+                frame.expect_key = False
+            elif char == ",":
+                if frame.kind == "object":
+                    frame.expect_key = True
+                else:
+                    frame.index += 1
+            elif not char.isspace():
+                self._scalar_start = self._pos
+            self._pos += 1
+        return events
+
+    def _child_path(self) -> Tuple[PathItem, ...]:
+        frame = self._stack[-1]
+        if frame.kind == "object":
+            return frame.path + (frame.key,)
+        return frame.path + (frame.index,)
+
+    def _end_string(self, events: List[Event]):
+        frame = self._stack[-1]
+        if frame.kind == "object" and frame.expect_key:
+            try:
+                frame.key = json.loads(self._buffer[self._string_start:self._pos + 1])
+            except ValueError:
+                frame.key = self._buffer[self._string_start + 1:self._pos]
+            return
+        self._emit(self._child_path(), self._string_start, self._pos + 1, events)
+
+    def _emit(self, path: Tuple[PathItem, ...], start: int, end: int, events: List[Event]):
+        if path and len(path) > self.max_depth:
+            return
+        try:
+            value = json.loads(self._buffer[start:end])
+        except ValueError:
+            return
+        if not path:
+            self.result = value
+        events.append((path, value))
+
+
+LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _strip_trailing(out: List[str], chars: str):
+    while out and out[-1].isspace():
+        out.pop()
+    while out and out[-1] in chars:
+        out.pop()
+        while out and out[-1].isspace():
+            out.pop()
+
+
+def repair_json(text: str) -> Optional[str]:
+    # Rewrites the first JSON object in text into valid JSON where possible:
+    # trailing commas, single quotes, Python literals, raw newlines in strings
+    # and output truncated by max_tokens (open strings/containers are closed).
+    start = text.find("{")
+    if start < 0:
+        return None
+
+    out: List[str] = []
+    stack: List[List[str]] = []
+    quote: Optional[str] = None
+    escape = False
+    index = start
+    while index < len(text):
+        char = text[index]
+        if quote:
+            if escape:
+                escape = False
+                if char == "'":
+                    out.pop()
+                out.append(char)
+            elif char == "\\":
+                escape = True
+                out.append(char)
+            elif char == quote:
+                quote = None
+                out.append('"')
+                frame = stack[-1]
+                frame[1] = "colon" if frame[0] == "}" and frame[1] == "key" else "comma"
+            elif char == '"':
+                out.append('\\"')
+            elif char == "\n":
+                out.append("\\n")
+            else:
+                out.append(char)
+            index += 1
+            continue
+
+        if char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in "{[":
+            out.append(char)
+            stack.append(["}", "key"] if char == "{" else ["]", "value"])
+        elif char in "}]":
+            _strip_trailing(out, ",")
+            closer, _ = stack.pop()
+            out.append(closer)
+            if not stack:
+                return "".join(out)
+            stack[-1][1] = "comma"
+        elif char == ":":
+            out.append(char)
+            stack[-1][1] = "value"
+        elif char == ",":
+            out.append(char)
+            frame = stack[-1]
+            frame[1] = "key" if frame[0] == "}" else "value"
+        elif char.isspace():
+            out.append(char)
+        else:
+            end = index
+            while end < len(text) and text[end] not in ",:{}[]\"' \t\r\n":
+                end += 1
+            word = text[index:end]
+            out.append(LITERALS.get(word, word))
+            stack[-1][1] = "comma"
+            index = end
+            continue
+        index += 1
+
+    if quote:
+        if escape:
+            out.pop()
+        out.append('"')
+        frame = stack[-1]
+        frame[1] = "colon" if frame[0] == "}" and frame[1] == "key" else "comma"
+    while stack:
+        closer, state = stack.pop()
+        _strip_trailing(out, ",")
+        if closer == "}" and state == "colon":
+            out.append(":null")
+        elif out and out[-1] == ":":
+            out.append("null")
+        out.append(closer)
+    return "".join(out)
+
+
+def parse_json_object(text: Optional[str]) -> Optional[Dict[str, Any]]:
+    text = (text or "").strip()
+    if text.startswith("{"):
+        try:
+            value = json.loads(text)
+            if isinstance(value, dict):
+                return value
+        except ValueError:
+            pass
+
+    repaired = repair_json(text)
+    if repaired is None:
+        return None
+    try:
+        value = json.loads(repaired, strict=False)
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
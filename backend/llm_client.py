@@ -1,22 +1,28 @@
+import asyncio
+import functools
+import httpx
 import openai
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from config import settings
+from json_stream import IncrementalJSONParser, parse_json_object
+from llm_scheduler import LLMScheduler, estimate_tokens
+from hedging import LatencyTracker, hedge_model
+from response_schema import (
+    COMPACT_CHUNK_PROMPT,
+    ENTITY_CODES,
+    ENTITY_TYPES,
+    compact_system_prompt,
+    expand_analysis,
+    expand_category,
+    expand_chunk
+)
+import metrics
 import json
-import re
+import time
 
+PROMPT_VERSION = "4"
 
-class LLMClient:
-    def __init__(self):
-        self.client = openai.OpenAI(
-            api_key=settings.OPENROUTER_API_KEY,
-            base_url=settings.OPENROUTER_BASE_URL
-        )
-        self.vision_model = "anthropic/claude-3.5-sonnet"
-        self.text_model = "anthropic/claude-3.5-sonnet"
-    
-    async def analyze_document(self, content: str, is_image: bool = False, base64_image: str = None) -> Dict[str, Any]:
-        try:
-            system_prompt = """You are a document analysis expert specializing in categorization and content extraction for fraud prevention.
+SYSTEM_PROMPT = """You are a document analysis expert specializing in categorization and content extraction for fraud prevention.
 
 Analyze the provided document and return a JSON response with the following structure:
 {
@@ -54,62 +60,606 @@ Categories:
 
 Focus on fraud prevention - look for suspicious patterns, inconsistencies, or red flags."""
 
-            if is_image and base64_image:
-                messages = [
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Please analyze this document image."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ]
-                model = self.vision_model
-            else:
-                messages = [
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Please analyze this document text:\n\n{content}"
-                    }
-                ]
-                model = self.text_model
-
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=2048,
-                temperature=0.1
+CHUNK_EXTRACTION_PROMPT = """You extract facts from one section of a longer document for fraud prevention.
+
+Return only a JSON object with this structure, leaving lists empty when nothing applies:
+{
+    "summary": "one sentence describing this section",
+    "key_entities": {
+        "company_names": [],
+        "person_names": [],
+        "amounts": [],
+        "addresses": [],
+        "phone_numbers": [],
+        "email_addresses": [],
+        "urls": [],
+        "product_names": [],
+        "other_relevant": []
+    },
+    "dates": [],
+    "urgency_indicators": [],
+    "fraud_risk_indicators": []
+}"""
+
+CATEGORIZATION_PROMPT = """You are a document analysis expert specializing in categorization for fraud prevention.
+
+You are given the opening of a long document, short summaries of each of its sections, and the entities and risk indicators already extracted from it. Return only a JSON object:
+{
+    "category": "one of: invoice, marketplace_listing_screenshot, chat_screenshot, website_screenshot, other",
+    "confidence": "float between 0.0 and 1.0",
+    "summary": "two or three sentences describing the whole document",
+    "document_type": "more specific type if applicable",
+    "fraud_risk_indicators": ["document-level red flags not already listed"],
+    "quality_score": "float between 0.0 and 1.0"
+}"""
+
+
+@functools.lru_cache(maxsize=None)
+def cached_system_message(prompt: str) -> Dict[str, Any]:
+    # Built once per prompt. The breakpoint asks providers with explicit
+    # prefix caching (Anthropic) to cache everything up to and including
+    # the system prompt; providers that cache implicitly ignore it.
+    return {
+        "role": "system",
+        "content": [{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}]
+    }
+
+
+def with_prompt_cache(model: str, messages: list) -> list:
+    # Applied per call rather than in _build_messages: a hedge may send the
+    # same messages to a model that does not accept the marker.
+    if (
+        not settings.LLM_PROMPT_CACHE
+        or not model.startswith(tuple(settings.LLM_PROMPT_CACHE_MODELS))
+        or not messages
+        or messages[0]["role"] != "system"
+        or not isinstance(messages[0]["content"], str)
+    ):
+        return messages
+    return [cached_system_message(messages[0]["content"]), *messages[1:]]
+
+
+def split_into_chunks(content: str, max_chars: int) -> List[str]:
+    chunks = []
+    current = []
+    current_len = 0
+    for line in content.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                chunks.append("".join(current))
+                current, current_len = [], 0
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if current_len + len(line) > max_chars and current:
+            chunks.append("".join(current))
+            current, current_len = [], 0
+        current.append(line)
+        current_len += len(line)
+    if current:
+        chunks.append("".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def _dedupe(values: list) -> list:
+    seen = set()
+    unique = []
+    for value in values:
+        key = " ".join(str(value).split()).lower()
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(value)
+    return unique
+
+
+def merge_chunk_extractions(extractions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    key_entities = {entity_type: [] for entity_type in ENTITY_TYPES}
+    dates, urgency_indicators, fraud_risk_indicators = [], [], []
+    for extraction in extractions:
+        for entity_type, values in (extraction.get("key_entities") or {}).items():
+            key_entities.setdefault(entity_type, []).extend(values or [])
+        dates.extend(extraction.get("dates") or [])
+        urgency_indicators.extend(extraction.get("urgency_indicators") or [])
+        fraud_risk_indicators.extend(extraction.get("fraud_risk_indicators") or [])
+    
+    return {
+        "key_entities": {
+            entity_type: _dedupe(values) for entity_type, values in key_entities.items()
+        },
+        "dates": _dedupe(dates),
+        "urgency_indicators": _dedupe(urgency_indicators),
+        "fraud_risk_indicators": _dedupe(fraud_risk_indicators)
+    }
+
+
+class LLMClient:
+    _http_client: Optional[httpx.AsyncClient] = None
+    _scheduler: Optional[LLMScheduler] = None
+    _latency = LatencyTracker()
+
+    def __init__(self):
+        self.client = openai.AsyncOpenAI(
+            api_key=settings.OPENROUTER_API_KEY,
+            base_url=settings.OPENROUTER_BASE_URL,
+            http_client=self._get_http_client(),
+            # Retries go back through the scheduler so they respect the budget.
+            max_retries=0
+        )
+        self.hedge_client = self.client
+        if settings.HEDGE_BASE_URL:
+            self.hedge_client = openai.AsyncOpenAI(
+                api_key=settings.HEDGE_API_KEY or settings.OPENROUTER_API_KEY,
+                base_url=settings.HEDGE_BASE_URL,
+                http_client=self._get_http_client(),
+                max_retries=0
             )
+        self.vision_model = settings.LLM_VISION_MODEL
+        self.text_model = settings.LLM_TEXT_MODEL
+    
+    @classmethod
+    def _get_http_client(cls) -> httpx.AsyncClient:
+        if cls._http_client is None or cls._http_client.is_closed:
+            cls._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(
+                    settings.LLM_REQUEST_TIMEOUT,
+                    connect=settings.LLM_CONNECT_TIMEOUT
+                )
+            )
+        return cls._http_client
+    
+    @classmethod
+    def _get_scheduler(cls) -> LLMScheduler:
+        if cls._scheduler is None:
+            cls._scheduler = LLMScheduler()
+        return cls._scheduler
+    
+    async def warm_up(self):
+        # Opens (and TLS-handshakes) a pooled keep-alive connection to each
+        # endpoint so the first document does not pay for it. Any HTTP
+        # response will do; only failing to connect is an error.
+        clients = [self.client] if self.hedge_client is self.client else [self.client, self.hedge_client]
+        for client in clients:
+            # The SDK imports its resource modules on first attribute access.
+            client.chat.completions
+            try:
+                await client.models.with_raw_response.list(timeout=settings.WARMUP_TIMEOUT)
+            except openai.APIStatusError:
+                pass
+    
+    @classmethod
+    async def aclose(cls):
+        if cls._scheduler is not None:
+            await cls._scheduler.aclose()
+        if cls._http_client is not None and not cls._http_client.is_closed:
+            await cls._http_client.aclose()
+        cls._http_client = None
+    
+    async def analyze_document(
+        self, 
+        content: str, 
+        is_image: bool = False, 
+        base64_images: Optional[List[str]] = None, 
+        model: Optional[str] = None,
+        pdf_pages: Optional[List[int]] = None
+    ) -> Dict[str, Any]:
+        try:
+            messages, model = self._build_messages(content, is_image, base64_images, model, pdf_pages)
+            response_text = await self._complete(model, messages, max_tokens=2048)
             
-            response_text = response.choices[0].message.content
-            
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                return json.loads(json_str)
+            parsed = self._parse_json(response_text)
+            if parsed is not None:
+                return self._expand(parsed, content)
             else:
                 return self._create_fallback_response(content)
                 
         except Exception as e:
             return self._create_error_response(str(e))
     
+    async def stream_document(
+        self, 
+        content: str, 
+        is_image: bool = False, 
+        base64_images: Optional[List[str]] = None, 
+        model: Optional[str] = None,
+        pdf_pages: Optional[List[int]] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        # Yields ("category", ...) once category and confidence are parsed,
+        # ("entities", ...) per completed key_entities group, then ("analysis", ...).
+        try:
+            messages, model = self._build_messages(content, is_image, base64_images, model, pdf_pages)
+            parser = IncrementalJSONParser()
+            partial: Dict[str, Any] = {}
+            category_sent = False
+            parse_seconds = 0.0
+            
+            deltas = self._stream_complete(model, messages, max_tokens=2048)
+            try:
+                async for delta in deltas:
+                    parse_start = time.perf_counter()
+                    events = parser.feed(delta)
+                    parse_seconds += time.perf_counter() - parse_start
+                    
+                    for path, value in events:
+                        if path in (("category",), ("c",)):
+                            partial["category"] = expand_category(value)
+                        elif path in (("confidence",), ("p",)):
+                            partial["confidence"] = value
+                        elif len(path) == 3 and path[:2] == ("extracted_content", "key_entities"):
+                            yield "entities", {"type": path[2], "values": value}
+                        elif len(path) == 2 and path[0] == "e":
+                            yield "entities", {"type": ENTITY_CODES.get(path[1], path[1]), "values": value}
+                        if not category_sent and len(partial) == 2:
+                            category_sent = True
+                            yield "category", dict(partial)
+            finally:
+                await deltas.aclose()
+            
+            metrics.record_stage("parse", parse_seconds)
+            parsed = parser.result if isinstance(parser.result, dict) else self._parse_json(parser.text)
+            if parsed is None:
+                parsed = self._create_fallback_response(content)
+            else:
+                parsed = self._expand(parsed, content)
+            yield "analysis", parsed
+            
+        except Exception as e:
+            yield "analysis", self._create_error_response(str(e))
+    
+    def _build_messages(
+        self, 
+        content: str, 
+        is_image: bool, 
+        base64_images: Optional[List[str]], 
+        model: Optional[str],
+        pdf_pages: Optional[List[int]] = None
+    ) -> Tuple[list, str]:
+        if settings.RESPONSE_FORMAT == "compact":
+            system_prompt = compact_system_prompt(
+                settings.TRANSCRIPT_MAX_CHARS if is_image and base64_images else 0
+            )
+        else:
+            system_prompt = SYSTEM_PROMPT
+
+        if is_image and base64_images:
+            image_parts = [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64_image}"
+                    }
+                }
+                for base64_image in base64_images
+            ]
+            prompt = "Please analyze this document image."
+            if pdf_pages:
+                # Scanned PDF pages; whatever text layer the other pages had
+                # travels with them.
+                numbers = ", ".join(str(page + 1) for page in pdf_pages)
+                prompt = f"Please analyze this PDF document. The images are scans of its page(s) {numbers}."
+                if content:
+                    prompt += f" Text extracted from its other pages:\n\n{content}"
+            elif len(image_parts) > 1:
+                prompt = (
+                    f"Please analyze this document image. It is a tall screenshot split "
+                    f"top-to-bottom into {len(image_parts)} consecutive parts."
+                )
+            messages = [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": prompt
+                        },
+                        *image_parts
+                    ]
+                }
+            ]
+            model = model or self.vision_model
+        else:
+            messages = [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": f"Please analyze this document text:\n\n{content}"
+                }
+            ]
+            model = model or self.text_model
+        return messages, model
+    
+    async def analyze_long_document(self, content: str) -> Dict[str, Any]:
+        try:
+            chunks = split_into_chunks(
+                content, settings.CHUNK_MAX_TOKENS * settings.CHARS_PER_TOKEN
+            )
+            chunk_results = await asyncio.gather(
+                *[self._extract_chunk(chunk) for chunk in chunks],
+                return_exceptions=True
+            )
+            extractions = [
+                result for result in chunk_results
+                if isinstance(result, dict)
+            ]
+            if not extractions:
+                return self._create_fallback_response(content)
+            
+            merged = merge_chunk_extractions(extractions)
+            
+            summaries = "\n".join(
+                f"- Part {index + 1}: {extraction.get('summary', '')}"
+                for index, extraction in enumerate(extractions)
+            )
+            categorization_input = (
+                f"Document opening:\n{content[:settings.CATEGORIZATION_HEAD_CHARS]}\n\n"
+                f"Section summaries:\n{summaries}\n\n"
+                f"Extracted entities:\n{json.dumps(merged['key_entities'])}\n\n"
+                f"Fraud risk indicators found in sections:\n"
+                f"{json.dumps(merged['fraud_risk_indicators'])}"
+            )
+            response_text = await self._complete(
+                self.text_model,
+                [
+                    {"role": "system", "content": CATEGORIZATION_PROMPT},
+                    {"role": "user", "content": categorization_input}
+                ],
+                max_tokens=512
+            )
+            categorization = self._parse_json(response_text) or {}
+            
+            fraud_risk_indicators = _dedupe(
+                merged["fraud_risk_indicators"] + list(categorization.get("fraud_risk_indicators", []))
+            )
+            failed_chunks = len(chunks) - len(extractions)
+            if failed_chunks:
+                fraud_risk_indicators.append(
+                    f"Partial analysis: {failed_chunks} of {len(chunks)} sections failed - manual review required"
+                )
+            
+            return {
+                "category": categorization.get("category", "other"),
+                "confidence": categorization.get("confidence", 0.0),
+                "extracted_content": {
+                    "text": categorization.get("summary") or "\n".join(
+                        extraction.get("summary", "") for extraction in extractions
+                    ),
+                    "key_entities": merged["key_entities"],
+                    "dates": merged["dates"],
+                    "metadata": {
+                        "document_type": categorization.get("document_type", "unknown"),
+                        "urgency_indicators": merged["urgency_indicators"],
+                        "fraud_risk_indicators": fraud_risk_indicators,
+                        "quality_score": categorization.get("quality_score", 0.0),
+                        "chunks_analyzed": len(extractions),
+                        "chunks_total": len(chunks)
+                    }
+                }
+            }
+            
+        except Exception as e:
+            return self._create_error_response(str(e))
+    
+    async def _extract_chunk(self, chunk: str) -> Dict[str, Any]:
+        if settings.RESPONSE_FORMAT == "compact":
+            system_prompt = COMPACT_CHUNK_PROMPT
+        else:
+            system_prompt = CHUNK_EXTRACTION_PROMPT
+        response_text = await self._complete(
+            self.text_model,
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"Document section:\n\n{chunk}"}
+            ],
+            max_tokens=settings.CHUNK_MAX_OUTPUT_TOKENS
+        )
+        parsed = self._parse_json(response_text)
+        if parsed is None:
+            raise ValueError("Chunk extraction returned no JSON")
+        return expand_chunk(parsed)
+    
+    async def _create(
+        self, 
+        model: str, 
+        estimated_tokens: int, 
+        messages: list, 
+        client: Optional[openai.AsyncOpenAI] = None, 
+        admitted: Optional[asyncio.Event] = None, 
+        **kwargs
+    ) -> Tuple[Any, float]:
+        # Returns the response and the start time of the attempt that produced
+        # it. The scheduler slot is still held on return; callers release it.
+        client = client or self.client
+        scheduler = self._get_scheduler()
+        ticket = scheduler.ticket()
+        attempt = 0
+        queue_wait = 0.0
+        while True:
+            wait_start = time.perf_counter()
+            await scheduler.acquire(ticket, estimated_tokens)
+            queue_wait += time.perf_counter() - wait_start
+            if admitted is not None:
+                admitted.set()
+            call_start = time.perf_counter()
+            try:
+                with metrics.LLM_CALLS_IN_FLIGHT.track(model=model):
+                    raw = await asyncio.wait_for(
+                        client.chat.completions.with_raw_response.create(
+                            model=model, messages=with_prompt_cache(model, messages),
+                            temperature=0.1, **kwargs
+                        ),
+                        timeout=settings.LLM_REQUEST_TIMEOUT
+                    )
+                    response = raw.parse()
+            except BaseException as e:
+                scheduler.release()
+                if not isinstance(e, Exception):
+                    raise
+                status = "rate_limited" if isinstance(e, openai.RateLimitError) else "error"
+                metrics.LLM_REQUESTS_TOTAL.inc(model=model, status=status)
+                delay = scheduler.retry_delay(e, attempt)
+                if delay is None:
+                    metrics.record_stage("llm_queue_wait", queue_wait)
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            
+            metrics.record_stage("llm_queue_wait", queue_wait)
+            scheduler.observe_headers(raw.headers)
+            return response, call_start
+    
+    async def _complete(self, model: str, messages: list, max_tokens: int) -> str:
+        # Once the call has run past the recent latency percentile for its
+        # model, a duplicate goes to the hedge model/endpoint; the first
+        # answer wins and the other call is cancelled. When the hedge targets
+        # another model or endpoint it also serves as the fallback for a
+        # failed primary call, unless the failure was the rate limit.
+        admitted = asyncio.Event()
+        primary = asyncio.create_task(
+            self._complete_once(model, messages, max_tokens, self.client, admitted)
+        )
+        hedge = None
+        tasks = {primary}
+        try:
+            hedge_delay = self._latency.hedge_delay(model)
+            if hedge_delay is not None:
+                # The primary call can fail before it is ever admitted.
+                admission = asyncio.create_task(admitted.wait())
+                try:
+                    await asyncio.wait({primary, admission}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    admission.cancel()
+                if not primary.done():
+                    await asyncio.wait(tasks, timeout=hedge_delay)
+                if not primary.done():
+                    hedge = self._start_hedge(model, messages, max_tokens)
+                    tasks.add(hedge)
+            
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        content, winner = task.result()
+                        if hedge is not None:
+                            metrics.LLM_HEDGES_TOTAL.inc(
+                                model=model, winner="primary" if task is primary else "hedge"
+                            )
+                        metrics.record_model(winner, hedged=hedge is not None)
+                        return content
+                    error = error or task.exception()
+                    if hedge is None and self._can_fall_back(model, error):
+                        hedge = self._start_hedge(model, messages, max_tokens)
+                        tasks.add(hedge)
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def _can_fall_back(self, model: str, error: BaseException) -> bool:
+        # Repeating a call against the same model and quota only spends the
+        # budget again, and rate-limit errors arrive after the scheduler's
+        # own retries and pauses.
+        if not settings.HEDGE_ENABLED or isinstance(error, openai.RateLimitError):
+            return False
+        return hedge_model(model) != model or self.hedge_client is not self.client
+
+    def _start_hedge(self, model: str, messages: list, max_tokens: int) -> asyncio.Task:
+        return asyncio.create_task(
+            self._complete_once(hedge_model(model), messages, max_tokens, self.hedge_client)
+        )
+    
+    async def _complete_once(
+        self, 
+        model: str, 
+        messages: list, 
+        max_tokens: int, 
+        client: openai.AsyncOpenAI, 
+        admitted: Optional[asyncio.Event] = None
+    ) -> Tuple[str, str]:
+        scheduler = self._get_scheduler()
+        estimated_tokens = estimate_tokens(messages, max_tokens)
+        try:
+            response, call_start = await self._create(
+                model, estimated_tokens, client=client, admitted=admitted,
+                messages=messages, max_tokens=max_tokens
+            )
+        except asyncio.CancelledError:
+            metrics.LLM_REQUESTS_TOTAL.inc(model=model, status="cancelled")
+            raise
+        scheduler.release()
+        call_seconds = time.perf_counter() - call_start
+        self._latency.record(model, call_seconds)
+        metrics.record_stage("llm_call", call_seconds)
+        metrics.LLM_REQUESTS_TOTAL.inc(model=model, status="ok")
+        metrics.record_usage(model, response.usage)
+        scheduler.record_usage(estimated_tokens, response.usage)
+        return response.choices[0].message.content, model
+    
+    async def _stream_complete(self, model: str, messages: list, max_tokens: int) -> AsyncIterator[str]:
+        scheduler = self._get_scheduler()
+        estimated_tokens = estimate_tokens(messages, max_tokens)
+        stream, call_start = await self._create(
+            model, estimated_tokens, messages=messages, max_tokens=max_tokens,
+            stream=True, stream_options={"include_usage": True}
+        )
+        deadline = time.monotonic() + settings.LLM_REQUEST_TIMEOUT
+        usage = None
+        first_token = True
+        try:
+            with metrics.LLM_CALLS_IN_FLIGHT.track(model=model):
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            chunks.__anext__(), timeout=max(deadline - time.monotonic(), 0.001)
+                        )
+                    except StopAsyncIteration:
+                        break
+                    usage = chunk.usage or usage
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        if first_token:
+                            first_token = False
+                            metrics.record_stage("llm_first_token", time.perf_counter() - call_start)
+                        yield delta
+        except GeneratorExit:
+            metrics.LLM_REQUESTS_TOTAL.inc(model=model, status="cancelled")
+            raise
+        except Exception:
+            metrics.LLM_REQUESTS_TOTAL.inc(model=model, status="error")
+            raise
+        else:
+            metrics.LLM_REQUESTS_TOTAL.inc(model=model, status="ok")
+            metrics.record_model(model, hedged=False)
+        finally:
+            scheduler.release()
+            metrics.record_stage("llm_call", time.perf_counter() - call_start)
+            metrics.record_usage(model, usage)
+            scheduler.record_usage(estimated_tokens, usage)
+            await stream.close()
+    
+    def _parse_json(self, response_text: Optional[str]) -> Optional[Dict[str, Any]]:
+        with metrics.stage("parse"):
+            return parse_json_object(response_text)
+    
+    def _expand(self, parsed: Dict[str, Any], content: str) -> Dict[str, Any]:
+        return expand_analysis(
+            parsed, source_text=content, transcript_chars=settings.TRANSCRIPT_MAX_CHARS
+        )
+    
     def _create_fallback_response(self, content: str) -> Dict[str, Any]:
+        metrics.mark_outcome("fallback")
         return {
             "category": "other",
             "confidence": 0.1,
@@ -127,6 +677,7 @@ Focus on fraud prevention - look for suspicious patterns, inconsistencies, or re
         }
     
     def _create_error_response(self, error: str) -> Dict[str, Any]:
+        metrics.mark_outcome("llm_error")
         return {
             "category": "other",
             "confidence": 0.0,
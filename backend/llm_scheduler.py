@@ -0,0 +1,619 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import random
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+import httpx
+import openai
+
+from config import settings
+from shared_state import SharedStateStore
+import metrics
+
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+LANES = {LANE_INTERACTIVE: 0, LANE_BULK: 1}
+
+RATE_DECREASE = 0.8
+# Shared state saved under another boot (when the monotonic clock restarted)
+# is detected by the two clocks drifting apart and ignored.
+CLOCK_DRIFT_SECONDS = 60
+# (limit, remaining, reset) header names per budget; OpenAI-style names first,
+# then the unsuffixed OpenRouter ones, which count requests.
+RATE_LIMIT_HEADERS = {
+    "requests": (
+        ("x-ratelimit-limit-requests", "x-ratelimit-limit"),
+        ("x-ratelimit-remaining-requests", "x-ratelimit-remaining"),
+        ("x-ratelimit-reset-requests", "x-ratelimit-reset")
+    ),
+    "tokens": (
+        ("x-ratelimit-limit-tokens",),
+        ("x-ratelimit-remaining-tokens",),
+        ("x-ratelimit-reset-tokens",)
+    )
+}
+DURATION_PATTERN = re.compile(r"(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?$")
+
+_current_lane: ContextVar[str] = ContextVar("llm_lane", default=LANE_INTERACTIVE)
+
+Ticket = Tuple[int, int]
+
+
+@contextmanager
+def lane(name: str) -> Iterator[None]:
+    token = _current_lane.set(name)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def current_lane() -> str:
+    return _current_lane.get()
+
+
+def parse_reset(value: Optional[str], now: float) -> Optional[float]:
+    # Seconds until a limit resets. Providers send plain seconds, durations
+    # like "6m0s" or "250ms", epoch seconds/milliseconds, or an HTTP date.
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        number = float(value)
+    except ValueError:
+        match = DURATION_PATTERN.match(value)
+        if match and any(match.groups()):
+            hours, minutes, seconds, millis = (float(group or 0) for group in match.groups())
+            return hours * 3600 + minutes * 60 + seconds + millis / 1000
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - now, 0.0)
+        except (TypeError, ValueError):
+            return None
+    if number > 1e12:
+        return max(number / 1000 - now, 0.0)
+    if number > 1e9:
+        return max(number - now, 0.0)
+    return max(number, 0.0)
+
+
+def _header_number(headers: Mapping[str, str], *names: str) -> Optional[float]:
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except ValueError:
+            continue
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    # Equal jitter: half the exponential delay is guaranteed so retries never
+    # collapse onto the provider at once, the other half is random.
+    delay = min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def estimate_tokens(messages: list, max_tokens: int) -> int:
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                chars += len(part.get("text", ""))
+            else:
+                images += 1
+    image_tokens = settings.IMAGE_TOKEN_BUDGET if images else 0
+    return chars // max(settings.CHARS_PER_TOKEN, 1) + image_tokens + max_tokens
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+        # Rate and clamp changes not yet merged into the shared state.
+        self.clamped: Optional[float] = None
+        self.rate_changed = False
+
+    @property
+    def limited(self) -> bool:
+        return self.per_minute > 0
+
+    def _refill(self, now: float):
+        # Another process may have refilled a shared bucket a moment later.
+        elapsed = max(now - self.updated, 0.0)
+        if self.limited:
+            self.level = min(self.per_minute, self.level + elapsed * self.per_minute / 60)
+        self.updated = max(self.updated, now)
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if not self.limited:
+            return 0.0
+        self._refill(now)
+        # A request larger than the whole budget waits for a full bucket
+        # rather than forever.
+        amount = min(amount, self.per_minute)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.per_minute
+
+    def take(self, amount: float, now: float):
+        if self.limited:
+            self._refill(now)
+            self.level = min(self.level - amount, self.per_minute)
+
+    def set_rate(self, per_minute: float, now: float):
+        self.rate_changed = True
+        self._refill(now)
+        if not self.limited:
+            self.level = per_minute
+        self.per_minute = per_minute
+        self.level = min(self.level, per_minute)
+
+    def clamp(self, remaining: float, now: float):
+        self.clamped = remaining if self.clamped is None else min(self.clamped, remaining)
+        if self.limited:
+            self._refill(now)
+            self.level = min(self.level, remaining)
+
+    def state(self) -> List[float]:
+        return [self.per_minute, self.level, self.updated]
+
+    def restore(self, state: List[float]):
+        self.per_minute, self.level, self.updated = state
+
+    def pending(self) -> Dict[str, Any]:
+        # Hands over the local changes since the last sync.
+        pending = {"clamped": self.clamped, "per_minute": self.per_minute if self.rate_changed else None}
+        self.clamped, self.rate_changed = None, False
+        return pending
+
+    def merge(self, pending: Dict[str, Any], returned: float, now: float):
+        # Applied to the shared bucket: unused lease comes back (a negative
+        # amount charges usage above the estimate), then the local changes.
+        self.take(-returned, now)
+        if pending["per_minute"] is not None:
+            self.set_rate(pending["per_minute"], now)
+        if pending["clamped"] is not None:
+            self.clamp(pending["clamped"], now)
+
+    def lease(self, wanted: float, now: float) -> float:
+        if not self.limited:
+            return 0.0
+        granted = min(max(self.level, 0.0), wanted)
+        self.take(granted, now)
+        return granted
+
+    def adopt(self, state: List[float]):
+        # The shared state, keeping what changed here while it was merged.
+        per_minute = self.per_minute
+        self.restore(state)
+        if self.rate_changed:
+            self.per_minute = per_minute
+            self.level = min(self.level, per_minute)
+        if self.clamped is not None and self.limited:
+            self.level = min(self.level, self.clamped)
+
+
+class RequestWindow:
+    # Requests granted over the last minute as a sliding-window counter: the
+    # previous minute's count weighted by how much of it is still in range.
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.current = 0
+        self.previous = 0
+        self.added = 0
+
+    def _roll(self, now: float):
+        elapsed = now - self.start
+        if elapsed >= 60:
+            self.previous = self.current if elapsed < 120 else 0
+            self.current = 0
+            self.start += elapsed // 60 * 60
+
+    def add(self, now: float, count: int = 1):
+        self._roll(now)
+        self.current += count
+        self.added += count
+
+    def count(self, now: float) -> float:
+        self._roll(now)
+        return self.current + self.previous * max(0.0, 1 - (now - self.start) / 60)
+
+    def state(self) -> List[float]:
+        return [self.start, self.current, self.previous]
+
+    def restore(self, state: List[float]):
+        self.start, self.current, self.previous = state
+
+    def pending(self) -> int:
+        added, self.added = self.added, 0
+        return added
+
+    def adopt(self, state: List[float], now: float):
+        self.restore(state)
+        self._roll(now)
+        self.current += self.added
+
+
+class LLMScheduler:
+    # Admits LLM calls in (lane, arrival) order while staying inside the
+    # concurrency cap and the request/token budgets. Budgets start from
+    # LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE (0 = unknown) and are
+    # tightened from rate-limit headers and 429s, then probed back upwards
+    # one request per minute at a time while calls keep succeeding.
+    #
+    # With a shared store the budgets, pause and learned rates live in one
+    # record used by every worker process on the host. Each process admits
+    # calls from a lease of requests/tokens reserved out of that record. A
+    # background task syncs, in a worker thread so lock waits never block
+    # the event loop. It runs every SHARED_STATE_SYNC_INTERVAL, and at once
+    # when the lease runs short or a 429 arrives. Each sync hands back the
+    # unused lease, merges learned rates and pauses, and reserves what the
+    # local queue needs. If the store fails, admission falls back to this
+    # process's copy of the budgets until the store answers again. The
+    # concurrency cap and the lane queue stay per process.
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        store: Optional[SharedStateStore] = None
+    ):
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.request_ceiling = (
+            requests_per_minute if requests_per_minute is not None else settings.LLM_REQUESTS_PER_MINUTE
+        )
+        self.token_ceiling = (
+            tokens_per_minute if tokens_per_minute is not None else settings.LLM_TOKENS_PER_MINUTE
+        )
+        self.requests = TokenBucket(self.request_ceiling)
+        self.tokens = TokenBucket(self.token_ceiling)
+        self.advertised_requests = 0.0
+        self.paused_until = 0.0
+        self.store = store
+        if self.store is None and settings.SHARED_STATE_DB_PATH:
+            self.store = SharedStateStore(settings.SHARED_STATE_DB_PATH)
+        self._waiters: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._grants = RequestWindow()
+        self._advertised_changed = False
+        # [requests, tokens] reserved from the shared budgets; None admits
+        # from the local buckets.
+        self._lease: Optional[List[float]] = None
+        self._lease_retry_at = 0.0
+        self._sync_task: Optional[asyncio.Task] = None
+        self._sync_requested: Optional[asyncio.Event] = None
+        self._synced: Optional[asyncio.Event] = None
+        self._publish_limits()
+
+    def ticket(self, lane_name: Optional[str] = None) -> Ticket:
+        # Taken once per logical call, so a retried request keeps its place.
+        return LANES.get(lane_name or current_lane(), len(LANES)), next(self._sequence)
+
+    async def acquire(self, ticket: Ticket, tokens: int):
+        if self.store is not None:
+            # A fresh process learns the host's budgets before its first call,
+            # unless the store is too slow to answer.
+            self._ensure_sync()
+            if not self._synced.is_set():
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._synced.wait(), settings.SHARED_STATE_SYNC_INTERVAL)
+                self._synced.set()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (*ticket, tokens, future))
+        self._publish_depth()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+                self._dispatch()
+            raise
+
+    def release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._waiters and self._waiters[0][3].done():
+            heapq.heappop(self._waiters)
+        if self._waiters and self._in_flight < self.max_concurrency:
+            self._admit(time.monotonic())
+        self._publish_depth()
+
+    def _admit(self, now: float):
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self._in_flight >= self.max_concurrency:
+                break
+
+            wait = self.paused_until - now
+            if wait <= 0:
+                wait = self._budget_wait(tokens, now)
+                if wait is None:
+                    # The sync dispatches again once it has a new lease.
+                    break
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                break
+
+            heapq.heappop(self._waiters)
+            if self._lease is not None:
+                self._lease[0] -= 1
+                self._lease[1] -= tokens
+            else:
+                self.requests.take(1, now)
+                self.tokens.take(tokens, now)
+            self._in_flight += 1
+            self._grants.add(now)
+            future.set_result(None)
+
+    def _budget_wait(self, tokens: int, now: float) -> Optional[float]:
+        # Seconds until the budgets allow one more call, or None to wait for
+        # a sync to renew the lease.
+        if self._lease is None:
+            return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+        requests, leased_tokens = self._lease
+        if (not self.requests.limited or requests >= 1) and (
+            not self.tokens.limited or leased_tokens >= min(tokens, self.tokens.per_minute)
+        ):
+            return 0.0
+        if now < self._lease_retry_at:
+            return self._lease_retry_at - now
+        self._request_sync()
+        return None
+
+    def _ensure_sync(self):
+        loop = asyncio.get_running_loop()
+        if self._sync_task is None or self._sync_task.done() or self._sync_task.get_loop() is not loop:
+            self._sync_requested = asyncio.Event()
+            self._synced = asyncio.Event()
+            self._sync_task = loop.create_task(self._sync_loop())
+
+    def _request_sync(self):
+        if self._sync_requested is not None:
+            self._sync_requested.set()
+
+    async def _sync_loop(self):
+        while True:
+            await self.sync()
+            self._synced.set()
+            try:
+                await asyncio.wait_for(self._sync_requested.wait(), settings.SHARED_STATE_SYNC_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._sync_requested.clear()
+
+    async def sync(self):
+        # The lease goes back with the sync; calls admitted from what is
+        # charged to it meanwhile (usage above the estimate) carry over.
+        if self.store is None:
+            return
+        waiting = [(tokens, future) for _, _, tokens, future in sorted(self._waiters) if not future.done()]
+        returned = self._lease or [0.0, 0.0]
+        self._lease = [0.0, 0.0]
+        pending = {
+            "local": self._state(),
+            "requests": self.requests.pending(),
+            "tokens": self.tokens.pending(),
+            "grants": self._grants.pending(),
+            "advertised_requests": self.advertised_requests if self._advertised_changed else None,
+            "paused_until": self.paused_until,
+            "returned": returned,
+            "wanted": [
+                len(waiting),
+                sum(min(tokens, self.tokens.per_minute) for tokens, _ in waiting) if self.tokens.limited else 0
+            ],
+            "next_tokens": waiting[0][0] if waiting else 0
+        }
+        self._advertised_changed = False
+        try:
+            merged, lease, retry_in = await asyncio.to_thread(self._merge_shared, pending)
+        except sqlite3.Error:
+            metrics.SHARED_STATE_SYNCS_TOTAL.inc(status="error")
+            self._lease = None
+            self._dispatch()
+            return
+        metrics.SHARED_STATE_SYNCS_TOTAL.inc(status="ok")
+
+        now = time.monotonic()
+        self.requests.adopt(merged["requests"])
+        self.tokens.adopt(merged["tokens"])
+        self._grants.adopt(merged["grants"], now)
+        if not self._advertised_changed:
+            self.advertised_requests = merged["advertised_requests"]
+        self.paused_until = max(self.paused_until, merged["paused_until"])
+        self._lease = [lease[0] + self._lease[0], lease[1] + self._lease[1]]
+        self._lease_retry_at = now + retry_in
+        self._publish_limits()
+        self._dispatch()
+
+    def _merge_shared(self, pending: Dict[str, Any]) -> Tuple[Dict[str, Any], List[float], float]:
+        # Runs in a worker thread, on copies, in one store transaction. A
+        # missing record, or one saved under another boot, starts from this
+        # process's state.
+        now = time.monotonic()
+        with self.store.record("llm_scheduler") as state:
+            valid = state and abs((time.time() - state["wall"]) - (now - state["monotonic"])) < CLOCK_DRIFT_SECONDS
+            shared = state if valid else pending["local"]
+            requests, tokens, grants = TokenBucket(0), TokenBucket(0), RequestWindow()
+            requests.restore(shared["requests"])
+            tokens.restore(shared["tokens"])
+            grants.restore(shared["grants"])
+            requests.merge(pending["requests"], pending["returned"][0], now)
+            tokens.merge(pending["tokens"], pending["returned"][1], now)
+            if valid:
+                grants.add(now, pending["grants"])
+            paused_until = max(shared["paused_until"], pending["paused_until"])
+
+            wanted_requests, wanted_tokens = pending["wanted"]
+            lease = [requests.lease(wanted_requests, now), tokens.lease(wanted_tokens, now)]
+            # When the queue could not be covered, ask again once the shared
+            # budgets have refilled for the next call, not before.
+            retry_in = 0.0
+            if lease[0] < wanted_requests or lease[1] < wanted_tokens:
+                retry_in = max(
+                    requests.wait_time(1, now),
+                    tokens.wait_time(pending["next_tokens"], now),
+                    paused_until - now
+                )
+            merged = {
+                "requests": requests.state(),
+                "tokens": tokens.state(),
+                "grants": grants.state(),
+                "advertised_requests": pending["advertised_requests"] or shared["advertised_requests"],
+                "paused_until": paused_until
+            }
+            state.clear()
+            state.update(merged, wall=time.time(), monotonic=now)
+        return merged, lease, retry_in
+
+    async def aclose(self):
+        # Stops the sync task after handing over what is still pending.
+        if self._sync_task is None:
+            return
+        self._sync_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._sync_task
+        self._sync_task = None
+        await self.sync()
+
+    def _state(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests.state(),
+            "tokens": self.tokens.state(),
+            "grants": self._grants.state(),
+            "advertised_requests": self.advertised_requests,
+            "paused_until": self.paused_until
+        }
+
+    def record_usage(self, estimated_tokens: int, usage):
+        # Charge (or refund) the difference between the estimate taken at
+        # admission and what the provider reported.
+        used_tokens = getattr(usage, "total_tokens", None) or 0
+        if used_tokens:
+            if self._lease is not None:
+                self._lease[1] -= used_tokens - estimated_tokens
+            else:
+                self.tokens.take(used_tokens - estimated_tokens, time.monotonic())
+            self._dispatch()
+
+    def observe_headers(self, headers: Mapping[str, str]):
+        now = time.monotonic()
+        self._observe_headers(headers, now)
+
+        ceilings = [limit for limit in (self.request_ceiling, self.advertised_requests) if limit]
+        ceiling = min(ceilings) if ceilings else float("inf")
+        if self.requests.limited and self.requests.per_minute < ceiling:
+            probed = self.requests.per_minute + 1 / self.requests.per_minute
+            self.requests.set_rate(min(probed, ceiling), now)
+        self._publish_limits()
+
+    def retry_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        # Seconds to wait before queueing the call again, or None to give up.
+        if isinstance(error, openai.RateLimitError):
+            if attempt >= settings.LLM_RATE_LIMIT_RETRIES:
+                return None
+            self._rate_limited(error.response.headers, attempt)
+            return 0.0
+
+        retryable = isinstance(error, (
+            openai.APIConnectionError, openai.InternalServerError, asyncio.TimeoutError, httpx.TransportError
+        ))
+        if not retryable or attempt >= settings.LLM_MAX_RETRIES:
+            return None
+        return backoff_delay(attempt)
+
+    def _rate_limited(self, headers: Mapping[str, str], attempt: int):
+        now = time.monotonic()
+        # 429s from one burst arrive together; only the first one of a
+        # pause adjusts the rate.
+        first_of_burst = self.paused_until <= now
+        retry_after = _header_number(headers, "retry-after-ms")
+        retry_after = retry_after / 1000 if retry_after is not None else parse_reset(
+            headers.get("retry-after"), time.time()
+        )
+        self.paused_until = max(self.paused_until, now + (retry_after or backoff_delay(attempt)))
+        self._observe_headers(headers, now)
+
+        if first_of_burst and not self.advertised_requests:
+            # Without an advertised limit, back off multiplicatively from
+            # the rate actually achieved over the last minute.
+            achieved = self._grants.count(now)
+            current = self.requests.per_minute if self.requests.limited else achieved
+            self.requests.set_rate(max(1.0, min(current, achieved or current) * RATE_DECREASE), now)
+        self.requests.clamp(0, now)
+        self._publish_limits()
+        self._dispatch()
+        # Other workers should hold off too without waiting for the next sync.
+        self._request_sync()
+
+    def _observe_headers(self, headers: Mapping[str, str], now: float):
+        for kind, bucket, ceiling in (
+            ("requests", self.requests, self.request_ceiling),
+            ("tokens", self.tokens, self.token_ceiling)
+        ):
+            limit_names, remaining_names, reset_names = RATE_LIMIT_HEADERS[kind]
+            limit = _header_number(headers, *limit_names)
+            if limit:
+                if kind == "requests":
+                    self.advertised_requests = limit
+                    self._advertised_changed = True
+                limit = min(limit, ceiling) if ceiling else limit
+                if not bucket.limited or bucket.per_minute > limit:
+                    bucket.set_rate(limit, now)
+
+            remaining = _header_number(headers, *remaining_names)
+            if remaining is None:
+                continue
+            bucket.clamp(remaining, now)
+            if remaining <= 0:
+                reset = next(
+                    (parse_reset(headers[name], time.time()) for name in reset_names if name in headers),
+                    None
+                )
+                if reset:
+                    self.paused_until = max(self.paused_until, now + reset)
+
+    def _publish_depth(self):
+        depths = {name: 0 for name in LANES}
+        names = {priority: name for name, priority in LANES.items()}
+        for priority, _, _, future in self._waiters:
+            if not future.done():
+                name = names.get(priority, LANE_BULK)
+                depths[name] += 1
+        for name, depth in depths.items():
+            metrics.LLM_QUEUE_DEPTH.set(depth, lane=name)
+
+    def _publish_limits(self):
+        metrics.LLM_RATE_LIMIT.set(self.requests.per_minute, kind="requests")
+        metrics.LLM_RATE_LIMIT.set(self.tokens.per_minute, kind="tokens")
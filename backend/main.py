@@ -1,16 +1,27 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse, JSONResponse
+import asyncio
 import os
 import sys
 import uuid
 import time
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+
+import orjson
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from shared.models import ProcessingResult, DocumentCategory
+from shared.models import ProcessingResult, DocumentCategory, JobInfo, EntitySearchResult, RelatedDocuments
 from document_processor import DocumentProcessor
+from job_queue import JobQueue, TERMINAL_STATUSES
+from entity_index import KINDS as ENTITY_KINDS
+from llm_client import LLMClient
+import llm_scheduler
+from profiling import profile_if_slow
+from warmup import Warmup
 from config import settings
+import metrics
 
 app = FastAPI(title="Document Processing API", version="1.0.0")
 
@@ -23,6 +34,24 @@ app.add_middleware(
 )
 
 processor = DocumentProcessor()
+job_queue = JobQueue(processor)
+warmup = Warmup(processor)
+
+@app.on_event("startup")
+async def startup():
+    await job_queue.start()
+    warmup.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await warmup.stop()
+    await job_queue.stop()
+    processor.preprocess_pool.shutdown()
+    if processor.entity_index is not None:
+        processor.entity_index.close()
+    if processor.results_store is not None:
+        processor.results_store.close()
+    await LLMClient.aclose()
 
 @app.get("/")
 async def root():
@@ -31,37 +60,104 @@ async def root():
 @app.post("/process-document/", response_model=ProcessingResult)
 async def process_document(file: UploadFile = File(...)):
     start_time = time.time()
-    file_id = str(uuid.uuid4())
+    file_content = await file.read()
+    return await _process_upload(
+        file_id=str(uuid.uuid4()),
+        filename=file.filename,
+        content_type=file.content_type,
+        file_content=file_content,
+        start_time=start_time,
+        upload_read_seconds=time.time() - start_time
+    )
+
+@app.post("/process-document/stream")
+async def process_document_stream(file: UploadFile = File(...)):
+    start_time = time.time()
+    _validate_content_type(file.content_type)
+    file_content = await file.read()
+    upload_read_seconds = time.time() - start_time
     
-    try:
-        if not file.content_type:
-            raise HTTPException(status_code=400, detail="File type not detected")
-        
-        if not file.content_type.startswith(('image/', 'application/pdf')):
-            raise HTTPException(
-                status_code=400, 
-                detail="Only PDF and image files are supported"
-            )
-        
-        file_content = await file.read()
-        
-        result = await processor.process_document(
+    async def stream():
+        events = processor.stream_document(
             file_content=file_content,
             filename=file.filename,
             content_type=file.content_type,
-            file_id=file_id
+            file_id=str(uuid.uuid4()),
+            started_at=start_time,
+            upload_read_seconds=upload_read_seconds
         )
+        async for event, data in events:
+            if event == "result":
+                yield f"event: result\ndata: {data.model_dump_json()}\n\n"
+            else:
+                yield f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.post("/process-documents/")
+async def process_documents(files: List[UploadFile] = File(...)):
+    uploads = []
+    for file in files:
+        uploads.append((str(uuid.uuid4()), file.filename, file.content_type, await file.read()))
+    
+    return StreamingResponse(
+        _stream_batch(uploads),
+        media_type="application/x-ndjson"
+    )
+
+async def _stream_batch(uploads: List[Tuple[str, Optional[str], Optional[str], bytes]]):
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+    
+    async def run(file_id, filename, content_type, file_content):
+        async with semaphore:
+            with llm_scheduler.lane(llm_scheduler.LANE_BULK):
+                return await _process_upload(
+                    file_id=file_id,
+                    filename=filename,
+                    content_type=content_type,
+                    file_content=file_content,
+                    start_time=time.time()
+                )
+    
+    tasks = [asyncio.create_task(run(*upload)) for upload in uploads]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            yield result.model_dump_json() + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _process_upload(
+    file_id: str,
+    filename: Optional[str],
+    content_type: Optional[str],
+    file_content: bytes,
+    start_time: float,
+    upload_read_seconds: float = 0.0
+) -> ProcessingResult:
+    try:
+        _validate_content_type(content_type)
         
-        processing_time = time.time() - start_time
-        result.processing_time = processing_time
-        
-        return result
+        async with profile_if_slow(file_id):
+            return await processor.process_document(
+                file_content=file_content,
+                filename=filename,
+                content_type=content_type,
+                file_id=file_id,
+                started_at=start_time,
+                upload_read_seconds=upload_read_seconds
+            )
         
     except Exception as e:
         processing_time = time.time() - start_time
         return ProcessingResult(
             file_id=file_id,
-            filename=file.filename or "unknown",
+            filename=filename or "unknown",
             category=DocumentCategory.OTHER,
             confidence=0.0,
             extracted_content={},
@@ -69,10 +165,128 @@ async def process_document(file: UploadFile = File(...)):
             error=str(e)
         )
 
+def _validate_content_type(content_type: Optional[str]):
+    if not content_type:
+        raise HTTPException(status_code=400, detail="File type not detected")
+    
+    if not content_type.startswith(('image/', 'application/pdf')):
+        raise HTTPException(
+            status_code=400, 
+            detail="Only PDF and image files are supported"
+        )
+
+@app.post("/jobs", response_model=JobInfo, status_code=202)
+async def create_job(file: UploadFile = File(...)):
+    _validate_content_type(file.content_type)
+    file_content = await file.read()
+    return await job_queue.submit(
+        file_content=file_content,
+        filename=file.filename or "unknown",
+        content_type=file.content_type
+    )
+
+@app.get("/jobs/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str, wait: float = Query(0.0, ge=0.0)):
+    if wait > 0:
+        job = await job_queue.wait(job_id, min(wait, settings.JOB_MAX_WAIT_SECONDS))
+    else:
+        job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def stream():
+        last_status = None
+        current = job
+        while current is not None:
+            if current.status.value in TERMINAL_STATUSES:
+                yield f"event: result\ndata: {current.model_dump_json()}\n\n"
+                return
+            if current.status != last_status:
+                last_status = current.status
+                yield f"event: status\ndata: {current.model_dump_json(exclude={'result'})}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            await job_queue.wait_for_change(job_id, settings.JOB_MAX_WAIT_SECONDS)
+            current = await job_queue.get(job_id)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.get("/entities/documents", response_model=EntitySearchResult)
+async def entity_documents(
+    kind: str = Query(..., description="phone, email, domain, company or amount"),
+    value: str = Query(...),
+    limit: int = Query(settings.ENTITY_QUERY_LIMIT, ge=1, le=1000)
+):
+    _require_entity_index()
+    if kind not in ENTITY_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(ENTITY_KINDS)}")
+    
+    result = await asyncio.to_thread(processor.entity_index.search, kind, value, limit)
+    if result is None:
+        raise HTTPException(status_code=400, detail=f"Not a valid {kind}: {value}")
+    return result
+
+@app.get("/documents/{file_id}/related", response_model=RelatedDocuments)
+async def related_documents(file_id: str, limit: int = Query(settings.ENTITY_QUERY_LIMIT, ge=1, le=1000)):
+    _require_entity_index()
+    result = await asyncio.to_thread(processor.entity_index.related, file_id, limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Document not indexed")
+    return result
+
+def _require_entity_index():
+    if processor.entity_index is None:
+        raise HTTPException(status_code=404, detail="Entity index is disabled")
+
+# Stored results were validated when they were written, so they go back out
+# as-is instead of through the response model again.
+@app.get("/results/{file_id}", response_model=ProcessingResult)
+async def stored_result(file_id: str):
+    _require_results_store()
+    result = await asyncio.to_thread(processor.results_store.get, file_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return Response(orjson.dumps(result), media_type="application/json")
+
+@app.get("/results", response_model=List[ProcessingResult])
+async def stored_results(
+    content_hash: str = Query(..., description="sha256 of the uploaded file"),
+    limit: int = Query(settings.ENTITY_QUERY_LIMIT, ge=1, le=1000)
+):
+    _require_results_store()
+    results = await asyncio.to_thread(processor.results_store.find_by_hash, content_hash.lower(), limit)
+    return Response(orjson.dumps(results), media_type="application/json")
+
+def _require_results_store():
+    if processor.results_store is None:
+        raise HTTPException(status_code=404, detail="Results store is disabled")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(
+        metrics.render_metrics(),
+        media_type="text/plain; version=0.0.4"
+    )
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
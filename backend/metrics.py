@@ -0,0 +1,246 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, values: LabelValues, extra: Optional[Dict[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, values)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        escaped = [
+            '{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for name, value in pairs
+        ]
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{self._format_labels(key)} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(
+                        f"{self.name}_bucket{self._format_labels(key, {'le': f'{bound:g}'})} {bucket_count}"
+                    )
+                lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': '+Inf'})} {count}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {total:g}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "docproc_stage_seconds", "Time spent per pipeline stage", ("stage",)
+)
+DOCUMENTS_TOTAL = Counter(
+    "docproc_documents_total", "Documents processed by category and outcome", ("category", "outcome")
+)
+DOCUMENTS_IN_FLIGHT = Gauge(
+    "docproc_documents_in_flight", "Documents currently being processed"
+)
+LLM_CALLS_IN_FLIGHT = Gauge(
+    "docproc_llm_calls_in_flight", "LLM calls currently waiting on the provider", ("model",)
+)
+LLM_REQUESTS_TOTAL = Counter(
+    "docproc_llm_requests_total", "LLM calls by model and status", ("model", "status")
+)
+LLM_TOKENS_TOTAL = Counter(
+    "docproc_llm_tokens_total", "Tokens reported in response.usage", ("model", "kind")
+)
+LLM_HEDGES_TOTAL = Counter(
+    "docproc_llm_hedges_total", "Hedged LLM calls by primary model and which call answered", ("model", "winner")
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "docproc_llm_queue_depth", "LLM calls waiting for a scheduler slot", ("lane",)
+)
+LLM_RATE_LIMIT = Gauge(
+    "docproc_llm_rate_limit_per_minute", "Current request/token budget (0 = unlimited)", ("kind",)
+)
+WARMUP_SECONDS = Gauge(
+    "docproc_warmup_seconds", "Time spent per startup warm-up step", ("step",)
+)
+SHARED_STATE_SYNCS_TOTAL = Counter(
+    "docproc_shared_state_syncs_total", "Scheduler budget syncs with the shared state store by status", ("status",)
+)
+ENTITY_INDEX_WRITES_TOTAL = Counter(
+    "docproc_entity_index_writes_total", "Entity index updates by status", ("status",)
+)
+RESULTS_STORE_WRITES_TOTAL = Counter(
+    "docproc_results_store_writes_total", "Results store appends by status", ("status",)
+)
+
+REGISTRY: List[_Metric] = [
+    STAGE_SECONDS,
+    DOCUMENTS_TOTAL,
+    DOCUMENTS_IN_FLIGHT,
+    LLM_CALLS_IN_FLIGHT,
+    LLM_REQUESTS_TOTAL,
+    LLM_TOKENS_TOTAL,
+    LLM_HEDGES_TOTAL,
+    LLM_QUEUE_DEPTH,
+    LLM_RATE_LIMIT,
+    WARMUP_SECONDS,
+    SHARED_STATE_SYNCS_TOTAL,
+    ENTITY_INDEX_WRITES_TOTAL,
+    RESULTS_STORE_WRITES_TOTAL
+]
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Per-document stats shared by every coroutine working on that document;
+# asyncio tasks copy the context, so chunked and hedged calls add to it too.
+_document_stats: ContextVar[Optional[dict]] = ContextVar("document_stats", default=None)
+
+
+def new_document_stats() -> dict:
+    return {"stages": {}, "usage": {}, "outcome": "ok", "model": None, "hedged": False}
+
+
+@contextmanager
+def document_context() -> Iterator[dict]:
+    stats = new_document_stats()
+    token = _document_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _document_stats.reset(token)
+
+
+def current_stats() -> Optional[dict]:
+    return _document_stats.get()
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    stats = _document_stats.get()
+    if stats is not None:
+        stats["stages"][name] = stats["stages"].get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_usage(model: str, usage) -> None:
+    if usage is None:
+        return
+    stats = _document_stats.get()
+    # Prompt tokens served from the provider's prefix cache are a subset of
+    # prompt_tokens, reported under prompt_tokens_details.
+    details = getattr(usage, "prompt_tokens_details", None)
+    counts = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", None) or 0
+    }
+    for kind, value in counts.items():
+        LLM_TOKENS_TOTAL.inc(value, model=model, kind=kind.replace("_tokens", ""))
+        if stats is not None:
+            stats["usage"][kind] = stats["usage"].get(kind, 0) + value
+
+
+def record_model(model: str, hedged: bool):
+    stats = _document_stats.get()
+    if stats is not None:
+        stats["model"] = model
+        stats["hedged"] = stats["hedged"] or hedged
+
+
+def mark_outcome(outcome: str):
+    stats = _document_stats.get()
+    if stats is not None and stats["outcome"] == "ok":
+        stats["outcome"] = outcome
+
+
+def reset_outcome():
+    # A cascade that escalates is judged by the tier that answers last.
+    stats = _document_stats.get()
+    if stats is not None:
+        stats["outcome"] = "ok"
@@ -0,0 +1,164 @@
+import sqlite3
+import threading
+import time
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from config import settings
+from shared_state import ForkSafeConnection
+
+HASH_BITS = 64
+CHUNK_COUNT = 4
+CHUNK_BITS = HASH_BITS // CHUNK_COUNT
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def dhash(image: Image.Image) -> int:
+    # Difference hash: one bit per horizontally adjacent pixel pair of a 9x8
+    # grayscale thumbnail, so recompression, rescaling and small local edits
+    # (a status bar clock) only flip a few bits.
+    small = image.convert('L').resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _flip_masks(radius: int) -> List[int]:
+    masks = [0]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), distance):
+            masks.append(sum(1 << bit for bit in bits))
+    return masks
+
+
+class MultiIndexHash:
+    # Each 64-bit hash is split into CHUNK_COUNT 16-bit chunks with one table
+    # per chunk. Two hashes within distance r agree to within r // CHUNK_COUNT
+    # bits on at least one chunk, so a lookup only probes those chunk
+    # neighbours and checks the few entries found there.
+
+    def __init__(self):
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(CHUNK_COUNT)]
+        self._keys: Dict[int, List[str]] = {}
+        self._size = 0
+        self._masks: Dict[int, List[int]] = {}
+
+    def add(self, value: int, key: str):
+        self._size += 1
+        keys = self._keys.get(value)
+        if keys is not None:
+            keys.append(key)
+            return
+
+        self._keys[value] = [key]
+        for index, table in enumerate(self._tables):
+            chunk = (value >> (index * CHUNK_BITS)) & CHUNK_MASK
+            bucket = table.get(chunk)
+            if bucket is None:
+                table[chunk] = [value]
+            else:
+                bucket.append(value)
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, str]]:
+        radius = max_distance // CHUNK_COUNT
+        masks = self._masks.get(radius)
+        if masks is None:
+            masks = self._masks[radius] = _flip_masks(radius)
+
+        found: Dict[int, int] = {}
+        for index, table in enumerate(self._tables):
+            chunk = (value >> (index * CHUNK_BITS)) & CHUNK_MASK
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if not bucket:
+                    continue
+                for candidate in bucket:
+                    distance = (candidate ^ value).bit_count()
+                    if distance <= max_distance:
+                        found[candidate] = distance
+        return sorted(
+            (distance, key) for candidate, distance in found.items() for key in self._keys[candidate]
+        )
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class PerceptualIndex:
+    def __init__(self, max_distance: Optional[int] = None, db_path: Optional[str] = None):
+        self.max_distance = max_distance if max_distance is not None else settings.PHASH_MAX_DISTANCE
+        self._index = MultiIndexHash()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._last_rowid = 0
+        self._cache_keys = set()
+        db_path = db_path if db_path is not None else settings.PHASH_INDEX_DB_PATH
+        if db_path:
+            self._connection = ForkSafeConnection(db_path, self._create_table)
+            with self._lock:
+                self._refresh()
+
+    @staticmethod
+    def _create_table(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS phash_index ("
+            "phash INTEGER NOT NULL, cache_key TEXT PRIMARY KEY, created_at REAL NOT NULL)"
+        )
+
+    def _refresh(self):
+        # Picks up rows added since the last refresh, including those written
+        # by other worker processes sharing the file.
+        if self._connection is None:
+            return
+        rows = self._connection.get().execute(
+            "SELECT rowid, phash, cache_key FROM phash_index WHERE rowid > ? ORDER BY rowid",
+            (self._last_rowid,)
+        )
+        for rowid, phash, cache_key in rows:
+            # SQLite integers are signed 64-bit.
+            self._add(phash & ((1 << HASH_BITS) - 1), cache_key)
+            self._last_rowid = rowid
+
+    def _add(self, phash: int, cache_key: str):
+        # A cache key is content-addressed, so its hash never changes; rows
+        # replaced under an older INSERT OR REPLACE come back with a new rowid.
+        if cache_key in self._cache_keys:
+            return
+        self._cache_keys.add(cache_key)
+        self._index.add(phash, cache_key)
+
+    def add(self, phash: int, cache_key: str):
+        # Blocking, and may wait on the file lock; callers on the event loop
+        # run it in a thread.
+        with self._lock:
+            if self._connection is None:
+                self._add(phash, cache_key)
+                return
+            signed = phash - (1 << HASH_BITS) if phash >= 1 << (HASH_BITS - 1) else phash
+            self._connection.get().execute(
+                "INSERT OR IGNORE INTO phash_index (phash, cache_key, created_at) VALUES (?, ?, ?)",
+                (signed, cache_key, time.time())
+            )
+            self._refresh()
+
+    def search(self, phash: int) -> List[Tuple[int, str]]:
+        with self._lock:
+            self._refresh()
+            return self._index.search(phash, self.max_distance)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
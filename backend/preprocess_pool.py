@@ -0,0 +1,110 @@
+import asyncio
+import os
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from config import settings
+
+
+class PreprocessError(Exception):
+    pass
+
+
+class PreprocessPool:
+    def __init__(
+        self,
+        kind: Optional[str] = None,
+        workers: Optional[int] = None,
+        max_task_bytes: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        self.kind = kind or settings.PREPROCESS_EXECUTOR
+        self.workers = workers or settings.PREPROCESS_WORKERS or os.cpu_count() or 1
+        self.max_task_bytes = max_task_bytes if max_task_bytes is not None else settings.PREPROCESS_MAX_TASK_BYTES
+        self.timeout = timeout if timeout is not None else settings.PREPROCESS_TIMEOUT
+        self._executor: Optional[Executor] = None
+        self._pid: Optional[int] = None
+        self._timed_out: "weakref.WeakSet[Executor]" = weakref.WeakSet()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.kind == "inline":
+            return None
+
+        if self._executor is None or self._pid != os.getpid():
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="preprocess"
+                )
+            self._pid = os.getpid()
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], file_content: bytes, *args: Any) -> Any:
+        if self.max_task_bytes and len(file_content) > self.max_task_bytes:
+            raise PreprocessError(
+                f"File too large to preprocess: {len(file_content)} bytes "
+                f"(limit {self.max_task_bytes})"
+            )
+
+        if self._get_executor() is None:
+            return fn(file_content, *args)
+
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.workers)
+            self._slots_loop = loop
+
+        crashed = False
+        while True:
+            # At most one task per worker is handed to the executor, so the
+            # timeout covers the task's own run and not a queue behind a hung one.
+            async with self._slots:
+                executor = self._get_executor()
+                try:
+                    return await self._submit(executor, fn, file_content, *args)
+                except BrokenProcessPool:
+                    # A pool terminated over another task's timeout says nothing
+                    # about this one, so it is resubmitted without counting as a
+                    # failure; a pool that crashed on its own is retried once.
+                    if executor not in self._timed_out:
+                        if crashed:
+                            raise
+                        crashed = True
+                    self._restart(executor)
+
+    async def _submit(self, executor: Executor, fn: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(executor, fn, *args),
+                timeout=self.timeout or None
+            )
+        except asyncio.TimeoutError:
+            self._timed_out.add(executor)
+            self._restart(executor)
+            raise PreprocessError(f"Preprocessing timed out after {self.timeout:g}s")
+
+    def _restart(self, executor: Executor):
+        if executor is not self._executor:
+            return
+
+        # Other running tasks are not cancelled: a thread pool still finishes
+        # them, and a terminated process pool fails them with BrokenProcessPool,
+        # which run() resubmits to the fresh pool.
+        self._executor = None
+        if isinstance(executor, ProcessPoolExecutor):
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        # Waits for the workers to exit; without that a forked worker can miss
+        # its stop signal and outlive the server.
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
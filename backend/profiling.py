@@ -0,0 +1,41 @@
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from config import settings
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+
+def profiling_enabled() -> bool:
+    return Profiler is not None and settings.PROFILE_SLOW_REQUESTS_SECONDS > 0
+
+
+@asynccontextmanager
+async def profile_if_slow(name: str) -> AsyncIterator[None]:
+    # Samples the request with pyinstrument and keeps the HTML report only
+    # when it ran longer than PROFILE_SLOW_REQUESTS_SECONDS.
+    if not profiling_enabled() or random.random() >= settings.PROFILE_SAMPLE_RATE:
+        yield
+        return
+
+    profiler = Profiler(interval=settings.PROFILE_INTERVAL, async_mode="enabled")
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        elapsed = time.perf_counter() - start
+        if elapsed >= settings.PROFILE_SLOW_REQUESTS_SECONDS:
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            path = os.path.join(
+                settings.PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{elapsed:.1f}s-{name}.html"
+            )
+            with open(path, "w") as f:
+                f.write(profiler.output_html())
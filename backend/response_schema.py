@@ -0,0 +1,167 @@
+import functools
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.models import ExtractedContent
+
+ENTITY_TYPES = [
+    "company_names",
+    "person_names",
+    "amounts",
+    "addresses",
+    "phone_numbers",
+    "email_addresses",
+    "urls",
+    "product_names",
+    "other_relevant"
+]
+
+CATEGORY_CODES = {
+    "inv": "invoice",
+    "mkt": "marketplace_listing_screenshot",
+    "chat": "chat_screenshot",
+    "web": "website_screenshot",
+    "other": "other"
+}
+
+ENTITY_CODES = {
+    "co": "company_names",
+    "pe": "person_names",
+    "am": "amounts",
+    "ad": "addresses",
+    "ph": "phone_numbers",
+    "em": "email_addresses",
+    "ur": "urls",
+    "pr": "product_names",
+    "ot": "other_relevant"
+}
+
+CATEGORY_NAMES = {name: code for code, name in CATEGORY_CODES.items()}
+ENTITY_NAMES = {name: code for code, name in ENTITY_CODES.items()}
+
+COMPACT_SYSTEM_PROMPT = """You are a document analysis expert specializing in categorization and content extraction for fraud prevention.
+
+Analyze the provided document and reply with a single minified JSON object using these short keys. Leave out any key whose value would be empty, null or unknown:
+{{"c":"category code","p":confidence 0.0-1.0,"e":{{"entity code":["values"]}},"d":["dates"],"t":"more specific document type","u":["urgency indicators"],"f":["fraud risk indicators"],"q":quality score 0.0-1.0{transcript}}}
+
+Category codes:
+- inv: invoice - bills, receipts, payment requests
+- mkt: marketplace listing screenshot - product listings from e-commerce sites
+- chat: chat screenshot - messaging apps, social media conversations
+- web: website screenshot - websites, web pages
+- other: documents that don't fit the above categories
+
+Entity codes: co company names, pe person names, am amounts, ad addresses, ph phone numbers, em email addresses, ur urls, pr product names, ot other relevant
+
+Focus on fraud prevention - look for suspicious patterns, inconsistencies, or red flags."""
+
+COMPACT_CHUNK_PROMPT = """You extract facts from one section of a longer document for fraud prevention.
+
+Reply with a single minified JSON object using these short keys, leaving out any key whose value would be empty:
+{"s":"one sentence describing this section","e":{"entity code":["values"]},"d":["dates"],"u":["urgency indicators"],"f":["fraud risk indicators"]}
+
+Entity codes: co company names, pe person names, am amounts, ad addresses, ph phone numbers, em email addresses, ur urls, pr product names, ot other relevant"""
+
+
+@functools.lru_cache(maxsize=None)
+def compact_system_prompt(transcript_chars: int) -> str:
+    transcript = ""
+    if transcript_chars > 0:
+        transcript = f',"x":"visible text, at most {transcript_chars} characters"'
+    return COMPACT_SYSTEM_PROMPT.format(transcript=transcript)
+
+
+def is_compact(data: Dict[str, Any]) -> bool:
+    return "extracted_content" not in data and "category" not in data
+
+
+def expand_category(value: Any) -> str:
+    category = str(value or "other").strip().lower()
+    return CATEGORY_CODES.get(category, category)
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def _expand_entities(entities: Any) -> Dict[str, List[Any]]:
+    expanded = {entity_type: [] for entity_type in ENTITY_TYPES}
+    if isinstance(entities, dict):
+        for code, values in entities.items():
+            expanded.setdefault(ENTITY_CODES.get(code, code), []).extend(_as_list(values))
+    return expanded
+
+
+def expand_analysis(
+    data: Dict[str, Any],
+    source_text: str = "",
+    transcript_chars: int = 0
+) -> Dict[str, Any]:
+    if not is_compact(data):
+        return data
+
+    text = data.get("x") or ""
+    if not text and source_text and transcript_chars > 0:
+        text = source_text[:transcript_chars]
+
+    extracted_content = ExtractedContent(
+        text=text,
+        key_entities=_expand_entities(data.get("e")),
+        dates=_as_list(data.get("d")),
+        metadata={
+            "document_type": data.get("t") or "unknown",
+            "urgency_indicators": _as_list(data.get("u")),
+            "fraud_risk_indicators": _as_list(data.get("f")),
+            "quality_score": data.get("q", 0.0)
+        }
+    )
+    return {
+        "category": expand_category(data.get("c")),
+        "confidence": data.get("p", 0.0),
+        "extracted_content": extracted_content.model_dump()
+    }
+
+
+def expand_chunk(data: Dict[str, Any]) -> Dict[str, Any]:
+    if "key_entities" in data or "summary" in data:
+        return data
+    return {
+        "summary": data.get("s") or "",
+        "key_entities": _expand_entities(data.get("e")),
+        "dates": _as_list(data.get("d")),
+        "urgency_indicators": _as_list(data.get("u")),
+        "fraud_risk_indicators": _as_list(data.get("f"))
+    }
+
+
+def compact_analysis(analysis: Dict[str, Any], transcript_chars: int = 0) -> Dict[str, Any]:
+    extracted_content = analysis.get("extracted_content") or {}
+    metadata = extracted_content.get("metadata") or {}
+    category = str(analysis.get("category", "other"))
+    compact: Dict[str, Any] = {
+        "c": CATEGORY_NAMES.get(category, category),
+        "p": analysis.get("confidence", 0.0)
+    }
+    entities = {
+        ENTITY_NAMES.get(entity_type, entity_type): values
+        for entity_type, values in (extracted_content.get("key_entities") or {}).items()
+        if values
+    }
+    optional: Dict[str, Optional[Any]] = {
+        "e": entities,
+        "d": extracted_content.get("dates"),
+        "t": metadata.get("document_type"),
+        "u": metadata.get("urgency_indicators"),
+        "f": metadata.get("fraud_risk_indicators"),
+        "q": metadata.get("quality_score"),
+        "x": (extracted_content.get("text") or "")[:transcript_chars] if transcript_chars > 0 else None
+    }
+    compact.update({key: value for key, value in optional.items() if value not in (None, "", [], {})})
+    return compact
@@ -0,0 +1,259 @@
+import asyncio
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+
+from config import settings
+from shared_state import ForkSafeConnection
+
+LEASE_POLL_INTERVAL = 0.25
+LEASED, BUSY, STORED = "leased", "busy", "stored"
+
+
+def make_cache_key(content_hash: str, model: str, prompt_version: str) -> str:
+    # content_hash is the SHA-256 hex digest of the file.
+    return f"{content_hash}:{model}:{prompt_version}"
+
+
+class MemoryLRU:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        stored_at, value = entry
+        if self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], stored_at: Optional[float] = None):
+        self._entries[key] = (stored_at or time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteResultStore:
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.connection = ForkSafeConnection(path, self._create_tables)
+        self._lock = self.connection.lock
+        self.connection.get()
+        self._writes_since_evict = 0
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        return self.connection.get()
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS result_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_result_cache_accessed ON result_cache (accessed_at)"
+        )
+        # Marks a key some process is computing, so workers sharing the file
+        # wait for its result instead of calling the LLM again.
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS result_cache_leases ("
+            "key TEXT PRIMARY KEY, owner INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM result_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds > 0 and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+                return None
+
+            self._conn.execute(
+                "UPDATE result_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return created_at, orjson.loads(value)
+
+    def set(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_cache (key, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, orjson.dumps(value).decode(), now, now)
+            )
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= 100:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        self._writes_since_evict = 0
+        if self.ttl_seconds > 0:
+            self._conn.execute(
+                "DELETE FROM result_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+        self._conn.execute(
+            "DELETE FROM result_cache WHERE key IN ("
+            "SELECT key FROM result_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def try_lease(self, key: str, seconds: float) -> str:
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT 1 FROM result_cache WHERE key = ?", (key,)).fetchone():
+                    state = STORED
+                elif conn.execute(
+                    "SELECT 1 FROM result_cache_leases WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone():
+                    state = BUSY
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO result_cache_leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                        (key, os.getpid(), now + seconds)
+                    )
+                    state = LEASED
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return state
+
+    def release_lease(self, key: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM result_cache_leases WHERE key = ? AND owner = ?", (key, os.getpid())
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+class ResultCache:
+    def __init__(self):
+        self.memory = MemoryLRU(
+            settings.RESULT_CACHE_MAX_ENTRIES, settings.RESULT_CACHE_TTL_SECONDS
+        )
+        self.disk = None
+        if settings.RESULT_CACHE_DB_PATH:
+            self.disk = SQLiteResultStore(
+                settings.RESULT_CACHE_DB_PATH,
+                settings.RESULT_CACHE_DB_MAX_ENTRIES,
+                settings.RESULT_CACHE_TTL_SECONDS
+            )
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self.disk is not None:
+            entry = await asyncio.to_thread(self.disk.get, key)
+            if entry is not None:
+                stored_at, value = entry
+                self.memory.set(key, value, stored_at)
+                return value
+
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+        should_store: Callable[[Dict[str, Any]], bool] = lambda value: True
+    ) -> Tuple[Dict[str, Any], bool]:
+        while True:
+            value = await self.get(key)
+            if value is not None:
+                return value, True
+
+            # The inflight future resolves to (value, stored): waiters only count
+            # as hits when the value they share actually went into the cache.
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # A cancelled leader (a client that went away) is not this
+                # caller's cancellation; take over the computation instead.
+                if not inflight.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        leased = False
+        try:
+            if self.disk is not None:
+                value = await self._lease(key)
+                if value is not None:
+                    future.set_result((value, True))
+                    return value, True
+                leased = True
+
+            value = await compute()
+            stored = should_store(value)
+            if stored:
+                await self.set(key, value)
+            future.set_result((value, stored))
+            return value, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+            if leased:
+                await asyncio.to_thread(self.disk.release_lease, key)
+
+    async def _lease(self, key: str) -> Optional[Dict[str, Any]]:
+        # Returns the value if another process stores it while we wait, or
+        # None once this process holds the lease and should compute it. A
+        # lease left by a crashed worker expires after RESULT_CACHE_LEASE_SECONDS.
+        while True:
+            state = await asyncio.to_thread(
+                self.disk.try_lease, key, settings.RESULT_CACHE_LEASE_SECONDS
+            )
+            if state == LEASED:
+                return None
+            if state == STORED:
+                value = await self.get(key)
+                if value is not None:
+                    return value
+                continue
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
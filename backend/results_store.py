@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import msgpack
+import orjson
+import zstandard
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from shared_state import ForkSafeConnection
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".rz"
+DICTIONARY_PREFIX = "dictionary-"
+DICTIONARY_BYTES = 64 * 1024
+# Each record is a little-endian length followed by one zstd frame holding
+# msgpack [content_hash, stored_at, result].
+HEADER = struct.Struct("<I")
+
+
+def segment_name(segment: int) -> str:
+    return f"{SEGMENT_PREFIX}{segment:05d}{SEGMENT_SUFFIX}"
+
+
+class ResultsStore:
+    # Append-only segment files plus an SQLite index of (segment, offset,
+    # length) by file_id and content hash. Writers take the index's write
+    # lock before appending, so processes sharing a directory never
+    # interleave records, and the append offset always comes from the index:
+    # bytes a crashed writer left past the last indexed record are cut off.
+    # Results are small and alike, so once RESULTS_STORE_DICT_SAMPLES exist
+    # a zstd dictionary is trained on them in a background thread (or with
+    # the train command); frames name the dictionary they need, so records
+    # written before it stay readable. Workers that start training at the
+    # same moment may each save one, which costs nothing but a file.
+    # Whole segments are dropped once they are older than
+    # RESULTS_STORE_RETENTION_DAYS or the store outgrows RESULTS_STORE_MAX_BYTES.
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory if directory is not None else settings.RESULTS_STORE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.connection = ForkSafeConnection(os.path.join(self.directory, "index.db"), self._create_tables)
+        self._lock = self.connection.lock
+        self._pid: Optional[int] = None
+        self._writer: Optional[Tuple[int, Any]] = None
+        self._readers: Dict[int, int] = {}
+        self._dictionaries: Dict[int, zstandard.ZstdCompressionDict] = {}
+        self._decompressors: Dict[int, zstandard.ZstdDecompressor] = {0: zstandard.ZstdDecompressor()}
+        self._compressor = zstandard.ZstdCompressor(level=settings.RESULTS_STORE_ZSTD_LEVEL)
+        self._trainer: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "seq INTEGER PRIMARY KEY, file_id TEXT NOT NULL, content_hash TEXT, "
+            "segment INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, "
+            "stored_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_file_id ON results (file_id, seq)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_content_hash ON results (content_hash, seq)")
+
+    def append(self, result: Dict[str, Any], content_hash: Optional[str] = None):
+        # result is a ProcessingResult dumped with mode="json".
+        stored_at = time.time()
+        payload = msgpack.packb([content_hash, stored_at, result])
+        with self._lock:
+            conn = self.connection.get()
+            self._check_fork()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._load_dictionaries()
+                frame = self._compressor.compress(payload)
+                segment, offset = self._append_frame(conn, frame)
+                seq = conn.execute(
+                    "INSERT INTO results (file_id, content_hash, segment, offset, length, stored_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (result["file_id"], content_hash, segment, offset, len(frame), stored_at)
+                ).lastrowid
+                pruned = self._prune(conn, segment) if offset == HEADER.size else []
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._remove_segments(pruned)
+            if not self._dictionaries and seq >= settings.RESULTS_STORE_DICT_SAMPLES > 0:
+                self._start_training()
+
+    def _append_frame(self, conn: sqlite3.Connection, frame: bytes) -> Tuple[int, int]:
+        row = conn.execute(
+            "SELECT segment, offset + length FROM results ORDER BY seq DESC LIMIT 1"
+        ).fetchone()
+        segment, end = row if row else (0, 0)
+        if end >= settings.RESULTS_STORE_SEGMENT_BYTES:
+            segment, end = segment + 1, 0
+
+        if self._writer is None or self._writer[0] != segment:
+            if self._writer is not None:
+                self._writer[1].close()
+            fd = os.open(os.path.join(self.directory, segment_name(segment)), os.O_RDWR | os.O_CREAT, 0o644)
+            self._writer = (segment, os.fdopen(fd, "r+b"))
+        handle = self._writer[1]
+        if os.fstat(handle.fileno()).st_size != end:
+            handle.truncate(end)
+        handle.seek(end)
+        handle.write(HEADER.pack(len(frame)) + frame)
+        handle.flush()
+        if settings.RESULTS_STORE_FSYNC:
+            os.fsync(handle.fileno())
+        return segment, end + HEADER.size
+
+    def _prune(self, conn: sqlite3.Connection, current: int) -> List[int]:
+        # Runs when a new segment is started; returns the segments dropped
+        # from the index, oldest first, never the one being written.
+        segments = conn.execute(
+            "SELECT segment, MAX(stored_at), SUM(length) FROM results WHERE segment < ? "
+            "GROUP BY segment ORDER BY segment",
+            (current,)
+        ).fetchall()
+        total = sum(size for _, _, size in segments)
+        cutoff = time.time() - settings.RESULTS_STORE_RETENTION_DAYS * 86400
+        pruned = []
+        for segment, newest, size in segments:
+            expired = settings.RESULTS_STORE_RETENTION_DAYS > 0 and newest < cutoff
+            oversized = 0 < settings.RESULTS_STORE_MAX_BYTES < total
+            if not (expired or oversized):
+                break
+            conn.execute("DELETE FROM results WHERE segment = ?", (segment,))
+            total -= size
+            pruned.append(segment)
+        return pruned
+
+    def _remove_segments(self, segments: List[int]):
+        for segment in segments:
+            fd = self._readers.pop(segment, None)
+            if fd is not None:
+                os.close(fd)
+            try:
+                os.remove(os.path.join(self.directory, segment_name(segment)))
+            except FileNotFoundError:
+                pass
+
+    def prune(self) -> List[int]:
+        with self._lock:
+            conn = self.connection.get()
+            self._check_fork()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT MAX(segment) FROM results").fetchone()
+                pruned = self._prune(conn, row[0] if row[0] is not None else 0)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._remove_segments(pruned)
+        return pruned
+
+    def _start_training(self):
+        if self._trainer is None or not self._trainer.is_alive():
+            self._trainer = threading.Thread(target=self._train_quietly, daemon=True)
+            self._trainer.start()
+
+    def _train_quietly(self):
+        # A failed background training is retried by a later append.
+        try:
+            self.train_dictionary()
+        except (sqlite3.Error, OSError, zstandard.ZstdError):
+            pass
+
+    def train_dictionary(self) -> Optional[int]:
+        # Reads the samples under the lock and trains outside it, so appends
+        # carry on meanwhile.
+        with self._lock:
+            self._check_fork()
+            self._load_dictionaries()
+            if self._dictionaries:
+                return min(self._dictionaries)
+            rows = self.connection.get().execute(
+                "SELECT segment, offset, length FROM results ORDER BY seq DESC LIMIT ?",
+                (max(settings.RESULTS_STORE_DICT_SAMPLES, 1),)
+            ).fetchall()
+            samples = [self._decompress(self._read(*row)) for row in rows]
+        if not samples:
+            return None
+        dictionary = zstandard.train_dictionary(DICTIONARY_BYTES, samples)
+        path = os.path.join(self.directory, f"{DICTIONARY_PREFIX}{dictionary.dict_id()}.zdict")
+        # The background trainer and an explicit call can race in one process.
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as handle:
+            handle.write(dictionary.as_bytes())
+            os.fsync(handle.fileno())
+        os.replace(temporary, path)
+        with self._lock:
+            self._load_dictionaries()
+            return min(self._dictionaries)
+
+    def _load_dictionaries(self, rescan: bool = False):
+        # Another process may have trained a dictionary since we looked. Once
+        # one is loaded, only a frame naming an unknown one rescans: workers
+        # that trained at the same moment each wrote their own.
+        if self._dictionaries and not rescan:
+            return
+        loaded = False
+        for path in glob.glob(os.path.join(self.directory, f"{DICTIONARY_PREFIX}*.zdict")):
+            name = os.path.basename(path)[len(DICTIONARY_PREFIX):-len(".zdict")]
+            if name.isdigit() and int(name) in self._dictionaries:
+                continue
+            with open(path, "rb") as handle:
+                dictionary = zstandard.ZstdCompressionDict(handle.read())
+            self._dictionaries[dictionary.dict_id()] = dictionary
+            self._decompressors[dictionary.dict_id()] = zstandard.ZstdDecompressor(dict_data=dictionary)
+            loaded = True
+        if loaded:
+            # Every worker settles on the lowest id, so they converge on one.
+            dictionary = self._dictionaries[min(self._dictionaries)]
+            self._compressor = zstandard.ZstdCompressor(
+                level=settings.RESULTS_STORE_ZSTD_LEVEL, dict_data=dictionary
+            )
+
+    def _decompress(self, frame: bytes) -> bytes:
+        dict_id = zstandard.get_frame_parameters(frame).dict_id
+        if dict_id not in self._decompressors:
+            self._load_dictionaries(rescan=True)
+        decompressor = self._decompressors.get(dict_id)
+        if decompressor is None:
+            raise ValueError(f"Record needs zstd dictionary {dict_id}, which is missing from {self.directory}")
+        return decompressor.decompress(frame)
+
+    def _check_fork(self):
+        # File descriptors inherited across fork() share their offsets.
+        if self._pid != os.getpid():
+            self._writer = None
+            self._readers = {}
+            self._pid = os.getpid()
+
+    def _read(self, segment: int, offset: int, length: int) -> bytes:
+        fd = self._readers.get(segment)
+        if fd is None:
+            fd = os.open(os.path.join(self.directory, segment_name(segment)), os.O_RDONLY)
+            self._readers[segment] = fd
+        return os.pread(fd, length, offset)
+
+    def _load(self, segment: int, offset: int, length: int) -> Tuple[Optional[str], float, Dict[str, Any]]:
+        return tuple(msgpack.unpackb(self._decompress(self._read(segment, offset, length))))
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        # The latest result stored for file_id.
+        with self._lock:
+            self._check_fork()
+            row = self.connection.get().execute(
+                "SELECT segment, offset, length FROM results WHERE file_id = ? ORDER BY seq DESC LIMIT 1",
+                (file_id,)
+            ).fetchone()
+            return self._load(*row)[2] if row else None
+
+    def find_by_hash(self, content_hash: str, limit: int) -> List[Dict[str, Any]]:
+        # Every stored result for the same file content, newest first.
+        with self._lock:
+            self._check_fork()
+            rows = self.connection.get().execute(
+                "SELECT segment, offset, length FROM results WHERE content_hash = ? ORDER BY seq DESC LIMIT ?",
+                (content_hash, limit)
+            ).fetchall()
+            return [self._load(*row)[2] for row in rows]
+
+    def iter_records(self, latest_only: bool = False) -> Iterator[Tuple[Optional[str], float, Dict[str, Any]]]:
+        # In storage order, which reads each segment front to back.
+        query = "SELECT segment, offset, length FROM results ORDER BY seq"
+        if latest_only:
+            query = (
+                "SELECT segment, offset, length FROM results WHERE seq IN "
+                "(SELECT MAX(seq) FROM results GROUP BY file_id) ORDER BY seq"
+            )
+        with self._lock:
+            rows = self.connection.get().execute(query).fetchall()
+        for row in rows:
+            with self._lock:
+                self._check_fork()
+                yield self._load(*row)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            records, file_ids, stored_bytes = self.connection.get().execute(
+                "SELECT COUNT(*), COUNT(DISTINCT file_id), COALESCE(SUM(length), 0) FROM results"
+            ).fetchone()
+        segment_bytes = sum(
+            os.path.getsize(path)
+            for path in glob.glob(os.path.join(self.directory, f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+        )
+        return {
+            "records": records,
+            "file_ids": file_ids,
+            "segment_bytes": segment_bytes,
+            "bytes_per_record": round(segment_bytes / records, 1) if records else 0.0,
+            "dictionary": bool(self._dictionaries or glob.glob(
+                os.path.join(self.directory, f"{DICTIONARY_PREFIX}*.zdict")
+            ))
+        }
+
+    def reindex(self) -> int:
+        # Rebuilds the index from the segments, e.g. after losing index.db.
+        # A torn record at the end of a segment ends that segment.
+        rows = []
+        self._load_dictionaries(rescan=True)
+        for path in sorted(glob.glob(os.path.join(self.directory, f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))):
+            segment = int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            with open(path, "rb") as handle:
+                data = handle.read()
+            position = 0
+            while position + HEADER.size <= len(data):
+                (length,) = HEADER.unpack_from(data, position)
+                frame = data[position + HEADER.size:position + HEADER.size + length]
+                try:
+                    content_hash, stored_at, result = msgpack.unpackb(self._decompress(frame))
+                except (zstandard.ZstdError, ValueError, KeyError, TypeError):
+                    break
+                rows.append((result["file_id"], content_hash, segment, position + HEADER.size, length, stored_at))
+                position += HEADER.size + length
+
+        with self._lock:
+            conn = self.connection.get()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM results")
+                conn.executemany(
+                    "INSERT INTO results (file_id, content_hash, segment, offset, length, stored_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                if self._writer is not None:
+                    self._writer[1].close()
+                for fd in self._readers.values():
+                    os.close(fd)
+            self._writer = None
+            self._readers = {}
+        self.connection.close()
+
+
+def export_jsonl(store: ResultsStore, output, latest_only: bool) -> int:
+    count = 0
+    for content_hash, stored_at, result in store.iter_records(latest_only):
+        output.write(orjson.dumps({"content_hash": content_hash, "stored_at": stored_at, "result": result}))
+        output.write(b"\n")
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, export or reindex the results store")
+    parser.add_argument("--dir", default=settings.RESULTS_STORE_DIR, help="results store directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write stored results as JSONL")
+    export.add_argument("--output", default="-", help="file to write (default: stdout)")
+    export.add_argument("--latest", action="store_true", help="only the latest result per file_id")
+    get = commands.add_parser("get", help="print the latest result for a file_id")
+    get.add_argument("file_id")
+    commands.add_parser("stats", help="record count and bytes per stored result")
+    commands.add_parser("reindex", help="rebuild index.db from the segment files")
+    commands.add_parser("train", help="train the compression dictionary now")
+    commands.add_parser("prune", help="drop segments past the retention limits")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.dir)
+    try:
+        if args.command == "export":
+            if args.output == "-":
+                count = export_jsonl(store, sys.stdout.buffer, args.latest)
+            else:
+                with open(args.output, "wb") as output:
+                    count = export_jsonl(store, output, args.latest)
+            print(f"Exported {count} results", file=sys.stderr)
+        elif args.command == "get":
+            result = store.get(args.file_id)
+            if result is None:
+                sys.exit(f"No result stored for {args.file_id}")
+            sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_INDENT_2) + b"\n")
+        elif args.command == "stats":
+            sys.stdout.buffer.write(orjson.dumps(store.stats(), option=orjson.OPT_INDENT_2) + b"\n")
+        elif args.command == "train":
+            dict_id = store.train_dictionary()
+            print(f"Dictionary {dict_id}" if dict_id else "No results stored yet", file=sys.stderr)
+        elif args.command == "prune":
+            pruned = store.prune()
+            print(f"Dropped {len(pruned)} segments", file=sys.stderr)
+        else:
+            print(f"Indexed {store.reindex()} results", file=sys.stderr)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
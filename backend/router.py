@@ -0,0 +1,241 @@
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from config import settings
+import metrics
+from llm_client import LLMClient, ENTITY_TYPES
+
+TIER_HEURISTIC = "heuristic"
+TIER_SMALL_MODEL = "small_model"
+TIER_LARGE_MODEL = "large_model"
+
+INVOICE_PATTERNS = [
+    r"\binvoice\b",
+    r"\binvoice (?:no|number|#|date)\b",
+    r"\bbill(?:ed)? to\b",
+    r"\b(?:amount|balance|total) due\b",
+    r"\bdue date\b",
+    r"\bsub-?total\b",
+    r"\b(?:vat|gst|sales tax)\b",
+    r"\btaxable amount\b",
+    r"\b(?:qty|quantity)\b",
+    r"\b(?:unit )?price\b",
+    r"\bpayment terms\b",
+    r"\b(?:iban|swift|bic|sort code)\b",
+    r"\breceipt\b"
+]
+
+ENTITY_PATTERNS = {
+    "email_addresses": r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+",
+    "urls": r"\b(?:https?://|www\.)[^\s<>\"']+",
+    "phone_numbers": r"(?<![\w/.])\+?\d[\d\s().-]{7,}\d(?![\w/])",
+    "amounts": r"(?:[€$£]\s*\d[\d.,]*|\d[\d.,]*\s?(?:EUR|USD|GBP|USDT)\b)"
+}
+
+# Heuristic answers read no content for risk: they say so instead of looking
+# like a clean, high-quality analysis.
+FRAUD_ANALYSIS_SKIPPED = "skipped"
+HEURISTIC_QUALITY_SCORE = 0.5
+
+DATE_PATTERN = (
+    r"\b(?:\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{4}-\d{2}-\d{2}|"
+    r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]* \d{1,2}(?:, \d{4})?)\b"
+)
+
+
+def threshold_for(thresholds: Dict[str, float], category: str) -> float:
+    return float(thresholds.get(category, thresholds.get("default", 1.0)))
+
+
+class HeuristicClassifier:
+    def __init__(self):
+        self._invoice_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in INVOICE_PATTERNS]
+        self._entity_patterns = {
+            entity_type: re.compile(pattern, re.IGNORECASE)
+            for entity_type, pattern in ENTITY_PATTERNS.items()
+        }
+        self._date_pattern = re.compile(DATE_PATTERN, re.IGNORECASE)
+
+    def classify_text(self, text: str) -> Tuple[str, float]:
+        if not text.strip():
+            return "other", 0.0
+
+        matches = sum(1 for pattern in self._invoice_patterns if pattern.search(text))
+        if matches >= 6:
+            return "invoice", 0.97
+        if matches >= 4:
+            return "invoice", 0.85
+        if matches >= 2:
+            return "invoice", 0.6
+        return "other", 0.3
+
+    def classify_image(self, width: int, height: int) -> Tuple[str, float]:
+        if not width or not height:
+            return "other", 0.0
+
+        aspect_ratio = height / width
+        if aspect_ratio >= 1.7:
+            return "chat_screenshot", 0.6
+        if aspect_ratio <= 0.75:
+            return "website_screenshot", 0.5
+        return "other", 0.2
+
+    def extract(self, text: str, category: str, confidence: float) -> Dict[str, Any]:
+        key_entities: Dict[str, List[str]] = {entity_type: [] for entity_type in ENTITY_TYPES}
+        for entity_type, pattern in self._entity_patterns.items():
+            key_entities[entity_type] = list(dict.fromkeys(
+                match.group().strip() for match in pattern.finditer(text)
+            ))
+
+        return {
+            "category": category,
+            "confidence": confidence,
+            "extracted_content": {
+                "text": text[:1000],
+                "key_entities": key_entities,
+                "dates": list(dict.fromkeys(
+                    match.group() for match in self._date_pattern.finditer(text)
+                )),
+                "metadata": {
+                    "document_type": category,
+                    "urgency_indicators": [],
+                    "fraud_risk_indicators": [],
+                    "fraud_analysis": FRAUD_ANALYSIS_SKIPPED,
+                    "quality_score": HEURISTIC_QUALITY_SCORE if text.strip() else 0.0
+                }
+            }
+        }
+
+
+class ModelRouter:
+    def __init__(self, llm_client: LLMClient, classifier: Optional[HeuristicClassifier] = None):
+        self.llm_client = llm_client
+        self.classifier = classifier or HeuristicClassifier()
+        self.enabled = settings.ROUTER_ENABLED
+        self.small_model = settings.SMALL_MODEL
+        self.heuristic_thresholds = settings.ROUTER_HEURISTIC_THRESHOLDS
+        self.small_model_thresholds = settings.ROUTER_SMALL_MODEL_THRESHOLDS
+
+    def cache_namespace(self, is_image: bool) -> str:
+        large_model = self.llm_client.vision_model if is_image else self.llm_client.text_model
+        if not self.enabled:
+            return large_model
+        return f"{self.small_model}>{large_model}"
+
+    async def analyze_text(self, text: str) -> Tuple[Dict[str, Any], str]:
+        if self.enabled:
+            category, confidence = self.classifier.classify_text(text)
+            if confidence >= threshold_for(self.heuristic_thresholds, category):
+                return self.classifier.extract(text, category, confidence), TIER_HEURISTIC
+
+        if len(text) > settings.LONG_DOCUMENT_TOKENS * settings.CHARS_PER_TOKEN:
+            return await self.llm_client.analyze_long_document(text), TIER_LARGE_MODEL
+
+        if self.enabled:
+            analysis = await self.llm_client.analyze_document(
+                content=text, is_image=False, model=self.small_model
+            )
+            if self._is_confident(analysis):
+                return analysis, TIER_SMALL_MODEL
+            metrics.reset_outcome()
+
+        return await self.llm_client.analyze_document(content=text, is_image=False), TIER_LARGE_MODEL
+
+    async def analyze_image(
+        self, base64_images: List[str], width: int, height: int,
+        text: str = "", pdf_pages: Optional[List[int]] = None
+    ) -> Tuple[Dict[str, Any], str]:
+        if self.enabled:
+            category, confidence = self.classifier.classify_image(width, height)
+            if confidence >= threshold_for(self.heuristic_thresholds, category):
+                return self.classifier.extract(text, category, confidence), TIER_HEURISTIC
+
+            analysis = await self.llm_client.analyze_document(
+                content=text, is_image=True, base64_images=base64_images,
+                model=self.small_model, pdf_pages=pdf_pages
+            )
+            if self._is_confident(analysis):
+                return analysis, TIER_SMALL_MODEL
+            metrics.reset_outcome()
+
+        analysis = await self.llm_client.analyze_document(
+            content=text, is_image=True, base64_images=base64_images, pdf_pages=pdf_pages
+        )
+        return analysis, TIER_LARGE_MODEL
+
+    async def stream_text(self, text: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        if self.enabled:
+            category, confidence = self.classifier.classify_text(text)
+            if confidence >= threshold_for(self.heuristic_thresholds, category):
+                yield "analysis", {
+                    "analysis": self.classifier.extract(text, category, confidence),
+                    "model_tier": TIER_HEURISTIC
+                }
+                return
+
+        if len(text) > settings.LONG_DOCUMENT_TOKENS * settings.CHARS_PER_TOKEN:
+            yield "analysis", {
+                "analysis": await self.llm_client.analyze_long_document(text),
+                "model_tier": TIER_LARGE_MODEL
+            }
+            return
+
+        async for event in self._stream_cascade(content=text, is_image=False):
+            yield event
+
+    async def stream_image(
+        self, base64_images: List[str], width: int, height: int,
+        text: str = "", pdf_pages: Optional[List[int]] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        if self.enabled:
+            category, confidence = self.classifier.classify_image(width, height)
+            if confidence >= threshold_for(self.heuristic_thresholds, category):
+                yield "analysis", {
+                    "analysis": self.classifier.extract(text, category, confidence),
+                    "model_tier": TIER_HEURISTIC
+                }
+                return
+
+        async for event in self._stream_cascade(
+            content=text, is_image=True, base64_images=base64_images, pdf_pages=pdf_pages
+        ):
+            yield event
+
+    async def _stream_cascade(self, **kwargs) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        # The small model's stream is abandoned as soon as its category comes
+        # back below threshold, so escalation costs little more than the
+        # time to the first few tokens. Its final answer can still miss the
+        # threshold after events went out; an "escalated" event then tells
+        # the client to discard them.
+        if self.enabled:
+            stream = self.llm_client.stream_document(model=self.small_model, **kwargs)
+            sent = False
+            try:
+                async for event, data in stream:
+                    if event == "analysis":
+                        if self._is_confident(data):
+                            yield "analysis", {"analysis": data, "model_tier": TIER_SMALL_MODEL}
+                            return
+                        break
+                    if event == "category" and not self._is_confident(data):
+                        break
+                    sent = True
+                    yield event, data
+            finally:
+                await stream.aclose()
+            metrics.reset_outcome()
+            if sent:
+                yield "escalated", {"model_tier": TIER_LARGE_MODEL}
+
+        async for event, data in self.llm_client.stream_document(**kwargs):
+            if event == "analysis":
+                data = {"analysis": data, "model_tier": TIER_LARGE_MODEL}
+            yield event, data
+
+    def _is_confident(self, analysis: Dict[str, Any]) -> bool:
+        category = str(analysis.get("category", "other")).lower()
+        try:
+            confidence = float(analysis.get("confidence", 0.0))
+        except (TypeError, ValueError):
+            return False
+        return confidence >= threshold_for(self.small_model_thresholds, category)
@@ -0,0 +1,87 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+class ForkSafeConnection:
+    # SQLite connections must not cross fork(). With a preloaded app the
+    # stores are built in the master, so each process opens its own
+    # connection on first use.
+
+    def __init__(self, path: str, on_connect=None):
+        self.path = path
+        self.on_connect = on_connect
+        self.lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def get(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None, timeout=10
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+            if self.on_connect is not None:
+                self.on_connect(self._conn)
+        return self._conn
+
+    def close(self):
+        with self.lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class SharedStateStore:
+    # Small named JSON records shared by every worker process on the host,
+    # updated under BEGIN IMMEDIATE so read-modify-write cycles are atomic.
+    # Transactions nest, so several records can be changed together.
+
+    def __init__(self, path: str):
+        self.connection = ForkSafeConnection(path, self._create_table)
+        self._depth = 0
+
+    @staticmethod
+    def _create_table(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_state (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self.connection.lock:
+            conn = self.connection.get()
+            outermost = self._depth == 0
+            if outermost:
+                conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield conn
+            except BaseException:
+                self._depth -= 1
+                if outermost:
+                    conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if outermost:
+                conn.execute("COMMIT")
+
+    @contextmanager
+    def record(self, name: str) -> Iterator[Dict[str, Any]]:
+        # Yields the stored dict (empty if absent); changes are written back.
+        with self.transaction() as conn:
+            row = conn.execute("SELECT value FROM shared_state WHERE name = ?", (name,)).fetchone()
+            value = json.loads(row[0]) if row else {}
+            yield value
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_state (name, value) VALUES (?, ?)",
+                (name, json.dumps(value))
+            )
+
+    def close(self):
+        self.connection.close()
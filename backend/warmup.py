@@ -0,0 +1,92 @@
+import asyncio
+import io
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from PIL import Image, ImageDraw
+
+from file_processor import FileProcessor
+from config import settings
+import metrics
+
+
+def sample_files() -> Dict[str, bytes]:
+    # A tiny screenshot-like image and a one-page scanned PDF, enough to load the
+    # Pillow codecs, PyPDF2 parser and pdfium renderer the first real upload
+    # would otherwise pay for.
+    image = Image.new("RGB", (320, 200), "white")
+    ImageDraw.Draw(image).text((16, 16), "Invoice 0001 total 10.00", fill="black")
+    png = io.BytesIO()
+    image.save(png, format="PNG")
+    pdf = io.BytesIO()
+    image.save(pdf, format="PDF")
+    return {"image/png": png.getvalue(), "application/pdf": pdf.getvalue()}
+
+
+class Warmup:
+    # Runs once per process after startup; /ready reports 503 until it has
+    # finished and again once shutdown begins. The LLM connection is
+    # required: a worker that cannot reach the provider answers nothing, so
+    # that step is retried and readiness waits for it. Other failed steps
+    # are reported but do not hold readiness back.
+
+    def __init__(self, processor):
+        self.processor = processor
+        self.ready = False
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="warmup")
+
+    async def stop(self):
+        self.ready = False
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def status(self) -> Dict[str, Any]:
+        return {"status": "ready" if self.ready else "warming_up", "warmup": self.steps}
+
+    async def _run(self):
+        start_time = time.perf_counter()
+        if settings.WARMUP_ENABLED:
+            if settings.WARMUP_FILES:
+                files = sample_files()
+                # In this process first, so process-pool workers forked
+                # afterwards inherit the loaded modules.
+                await self._step("file_processing", lambda: asyncio.to_thread(self._process_files, files))
+                await self._step("preprocess_pool", lambda: self.processor.preprocess_pool.run(
+                    FileProcessor.process_image, files["image/png"], "image/png"
+                ))
+            delay = settings.WARMUP_RETRY_INTERVAL
+            attempts = 0
+            while True:
+                attempts += 1
+                error = await self._step("llm_connection", self.processor.llm_client.warm_up)
+                self.steps["llm_connection"]["attempts"] = attempts
+                if error is None:
+                    break
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
+        metrics.WARMUP_SECONDS.set(time.perf_counter() - start_time, step="total")
+        self.ready = True
+
+    @staticmethod
+    def _process_files(files: Dict[str, bytes]):
+        FileProcessor.process_image(files["image/png"], "image/png")
+        _, pdf_info, _ = FileProcessor.process_pdf(files["application/pdf"], settings.PDF_MAX_CHARS)
+        if settings.PDF_RASTERIZE:
+            FileProcessor.rasterize_pdf_pages(files["application/pdf"], pdf_info.get("textless_pages", []))
+
+    async def _step(self, name: str, run: Callable[[], Awaitable[Any]]) -> Optional[str]:
+        start_time = time.perf_counter()
+        error = None
+        try:
+            await run()
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        seconds = time.perf_counter() - start_time
+        metrics.WARMUP_SECONDS.set(seconds, step=name)
+        self.steps[name] = {"seconds": round(seconds, 6), "error": error}
+        return error
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+import argparse
+import mimetypes
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_FILES = [
+    os.path.join(ROOT, "file examples", "chat_screenshot.png"),
+    os.path.join(ROOT, "file examples", "invoice.pdf")
+]
+
+
+def wait_until_ok(url: str, start: float, timeout: float) -> float:
+    # Polls tightly: the interesting differences are tens of milliseconds.
+    while time.perf_counter() - start < timeout:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+def post(url: str, path: str, salt: int) -> float:
+    with open(path, "rb") as handle:
+        # Salted so every request misses the result cache.
+        content = handle.read() + f"\n{salt}".encode()
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    start = time.perf_counter()
+    response = httpx.post(
+        f"{url}/process-document/",
+        files={"file": (os.path.basename(path), content, content_type)},
+        timeout=120.0
+    )
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def measure(args, warmup: bool, run: int) -> Dict[str, float]:
+    state_dir = tempfile.mkdtemp(prefix="coldstart-")
+    env = dict(
+        os.environ,
+        OPENROUTER_API_KEY="stub",
+        OPENROUTER_BASE_URL=f"http://127.0.0.1:{args.stub_port}/api/v1",
+        ROUTER_ENABLED="false",
+        RESULT_CACHE_ENABLED="false",
+        JOB_DB_PATH=os.path.join(state_dir, "jobs.db"),
+        WARMUP_ENABLED="true" if warmup else "false"
+    )
+    url = f"http://127.0.0.1:{args.backend_port}"
+    start = time.perf_counter()
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app",
+         "--host", "127.0.0.1", "--port", str(args.backend_port), "--log-level", "warning"],
+        cwd=os.path.join(ROOT, "backend"),
+        env=env
+    )
+    try:
+        timings = {
+            "health_s": wait_until_ok(f"{url}/health", start, args.timeout),
+            "ready_s": wait_until_ok(f"{url}/ready", start, args.timeout)
+        }
+        for path in args.files:
+            name = os.path.splitext(os.path.basename(path))[0]
+            timings[f"first_{name}_s"] = post(url, path, run * 2)
+            timings[f"second_{name}_s"] = post(url, path, run * 2 + 1)
+        return timings
+    finally:
+        backend.terminate()
+        backend.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure backend cold start: time to /health and /ready, and first vs second request latency"
+    )
+    parser.add_argument("files", nargs="*", default=DEFAULT_FILES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend-port", type=int, default=8766)
+    parser.add_argument("--stub-port", type=int, default=8767)
+    parser.add_argument("--stub-latency", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_server",
+         "--port", str(args.stub_port), "--latency-median", str(args.stub_latency), "--latency-sigma", "0"],
+        cwd=ROOT
+    )
+    try:
+        wait_until_ok(f"http://127.0.0.1:{args.stub_port}/stats", time.perf_counter(), args.timeout)
+        for warmup in (False, True):
+            runs: List[Dict[str, float]] = [measure(args, warmup, run) for run in range(args.runs)]
+            print(f"warmup {'on' if warmup else 'off'} (median of {args.runs} runs)")
+            for key in runs[0]:
+                print(f"  {key:<32} {statistics.median(run[key] for run in runs) * 1000:8.1f} ms")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "backend"))
+
+
+def synthetic_documents(count: int, seed: int = 0):
+    # Entity values are drawn from pools much smaller than the document
+    # count, with a skew, so some values are shared by many documents
+    # (rings, round amounts) and most by a few.
+    from entity_index import PHONE, EMAIL, DOMAIN, COMPANY, AMOUNT
+
+    rng = random.Random(seed)
+    pools = {
+        PHONE: (count // 3, lambda n: f"+44{7000000000 + n}"),
+        EMAIL: (count // 3, lambda n: f"user{n}@shop{n % 50000}.example"),
+        DOMAIN: (count // 10, lambda n: f"shop{n}.example"),
+        COMPANY: (count // 10, lambda n: f"company {n}"),
+        AMOUNT: (5000, lambda n: f"USD {n * 5}")
+    }
+    for number in range(count):
+        entities = set()
+        for kind, (size, make) in pools.items():
+            for _ in range(rng.randint(0, 2)):
+                entities.add((kind, make(int(size * rng.random() ** 2))))
+        yield f"doc-{number}", f"doc-{number}.png", "chat_screenshot", entities
+
+
+def timed(calls, function):
+    timings = []
+    for args in calls:
+        start = time.perf_counter()
+        function(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark entity index rebuild, lookup and related-document queries")
+    parser.add_argument("--documents", default="100000,1000000")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    from entity_index import EntityIndex, PHONE, DOMAIN, AMOUNT
+
+    for count in map(int, args.documents.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "entities.db")
+            index = EntityIndex(path)
+            start = time.perf_counter()
+            documents, postings = index.rebuild(synthetic_documents(count))
+            build_seconds = time.perf_counter() - start
+
+            rng = random.Random(1)
+            searches = [
+                (kind, value, args.limit)
+                for _ in range(args.queries)
+                for kind, value in [rng.choice([
+                    (PHONE, f"+44 {7000000000 + rng.randrange(count // 3)}"),
+                    (DOMAIN, f"https://www.shop{rng.randrange(count // 10)}.example/"),
+                    (AMOUNT, f"${rng.randrange(5000) * 5:,}")
+                ])]
+            ]
+            related = [(f"doc-{rng.randrange(count)}", args.limit) for _ in range(args.queries)]
+            search_p50, search_p99 = timed(searches, index.search)
+            related_p50, related_p99 = timed(related, index.related)
+            index.close()
+            print(
+                f"{documents:>9} documents {postings:>9} postings  "
+                f"rebuild {build_seconds:6.1f}s  {os.path.getsize(path) / 1e6:6.0f} MB  "
+                f"search p50 {search_p50:.3f} ms p99 {search_p99:.3f} ms  "
+                f"related p50 {related_p50:.3f} ms p99 {related_p99:.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
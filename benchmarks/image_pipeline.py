@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import glob
+import io
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "backend"))
+
+DEFAULT_IMAGES = os.path.join(ROOT, "file examples")
+
+
+def legacy_process_image(file_content: bytes, content_type: str):
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(file_content))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=85)
+    base64_image = base64.b64encode(buffered.getvalue()).decode()
+    return len(base64_image), None
+
+
+def current_process_image(file_content: bytes, content_type: str):
+    from file_processor import FileProcessor
+
+    base64_images, image_info, error = FileProcessor.process_image(file_content, content_type)
+    return sum(len(base64_image) for base64_image in base64_images), error
+
+
+PIPELINES = {
+    "legacy": legacy_process_image,
+    "current": current_process_image
+}
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_one(pipeline: str, path: str, iterations: int, queue):
+    import file_processor  # noqa: F401 - import cost excluded from the measurement
+
+    with open(path, "rb") as f:
+        file_content = f.read()
+    process_image = PIPELINES[pipeline]
+
+    baseline_mb = _peak_rss_mb()
+    timings = []
+    output_bytes = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        output_bytes, error = process_image(file_content, "image/*")
+        timings.append((time.perf_counter() - start) * 1000)
+        if error:
+            raise RuntimeError(error)
+
+    queue.put({
+        "median_ms": statistics.median(timings),
+        "peak_rss_mb": _peak_rss_mb(),
+        "peak_delta_mb": _peak_rss_mb() - baseline_mb,
+        "output_bytes": output_bytes
+    })
+
+
+def measure(pipeline: str, path: str, iterations: int) -> dict:
+    # Each measurement runs in a fresh interpreter so peak RSS is not
+    # inherited from earlier images or the other pipeline.
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_one, args=(pipeline, path, iterations, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def make_synthetic_screenshot(path: str, width: int = 4000, height: int = 8000):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGBA", (width, height), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for top in range(0, height, 120):
+        draw.rectangle([80, top + 20, width * 2 // 3, top + 90], fill=(220, 235, 250, 255))
+    image.save(path, format="PNG")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FileProcessor.process_image")
+    parser.add_argument("images", nargs="*", help="image files (defaults to 'file examples/')")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--pipelines", default="legacy,current")
+    parser.add_argument(
+        "--synthetic", action="store_true",
+        help="also benchmark a generated 4000x8000 RGBA phone screenshot"
+    )
+    args = parser.parse_args()
+
+    paths = args.images or sorted(
+        path for pattern in ("*.png", "*.jpg", "*.jpeg")
+        for path in glob.glob(os.path.join(DEFAULT_IMAGES, pattern))
+    )
+    if args.synthetic:
+        synthetic_path = os.path.join(ROOT, "benchmarks", ".synthetic_screenshot.png")
+        if not os.path.exists(synthetic_path):
+            make_synthetic_screenshot(synthetic_path)
+        paths.append(synthetic_path)
+
+    print(f"{'image':<34} {'pipeline':<9} {'ms/image':>9} {'peak RSS MB':>12} {'+MB':>8} {'out KB':>8}")
+    for path in paths:
+        for pipeline in args.pipelines.split(","):
+            result = measure(pipeline, path, args.iterations)
+            print(
+                f"{os.path.basename(path)[:34]:<34} {pipeline:<9} "
+                f"{result['median_ms']:>9.1f} {result['peak_rss_mb']:>12.1f} "
+                f"{result['peak_delta_mb']:>8.1f} {result['output_bytes'] / 1024:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import glob
+import json
+import math
+import mimetypes
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_FILES = os.path.join(ROOT, "file examples", "*")
+SUPPORTED_TYPES = ("image/png", "image/jpeg", "application/pdf")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class ProcessSampler:
+    # Samples CPU time and RSS of a process and its children (e.g. the
+    # preprocessing pool) from /proc, or via psutil when it is installed.
+    def __init__(self, pid: Optional[int], interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[Tuple[float, float, float]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.pid is None:
+            return
+        self._stop.clear()
+        self.samples = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Dict[str, Optional[float]]:
+        if self._thread is None:
+            return {"cpu_percent": None, "rss_mb_max": None}
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if len(self.samples) < 2:
+            return {"cpu_percent": None, "rss_mb_max": None}
+
+        (start_time, start_cpu, _), (end_time, end_cpu, _) = self.samples[0], self.samples[-1]
+        return {
+            "cpu_percent": round(100 * (end_cpu - start_cpu) / max(end_time - start_time, 1e-9), 1),
+            "rss_mb_max": round(max(sample[2] for sample in self.samples), 1)
+        }
+
+    def _run(self):
+        while True:
+            sample = self._sample()
+            if sample is not None:
+                self.samples.append(sample)
+            if self._stop.wait(self.interval):
+                break
+        sample = self._sample()
+        if sample is not None:
+            self.samples.append(sample)
+
+    def _sample(self) -> Optional[Tuple[float, float, float]]:
+        try:
+            import psutil
+        except ImportError:
+            psutil = None
+
+        try:
+            if psutil is not None:
+                process = psutil.Process(self.pid)
+                processes = [process] + process.children(recursive=True)
+                cpu, rss = 0.0, 0
+                for item in processes:
+                    try:
+                        times = item.cpu_times()
+                        cpu += times.user + times.system
+                        rss += item.memory_info().rss
+                    except psutil.Error:
+                        pass
+                return time.monotonic(), cpu, rss / (1024 * 1024)
+            return (time.monotonic(), *self._sample_proc())
+        except Exception:
+            return None
+
+    def _sample_proc(self) -> Tuple[float, float]:
+        ticks = os.sysconf("SC_CLK_TCK")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        pids = [self.pid] + self._children(self.pid)
+        cpu, rss = 0.0, 0
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                cpu += (int(fields[11]) + int(fields[12])) / ticks
+                rss += int(fields[21]) * page_size
+            except (OSError, IndexError, ValueError):
+                pass
+        return cpu, rss / (1024 * 1024)
+
+    def _children(self, parent: int) -> List[int]:
+        children = []
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                if int(fields[1]) == parent:
+                    children.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+        return children + [grandchild for child in children for grandchild in self._children(child)]
+
+
+def load_files(patterns: List[str]) -> List[Tuple[str, bytes, str]]:
+    files = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            content_type = mimetypes.guess_type(path)[0]
+            if content_type not in SUPPORTED_TYPES:
+                continue
+            with open(path, "rb") as f:
+                files.append((os.path.basename(path), f.read(), content_type))
+    return files
+
+
+async def run_stage(
+    client: httpx.AsyncClient,
+    url: str,
+    files: List[Tuple[str, bytes, str]],
+    concurrency: int,
+    total_requests: int,
+    bust_cache: bool,
+    stream: bool = False
+) -> Dict[str, Any]:
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(total_requests):
+        queue.put_nowait(files[index % len(files)])
+
+    latencies: List[float] = []
+    category_latencies: List[float] = []
+    completion_tokens: List[int] = []
+    stage_timings: Dict[str, List[float]] = {}
+    failures = 0
+
+    async def worker():
+        nonlocal failures
+        while True:
+            try:
+                filename, content, content_type = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if bust_cache:
+                # Trailing bytes are ignored by the PDF/image decoders but
+                # change the content hash, so the result cache never hits.
+                content = content + uuid.uuid4().bytes
+            start = time.perf_counter()
+            try:
+                if stream:
+                    status_code, body = await post_stream(
+                        client, url, (filename, content, content_type), start, category_latencies
+                    )
+                else:
+                    response = await client.post(
+                        f"{url}/process-document/",
+                        files={"file": (filename, content, content_type)}
+                    )
+                    status_code, body = response.status_code, response.json()
+                latencies.append(time.perf_counter() - start)
+                if status_code != 200 or body.get("error"):
+                    failures += 1
+                for name, seconds in (body.get("stage_timings") or {}).items():
+                    stage_timings.setdefault(name, []).append(seconds)
+                if body.get("token_usage"):
+                    completion_tokens.append(body["token_usage"].get("completion_tokens", 0))
+            except Exception:
+                latencies.append(time.perf_counter() - start)
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "failures": failures,
+        "error_rate": round(failures / max(total_requests, 1), 4),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total_requests / max(elapsed, 1e-9), 3),
+        "p50_s": round(percentile(latencies, 0.50), 4),
+        "p95_s": round(percentile(latencies, 0.95), 4),
+        "p99_s": round(percentile(latencies, 0.99), 4),
+        "completion_tokens_mean": round(
+            sum(completion_tokens) / len(completion_tokens), 1
+        ) if completion_tokens else None,
+        "stage_p50_s": {
+            name: round(percentile(values, 0.50), 4)
+            for name, values in sorted(stage_timings.items())
+        }
+    }
+    if stream:
+        report["p50_category_s"] = round(percentile(category_latencies, 0.50), 4)
+        report["p95_category_s"] = round(percentile(category_latencies, 0.95), 4)
+    return report
+
+
+async def post_stream(
+    client: httpx.AsyncClient,
+    url: str,
+    upload: Tuple[str, bytes, str],
+    start: float,
+    category_latencies: List[float]
+) -> Tuple[int, Dict[str, Any]]:
+    body: Dict[str, Any] = {}
+    event = None
+    category_seen = False
+    async with client.stream("POST", f"{url}/process-document/stream", files={"file": upload}) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return response.status_code, {}
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "category" and not category_seen:
+                    category_seen = True
+                    category_latencies.append(time.perf_counter() - start)
+            elif line.startswith("data: ") and event == "result":
+                body = json.loads(line[len("data: "):])
+    return response.status_code, body
+
+
+def wait_for_http(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def launch_servers(args) -> Tuple[List[subprocess.Popen], str, int]:
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_server",
+         "--port", str(args.stub_port),
+         "--latency-median", str(args.stub_latency),
+         "--latency-sigma", str(args.stub_sigma),
+         "--error-rate", str(args.stub_error_rate),
+         "--quota-rpm", str(args.stub_quota_rpm)],
+        cwd=ROOT
+    )
+    wait_for_http(f"http://127.0.0.1:{args.stub_port}/stats")
+
+    state_dir = tempfile.mkdtemp(prefix="loadtest-")
+    env = dict(
+        os.environ,
+        OPENROUTER_API_KEY="stub",
+        OPENROUTER_BASE_URL=f"http://127.0.0.1:{args.stub_port}/api/v1",
+        RESULT_CACHE_ENABLED="false",
+        RESULT_CACHE_DB_PATH="",
+        JOB_DB_PATH=os.path.join(state_dir, "jobs.db")
+    )
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app",
+         "--host", "127.0.0.1", "--port", str(args.backend_port), "--log-level", "warning"],
+        cwd=os.path.join(ROOT, "backend"),
+        env=env
+    )
+    url = f"http://127.0.0.1:{args.backend_port}"
+    wait_for_http(f"{url}/health")
+    return [backend, stub], url, backend.pid
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    regressions = []
+    baseline_stages = {stage["concurrency"]: stage for stage in baseline.get("stages", [])}
+    for stage in report["stages"]:
+        previous = baseline_stages.get(stage["concurrency"])
+        if previous is None:
+            continue
+        for key in ("p50_s", "p95_s", "p99_s"):
+            if previous[key] and stage[key] > previous[key] * (1 + max_regression):
+                regressions.append(
+                    f"c={stage['concurrency']} {key}: {previous[key]:.3f}s -> {stage[key]:.3f}s"
+                )
+        if previous["rps"] and stage["rps"] < previous["rps"] * (1 - max_regression):
+            regressions.append(
+                f"c={stage['concurrency']} rps: {previous['rps']:.2f} -> {stage['rps']:.2f}"
+            )
+    return regressions
+
+
+def print_report(report: Dict[str, Any]):
+    print(
+        f"{'conc':>5} {'reqs':>6} {'rps':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} "
+        f"{'err %':>6} {'cpu %':>7} {'rss MB':>8}"
+    )
+    for stage in report["stages"]:
+        cpu = "-" if stage["cpu_percent"] is None else f"{stage['cpu_percent']:.0f}"
+        rss = "-" if stage["rss_mb_max"] is None else f"{stage['rss_mb_max']:.0f}"
+        print(
+            f"{stage['concurrency']:>5} {stage['requests']:>6} {stage['rps']:>8.2f} "
+            f"{stage['p50_s']:>8.3f} {stage['p95_s']:>8.3f} {stage['p99_s']:>8.3f} "
+            f"{stage['error_rate'] * 100:>6.1f} {cpu:>7} {rss:>8}"
+        )
+        if stage.get("stage_p50_s"):
+            breakdown = "  ".join(
+                f"{name}={seconds * 1000:.1f}ms" for name, seconds in stage["stage_p50_s"].items()
+            )
+            print(f"{'':>5} p50 by stage: {breakdown}")
+        if stage.get("completion_tokens_mean") is not None:
+            print(f"{'':>5} completion tokens/request: {stage['completion_tokens_mean']:.0f}")
+        if "p50_category_s" in stage:
+            print(
+                f"{'':>5} time to category: p50 {stage['p50_category_s']:.3f}s "
+                f"p95 {stage['p95_category_s']:.3f}s"
+            )
+
+
+async def run(args, url: str, server_pid: Optional[int]) -> Dict[str, Any]:
+    files = load_files(args.files)
+    if not files:
+        raise SystemExit("No PDF/PNG/JPEG files matched")
+
+    sampler = ProcessSampler(server_pid)
+    stages = []
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        if args.warmup:
+            await run_stage(client, url, files, 1, args.warmup, True, args.stream)
+        for concurrency in args.concurrency:
+            sampler.start()
+            stage = await run_stage(
+                client, url, files, concurrency,
+                args.requests or concurrency * args.requests_per_worker,
+                not args.allow_cache,
+                args.stream
+            )
+            stage.update(sampler.stop())
+            stages.append(stage)
+
+    return {
+        "url": url,
+        "files": [name for name, _, _ in files],
+        "started_at": time.time(),
+        "stages": stages
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay example documents against /process-document/")
+    parser.add_argument("--url", help="backend URL; omit together with --launch to start a local stack")
+    parser.add_argument("--launch", action="store_true", help="start the stub LLM and a backend locally")
+    parser.add_argument("--files", nargs="+", default=[DEFAULT_FILES])
+    parser.add_argument("--concurrency", type=lambda value: [int(v) for v in value.split(",")], default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=0, help="requests per stage (default: 8 per worker)")
+    parser.add_argument("--requests-per-worker", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--stream", action="store_true", help="use the SSE endpoint and report time to category")
+    parser.add_argument("--allow-cache", action="store_true", help="do not make each upload unique")
+    parser.add_argument("--server-pid", type=int, help="pid of the backend to sample CPU/RSS from")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--stub-latency", type=float, default=2.0)
+    parser.add_argument("--stub-sigma", type=float, default=0.4)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-quota-rpm", type=int, default=0, help="sliding-minute request quota (0 = none)")
+    parser.add_argument("--backend-port", type=int, default=8100)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    processes: List[subprocess.Popen] = []
+    url, server_pid = args.url, args.server_pid
+    if args.launch:
+        processes, url, server_pid = launch_servers(args)
+    elif not url:
+        parser.error("either --url or --launch is required")
+
+    try:
+        report = asyncio.run(run(args, url.rstrip("/"), server_pid))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print("Regressions beyond {:.0%}:".format(args.max_regression))
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "backend"))
+
+DEFAULT_IMAGES = os.path.join(ROOT, "file examples")
+
+
+def variants(image):
+    from PIL import Image, ImageDraw
+
+    width, height = image.size
+    recompressed = io.BytesIO()
+    image.save(recompressed, format="JPEG", quality=50)
+
+    clock = image.copy()
+    ImageDraw.Draw(clock).rectangle(
+        [width // 2 - width // 20, 0, width // 2 + width // 20, max(height // 60, 4)], fill=(0, 0, 0)
+    )
+    return {
+        "jpeg q50": Image.open(io.BytesIO(recompressed.getvalue())),
+        "half size": image.resize((width // 2, height // 2)),
+        "crop 3%": image.crop((width * 3 // 100, height * 3 // 100, width, height)),
+        "status bar edit": clock
+    }
+
+
+def robustness(paths):
+    from PIL import Image
+    from perceptual_index import dhash, hamming
+
+    print(f"{'image':<34} {'variant':<16} {'distance':>8}")
+    for path in paths:
+        image = Image.open(path).convert("RGB")
+        original = dhash(image)
+        for name, variant in variants(image).items():
+            print(f"{os.path.basename(path)[:34]:<34} {name:<16} {hamming(original, dhash(variant)):>8}")
+
+
+def lookup_latency(entries: int, queries: int, max_distance: int):
+    from perceptual_index import MultiIndexHash, HASH_BITS
+
+    rng = random.Random(0)
+    index = MultiIndexHash()
+    start = time.perf_counter()
+    hashes = [rng.getrandbits(HASH_BITS) for _ in range(entries)]
+    for slot, value in enumerate(hashes):
+        index.add(value, str(slot))
+    build_seconds = time.perf_counter() - start
+
+    timings = []
+    found = 0
+    for _ in range(queries):
+        # Half the queries are perturbed copies of indexed hashes, half are misses.
+        value = rng.choice(hashes) if rng.random() < 0.5 else rng.getrandbits(HASH_BITS)
+        for bit in rng.sample(range(HASH_BITS), rng.randint(0, max_distance)):
+            value ^= 1 << bit
+        start = time.perf_counter()
+        found += bool(index.search(value, max_distance))
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    print(
+        f"{entries:>10} entries  build {build_seconds:6.1f}s  "
+        f"p50 {statistics.median(timings):.3f} ms  p99 {timings[int(len(timings) * 0.99)]:.3f} ms  "
+        f"matched {found}/{queries}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the perceptual-hash near-duplicate index")
+    parser.add_argument("images", nargs="*", help="image files (defaults to 'file examples/')")
+    parser.add_argument("--entries", default="10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--max-distance", type=int, default=6)
+    args = parser.parse_args()
+
+    paths = args.images or sorted(
+        path for pattern in ("*.png", "*.jpg", "*.jpeg")
+        for path in glob.glob(os.path.join(DEFAULT_IMAGES, pattern))
+    )
+    robustness(paths)
+    print()
+    for entries in args.entries.split(","):
+        lookup_latency(int(entries), args.queries, args.max_distance)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "backend"))
+
+from benchmarks.cold_start import wait_until_ok
+
+DEFAULT_DOCUMENT = os.path.join(ROOT, "file examples", "invoice.pdf")
+
+
+async def measure(text: str, calls: int):
+    # Streams the same kind of request the text path sends, one at a time so
+    # every call after the first can find the prefix cached.
+    from config import settings
+    from llm_client import LLMClient
+    import metrics
+
+    client = LLMClient()
+    results = {}
+    for cache in (False, True):
+        settings.LLM_PROMPT_CACHE = cache
+        first_token = []
+        cached = []
+        for index in range(calls):
+            with metrics.document_context() as stats:
+                messages, model = client._build_messages(f"{text}\n\n#{index}", False, None, None)
+                async for _ in client._stream_complete(model, messages, max_tokens=2048):
+                    pass
+            first_token.append(stats["stages"].get("llm_first_token", 0.0))
+            cached.append(stats["usage"].get("cached_tokens", 0))
+        results[cache] = first_token, cached
+    await LLMClient.aclose()
+    return results
+
+
+def document_text(path: str) -> str:
+    from file_processor import FileProcessor
+
+    with open(path, "rb") as handle:
+        text, _, error = FileProcessor.process_pdf(handle.read())
+    if error:
+        raise SystemExit(error)
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time to first token and cached prompt tokens with and without the system prompt cache breakpoint"
+    )
+    parser.add_argument("document", nargs="?", default=DEFAULT_DOCUMENT, help="PDF whose text is sent")
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--base-url", default="", help="measure a real endpoint instead of the local stub")
+    parser.add_argument("--stub-port", type=int, default=8768)
+    parser.add_argument("--stub-latency", type=float, default=0.05)
+    parser.add_argument("--prefill-per-1k-tokens", type=float, default=0.2)
+    parser.add_argument("--prompt-cache-min-tokens", type=int, default=1024)
+    args = parser.parse_args()
+
+    stub = None
+    if args.base_url:
+        os.environ["OPENROUTER_BASE_URL"] = args.base_url
+    else:
+        os.environ.update(OPENROUTER_API_KEY="stub", OPENROUTER_BASE_URL=f"http://127.0.0.1:{args.stub_port}/api/v1")
+        stub = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.stub_server", "--port", str(args.stub_port),
+             "--latency-median", str(args.stub_latency), "--latency-sigma", "0",
+             "--prefill-per-1k-tokens", str(args.prefill_per_1k_tokens),
+             "--prompt-cache-min-tokens", str(args.prompt_cache_min_tokens)],
+            cwd=ROOT
+        )
+    os.environ.update(HEDGE_ENABLED="false", LLM_MAX_RETRIES="0")
+
+    try:
+        if stub is not None:
+            wait_until_ok(f"http://127.0.0.1:{args.stub_port}/stats", time.perf_counter(), 30.0)
+        text = document_text(args.document)
+        print(f"{'prompt cache':<14} {'ttft p50 ms':>12} {'ttft p90 ms':>12} {'cached tokens/call':>19}")
+        for cache, (first_token, cached) in asyncio.run(measure(text, args.calls)).items():
+            # The first call only writes the cache.
+            first_token, cached = first_token[1:], cached[1:]
+            print(f"{'on' if cache else 'off':<14} "
+                  f"{statistics.median(first_token) * 1000:12.1f} "
+                  f"{statistics.quantiles(first_token, n=10)[-1] * 1000:12.1f} "
+                  f"{statistics.mean(cached):19.0f}")
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "backend"))
+
+DEFAULT_RESULTS = os.path.join(ROOT, "output", "*.json")
+
+
+def token_counter():
+    # tiktoken's cl100k is only an approximation of the provider's tokenizer,
+    # but it is consistent between the two formats; fall back to chars/4.
+    try:
+        import tiktoken
+    except ImportError:
+        return lambda text: max(1, len(text) // 4), "chars/4"
+    encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text)), "cl100k_base"
+
+
+def model_output(result: dict) -> dict:
+    extracted_content = dict(result.get("extracted_content") or {})
+    extracted_content.pop("file_info", None)
+    return {
+        "category": result.get("category", "other"),
+        "confidence": result.get("confidence", 0.0),
+        "extracted_content": extracted_content
+    }
+
+
+def parse_seconds(text: str, iterations: int) -> float:
+    from json_stream import parse_json_object
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parse_json_object(text)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Output tokens of the verbose vs compact response schema")
+    parser.add_argument("results", nargs="*", help="ProcessingResult JSON files (defaults to output/*.json)")
+    parser.add_argument("--transcript-chars", type=int, default=1000)
+    parser.add_argument("--parse-iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    from response_schema import compact_analysis, expand_analysis
+
+    count_tokens, tokenizer = token_counter()
+    paths = args.results or sorted(glob.glob(DEFAULT_RESULTS))
+    totals = {"verbose": 0, "compact": 0}
+
+    print(f"tokenizer: {tokenizer}")
+    print(f"{'result':<34} {'verbose':>8} {'compact':>8} {'saved':>7} {'parse us v/c':>14}")
+    for path in paths:
+        with open(path) as f:
+            output = model_output(json.load(f))
+        verbose = json.dumps(output, indent=4)
+        compact_body = compact_analysis(output, args.transcript_chars)
+        compact = json.dumps(compact_body, separators=(",", ":"))
+
+        expanded = expand_analysis(compact_body, transcript_chars=args.transcript_chars)
+        if expanded["category"] != output["category"]:
+            raise SystemExit(f"{path}: round trip changed the category")
+
+        verbose_tokens, compact_tokens = count_tokens(verbose), count_tokens(compact)
+        totals["verbose"] += verbose_tokens
+        totals["compact"] += compact_tokens
+        print(
+            f"{os.path.basename(path)[:34]:<34} {verbose_tokens:>8} {compact_tokens:>8} "
+            f"{1 - compact_tokens / verbose_tokens:>7.0%} "
+            f"{parse_seconds(verbose, args.parse_iterations) * 1e6:>6.0f}/"
+            f"{parse_seconds(compact, args.parse_iterations) * 1e6:<6.0f}"
+        )
+
+    if totals["verbose"]:
+        print(
+            f"{'total':<34} {totals['verbose']:>8} {totals['compact']:>8} "
+            f"{1 - totals['compact'] / totals['verbose']:>7.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
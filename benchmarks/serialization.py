@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import msgpack
+import orjson
+import zstandard
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "backend"))
+
+from shared.models import ProcessingResult
+
+WORDS = ("urgent payment wire transfer crypto wallet verify account invoice refund "
+         "gift card bitcoin shipping deposit seller buyer").split()
+
+
+def synthetic_results(count: int, seed: int = 0):
+    # output/*.json with the entities, transcript, indicators and timings
+    # varied per result, so compression cannot just dedupe whole records.
+    rng = random.Random(seed)
+    bases = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "output", "*.json"))):
+        with open(path, encoding="utf-8") as handle:
+            bases.append(json.load(handle))
+    for number in range(count):
+        result = json.loads(json.dumps(rng.choice(bases)))
+        result["file_id"] = str(uuid.UUID(int=rng.getrandbits(128)))
+        result["filename"] = f"upload_{number}.png"
+        extracted = result["extracted_content"]
+        for name in extracted["key_entities"]:
+            extracted["key_entities"][name] = [
+                f"{rng.choice(WORDS)} {rng.randint(1, 99999)}" for _ in range(rng.randint(0, 4))
+            ]
+        extracted["text"] = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 150)))
+        extracted["metadata"]["fraud_risk_indicators"] = [
+            " ".join(rng.choice(WORDS) for _ in range(5)) for _ in range(rng.randint(1, 6))
+        ]
+        result["confidence"] = rng.random()
+        result["processing_time"] = rng.random() * 10
+        result["stage_timings"] = {
+            stage: round(rng.random(), 6) for stage in ("preprocess", "llm_queue_wait", "llm_call", "parse")
+        }
+        result["token_usage"] = {
+            "prompt_tokens": rng.randint(500, 3000), "completion_tokens": rng.randint(50, 400)
+        }
+        yield ProcessingResult.model_validate(result)
+
+
+def per_result_us(function, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        function(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def timed(function, items):
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        function(item)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serialization cost per result and bytes per stored result for JSON, msgpack, "
+                    "zstd and the results store's dictionary-trained zstd"
+    )
+    parser.add_argument("--results", type=int, default=5000)
+    parser.add_argument("--dict-samples", type=int, default=1000)
+    args = parser.parse_args()
+    if args.dict_samples < 1 or args.results <= args.dict_samples:
+        parser.error("--results must exceed --dict-samples, which must be at least 1: "
+                     "only records appended after the dictionary is trained are timed")
+
+    results = list(synthetic_results(args.results))
+    dumped = [result.model_dump(mode="json") for result in results]
+    encoded = [orjson.dumps(value) for value in dumped]
+
+    print(f"{'encode':<34} {'us/result':>10}")
+    for name, function in (
+        ("model_dump(json) + json.dumps", lambda result: json.dumps(result.model_dump(mode="json"))),
+        ("model_dump + orjson.dumps", lambda result: orjson.dumps(result.model_dump())),
+        ("model_dump_json", lambda result: result.model_dump_json())
+    ):
+        print(f"{name:<34} {per_result_us(function, results):10.1f}")
+    print(f"{'decode':<34} {'us/result':>10}")
+    for name, function in (
+        ("json.loads", json.loads),
+        ("orjson.loads", orjson.loads),
+        ("model_validate_json", ProcessingResult.model_validate_json)
+    ):
+        print(f"{name:<34} {per_result_us(function, encoded):10.1f}")
+
+    packed = [msgpack.packb(value) for value in dumped]
+    compressor = zstandard.ZstdCompressor(level=3)
+    print(f"\n{'format':<34} {'bytes/result':>12}")
+    print(f"{'JSON':<34} {statistics.mean(map(len, encoded)):12.0f}")
+    print(f"{'msgpack':<34} {statistics.mean(map(len, packed)):12.0f}")
+    print(f"{'msgpack + zstd':<34} {statistics.mean(len(compressor.compress(value)) for value in packed):12.0f}")
+
+    os.environ["RESULTS_STORE_DICT_SAMPLES"] = str(args.dict_samples)
+    from results_store import ResultsStore
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultsStore(directory)
+        # Only records written after the dictionary is trained are compared.
+        for value in dumped[:args.dict_samples]:
+            store.append(value, None)
+        store.train_dictionary()
+        before = store.stats()["segment_bytes"]
+        append_p50, append_p99 = timed(lambda value: store.append(value, None), dumped[args.dict_samples:])
+        written = len(dumped) - args.dict_samples
+        after = store.stats()["segment_bytes"]
+        print(f"{'results store (dictionary zstd)':<34} {(after - before) / max(written, 1):12.0f}")
+
+        file_ids = [value["file_id"] for value in random.Random(1).sample(dumped, min(2000, len(dumped)))]
+        get_p50, get_p99 = timed(store.get, file_ids)
+        store.close()
+    print(f"\n{'results store':<34} {'p50 ms':>8} {'p99 ms':>8}")
+    print(f"{'append':<34} {append_p50:8.3f} {append_p99:8.3f}")
+    print(f"{'get':<34} {get_p50:8.3f} {get_p99:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
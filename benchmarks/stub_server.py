@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from collections import deque
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from fastapi import FastAPI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BODIES = os.path.join(ROOT, "output", "*.json")
+sys.path.append(os.path.join(ROOT, "backend"))
+
+from response_schema import compact_analysis
+
+
+class StubConfig:
+    def __init__(
+        self,
+        latency_median: float = 2.0,
+        latency_sigma: float = 0.4,
+        latency_max: float = 60.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        first_token_fraction: float = 0.15,
+        quota_rpm: int = 0,
+        prefill_per_1k_tokens: float = 0.0,
+        prompt_cache_min_tokens: int = 1024,
+        prompt_cache_ttl: float = 300.0,
+        bodies: str = DEFAULT_BODIES,
+        seed: int = 0
+    ):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.latency_max = latency_max
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.first_token_fraction = first_token_fraction
+        self.quota_rpm = quota_rpm
+        self.prefill_per_1k_tokens = prefill_per_1k_tokens
+        self.prompt_cache_min_tokens = prompt_cache_min_tokens
+        self.prompt_cache_ttl = prompt_cache_ttl
+        self.prompt_cache: Dict[str, float] = {}
+        self.accepted: deque = deque()
+        self.random = random.Random(seed)
+        self.bodies = load_bodies(bodies)
+
+    def quota_headers(self) -> Optional[Dict[str, str]]:
+        # Sliding one-minute window like a provider quota; None means the
+        # request is over quota.
+        if not self.quota_rpm:
+            return {}
+        now = time.time()
+        while self.accepted and now - self.accepted[0] >= 60:
+            self.accepted.popleft()
+        if len(self.accepted) >= self.quota_rpm:
+            return None
+        self.accepted.append(now)
+        return {
+            "x-ratelimit-limit-requests": str(self.quota_rpm),
+            "x-ratelimit-remaining-requests": str(self.quota_rpm - len(self.accepted)),
+            "x-ratelimit-reset-requests": f"{60 - (now - self.accepted[0]):.3f}s"
+        }
+
+    def cached_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        # Anthropic-style explicit caching: the prefix up to the last
+        # cache_control breakpoint is cached once it reaches the minimum
+        # size, and a hit within the TTL refreshes it.
+        breakpoint = None
+        for index, message in enumerate(messages):
+            content = message.get("content")
+            if isinstance(content, list) and any("cache_control" in part for part in content):
+                breakpoint = index
+        if breakpoint is None:
+            return 0
+        prefix = messages[:breakpoint + 1]
+        tokens = estimate_tokens(prefix)
+        if tokens < self.prompt_cache_min_tokens:
+            return 0
+        key = hashlib.sha256(json.dumps(prefix, sort_keys=True).encode()).hexdigest()
+        now = time.time()
+        hit = self.prompt_cache.get(key, 0) > now
+        self.prompt_cache[key] = now + self.prompt_cache_ttl
+        return tokens if hit else 0
+
+    def sample_latency(self) -> float:
+        if self.latency_median <= 0:
+            return 0.0
+        latency = self.random.lognormvariate(0.0, self.latency_sigma) * self.latency_median
+        return min(latency, self.latency_max)
+
+
+def load_bodies(pattern: str) -> List[Dict[str, Any]]:
+    bodies = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            result = json.load(f)
+        extracted_content = dict(result.get("extracted_content", {}))
+        extracted_content.pop("file_info", None)
+        bodies.append({
+            "category": result.get("category", "other"),
+            "confidence": result.get("confidence", 0.9),
+            "extracted_content": extracted_content
+        })
+    if not bodies:
+        bodies.append({
+            "category": "other",
+            "confidence": 0.5,
+            "extracted_content": {
+                "text": "",
+                "key_entities": {},
+                "dates": [],
+                "metadata": {
+                    "document_type": "stub",
+                    "urgency_indicators": [],
+                    "fraud_risk_indicators": [],
+                    "quality_score": 0.5
+                }
+            }
+        })
+    return bodies
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                chars += len(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                images += 1
+    return chars // 4 + images * 1000
+
+
+def requested_transcript(messages: List[Dict[str, Any]]) -> Optional[int]:
+    # None when the system prompt asks for the verbose schema, otherwise the
+    # transcript length the compact prompt allows (0 = no transcript).
+    system = next(
+        (message.get("content") for message in messages if message.get("role") == "system"), ""
+    )
+    if isinstance(system, list):
+        system = "".join(part.get("text", "") for part in system if part.get("type") == "text")
+    if not isinstance(system, str) or '"c":' not in system:
+        return None
+    match = re.search(r"at most (\d+) characters", system)
+    return int(match.group(1)) if match else 0
+
+
+def render_body(body: Dict[str, Any], messages: List[Dict[str, Any]]) -> str:
+    transcript_chars = requested_transcript(messages)
+    if transcript_chars is None:
+        return json.dumps(body, indent=4)
+    return json.dumps(compact_analysis(body, transcript_chars), separators=(",", ":"))
+
+
+def stream_completion(
+    config: StubConfig,
+    payload: Dict[str, Any],
+    content: str,
+    usage: Dict[str, Any],
+    latency: float,
+    prefill: float = 0.0,
+    headers: Optional[Dict[str, str]] = None
+):
+    from fastapi.responses import StreamingResponse
+
+    # Time to first token is the prefill plus a fraction of the sampled
+    # latency; the rest of the completion is spread evenly over the remaining time.
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = payload.get("model", "stub")
+    pieces = [content[index:index + 16] for index in range(0, len(content), 16)]
+    include_usage = (payload.get("stream_options") or {}).get("include_usage", False)
+
+    def chunk(choices: List[Dict[str, Any]], usage_block=None) -> str:
+        body = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": choices
+        }
+        if usage_block is not None:
+            body["usage"] = usage_block
+        return f"data: {json.dumps(body)}\n\n"
+
+    async def events():
+        await asyncio.sleep(prefill + latency * config.first_token_fraction)
+        interval = latency * (1 - config.first_token_fraction) / max(len(pieces), 1)
+        for index, piece in enumerate(pieces):
+            if index:
+                await asyncio.sleep(interval)
+            yield chunk([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if include_usage:
+            yield chunk([], usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+def create_app(config: StubConfig) -> "FastAPI":
+    # Server modules are imported here so --help and argument errors are fast.
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI(title="OpenAI-compatible stub")
+    app.state.config = config
+    app.state.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "over_quota": 0, "cached_tokens": 0}
+
+    @app.post("/{prefix:path}/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        stats = app.state.stats
+        stats["requests"] += 1
+
+        roll = config.random.random()
+        if roll < config.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit exceeded (stub)", "type": "rate_limit"}},
+                headers={"retry-after": "1"}
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "Internal error (stub)", "type": "server_error"}}
+            )
+        quota_headers = config.quota_headers()
+        if quota_headers is None:
+            stats["over_quota"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Quota exceeded (stub)", "type": "rate_limit"}},
+                headers={
+                    "retry-after": f"{60 - (time.time() - config.accepted[0]):.3f}",
+                    "x-ratelimit-limit-requests": str(config.quota_rpm),
+                    "x-ratelimit-remaining-requests": "0"
+                }
+            )
+
+        latency = config.sample_latency()
+        body = config.random.choice(config.bodies)
+        content = render_body(body, payload.get("messages", []))
+        prompt_tokens = estimate_tokens(payload.get("messages", []))
+        cached_tokens = config.cached_tokens(payload.get("messages", []))
+        stats["cached_tokens"] += cached_tokens
+        prefill = (prompt_tokens - cached_tokens) / 1000 * config.prefill_per_1k_tokens
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+        if payload.get("stream"):
+            return stream_completion(config, payload, content, usage, latency, prefill, quota_headers)
+
+        await asyncio.sleep(prefill + latency)
+        return JSONResponse(headers=quota_headers, content={
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        })
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat.completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-median", type=float, default=2.0, help="median latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="lognormal sigma")
+    parser.add_argument("--latency-max", type=float, default=60.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of HTTP 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of HTTP 429 responses")
+    parser.add_argument(
+        "--first-token-fraction", type=float, default=0.15,
+        help="share of the latency spent before the first streamed token"
+    )
+    parser.add_argument(
+        "--quota-rpm", type=int, default=0,
+        help="requests per sliding minute before answering 429 with rate-limit headers (0 = no quota)"
+    )
+    parser.add_argument(
+        "--prefill-per-1k-tokens", type=float, default=0.0,
+        help="seconds of prefill per 1000 uncached prompt tokens, added before the first token"
+    )
+    parser.add_argument(
+        "--prompt-cache-min-tokens", type=int, default=1024,
+        help="smallest prefix a cache_control breakpoint caches (Anthropic: 1024, 2048 for Haiku)"
+    )
+    parser.add_argument("--prompt-cache-ttl", type=float, default=300.0, help="seconds a cached prefix lives")
+    parser.add_argument("--bodies", default=DEFAULT_BODIES, help="glob of ProcessingResult JSON files")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = StubConfig(
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        latency_max=args.latency_max,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        first_token_fraction=args.first_token_fraction,
+        quota_rpm=args.quota_rpm,
+        prefill_per_1k_tokens=args.prefill_per_1k_tokens,
+        prompt_cache_min_tokens=args.prompt_cache_min_tokens,
+        prompt_cache_ttl=args.prompt_cache_ttl,
+        bodies=args.bodies,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,20 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import requests
+import hashlib
 import json
-import time
-from typing import Optional, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BACKEND_URL = f"http://{os.getenv('BACKEND_HOST', 'localhost')}:{os.getenv('BACKEND_PORT', '8000')}"
+MAX_CONCURRENCY = int(os.getenv("FRONTEND_MAX_CONCURRENCY", "8"))
+REQUEST_TIMEOUT = float(os.getenv("FRONTEND_REQUEST_TIMEOUT", "180"))
+RESULT_CACHE_TTL = float(os.getenv("FRONTEND_RESULT_CACHE_TTL", "3600"))
 
 st.set_page_config(
     page_title="Document Analyzer", 
@@ -16,6 +22,21 @@ st.set_page_config(
     layout="wide"
 )
 
+
+class BackendError(Exception):
+    pass
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    # One keep-alive pool shared by all reruns and sessions, sized so every
+    # concurrent upload gets its own connection.
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENCY)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 def main():
     st.title("📄 Document Categorization & Content Extraction")
     st.markdown("Upload documents to automatically categorize them and extract key information for fraud prevention.")
@@ -35,51 +56,37 @@ def main():
         - Other
         """)
     
-    uploaded_file = st.file_uploader(
-        "Choose a file", 
+    uploaded_files = st.file_uploader(
+        "Choose files", 
         type=['pdf', 'png', 'jpg', 'jpeg'],
-        help="Upload a PDF or image file for analysis"
+        accept_multiple_files=True,
+        help="Upload PDF or image files for analysis"
     )
     
-    if uploaded_file is not None:
-        col1, col2 = st.columns([1, 2])
+    if uploaded_files:
+        unique = {}
+        for uploaded_file in uploaded_files:
+            digest = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+            unique.setdefault(digest, {
+                "digest": digest,
+                "name": uploaded_file.name,
+                "type": uploaded_file.type,
+                "size": uploaded_file.size,
+                "file": uploaded_file
+            })
+        documents = list(unique.values())
         
-        with col1:
-            st.subheader("📁 File Information")
-            st.write(f"**Filename:** {uploaded_file.name}")
-            st.write(f"**File Type:** {uploaded_file.type}")
-            st.write(f"**File Size:** {uploaded_file.size:,} bytes")
-            
-            if uploaded_file.type.startswith('image/'):
-                st.image(uploaded_file, caption="Uploaded Image", width=300)
+        # Reruns (tabs, downloads, new uploads) keep showing what was
+        # submitted; those files come straight from the result cache.
+        submitted = st.session_state.setdefault("submitted", set())
+        if st.button(f"🔍 Analyze {len(documents)} Document{'s' if len(documents) > 1 else ''}", type="primary"):
+            submitted.update(document["digest"] for document in documents)
+        
+        analyze_documents([document for document in documents if document["digest"] in submitted])
         
-        with col2:
-            if st.button("🔍 Analyze Document", type="primary"):
-                # Show processing status
-                status_placeholder = st.empty()
-                progress_bar = st.progress(0)
-                
-                with status_placeholder:
-                    st.info("📤 Uploading document...")
-                progress_bar.progress(25)
-                
-                with st.spinner("🤖 Analyzing with AI model..."):
-                    status_placeholder.info("🤖 Processing with Claude 3.5 Sonnet...")
-                    progress_bar.progress(50)
-                    
-                    result = process_document(uploaded_file)
-                    
-                    progress_bar.progress(100)
-                    status_placeholder.success("✅ Analysis complete!")
-                    
-                if result:
-                    # Clear status indicators after a brief moment
-                    import time
-                    time.sleep(1)
-                    status_placeholder.empty()
-                    progress_bar.empty()
-                    
-                    display_results(result)
+        pending = [document["name"] for document in documents if document["digest"] not in submitted]
+        if pending:
+            st.caption(f"Not analyzed yet: {', '.join(pending)}")
     
     st.sidebar.markdown("---")
     
@@ -87,36 +94,119 @@ def main():
         if st.button("Check Backend Status"):
             check_backend_health()
 
-def process_document(uploaded_file) -> Optional[Dict[str, Any]]:
-    try:
-        files = {"file": (uploaded_file.name, uploaded_file.read(), uploaded_file.type)}
+def analyze_documents(documents: List[Dict[str, Any]]):
+    if not documents:
+        return
+    
+    st.subheader("📊 Summary")
+    summary_placeholder = st.empty()
+    progress_bar = st.progress(0.0)
+    
+    # One placeholder per file in upload order, filled as results arrive.
+    placeholders = {}
+    for document in documents:
+        placeholders[document["digest"]] = st.empty()
+        with placeholders[document["digest"]].container():
+            st.info(f"⏳ {document['name']} - analyzing...")
+    
+    rows = {document["digest"]: summary_row(document, None, None) for document in documents}
+    summary_placeholder.dataframe(list(rows.values()), use_container_width=True, hide_index=True)
+    
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(
+        max_workers=min(MAX_CONCURRENCY, len(documents)),
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    ) as executor:
+        futures = {
+            executor.submit(
+                process_document, document["digest"], document["name"], document["type"], document["file"].getvalue()
+            ): document
+            for document in documents
+        }
         
-        response = requests.post(
-            f"{BACKEND_URL}/process-document/",
-            files=files,
-            timeout=30
-        )
+        for done, future in enumerate(as_completed(futures), start=1):
+            document = futures[future]
+            result, error = None, None
+            try:
+                result = future.result()
+            except BackendError as e:
+                error = str(e)
+            
+            rows[document["digest"]] = summary_row(document, result, error)
+            summary_placeholder.dataframe(list(rows.values()), use_container_width=True, hide_index=True)
+            progress_bar.progress(done / len(documents), text=f"{done}/{len(documents)} analyzed")
+            
+            with placeholders[document["digest"]].container():
+                render_document(document, result, error, expanded=len(documents) == 1)
+    
+    progress_bar.empty()
+
+def summary_row(document: Dict[str, Any], result: Optional[Dict[str, Any]], error: Optional[str]) -> Dict[str, Any]:
+    row = {
+        "File": document["name"],
+        "Status": "⏳ analyzing",
+        "Category": None,
+        "Confidence": None,
+        "Risk indicators": None,
+        "Processing time (s)": None
+    }
+    if error:
+        row["Status"] = f"❌ {error}"
+    elif result is not None:
+        metadata = result.get("extracted_content", {}).get("metadata", {})
+        row.update({
+            "Status": "✅ cached" if result.get("cache_hit") else "✅ done",
+            "Category": result["category"].replace("_", " ").title(),
+            "Confidence": f"{result['confidence']:.1%}",
+            "Risk indicators": (
+                "not analysed" if metadata.get("fraud_analysis") == "skipped"
+                else str(len(metadata.get("fraud_risk_indicators", [])))
+            ),
+            "Processing time (s)": round(result["processing_time"], 2)
+        })
+    return row
+
+def render_document(document: Dict[str, Any], result: Optional[Dict[str, Any]], error: Optional[str], expanded: bool):
+    icon = "❌" if error else "✅"
+    with st.expander(f"{icon} {document['name']}", expanded=expanded):
+        st.caption(f"📁 {document['type']} · {document['size']:,} bytes")
+        if document["type"].startswith('image/'):
+            st.image(document["file"], caption="Uploaded Image", width=300)
         
-        if response.status_code == 200:
-            return response.json()
+        if error:
+            st.error(f"❌ {error}")
         else:
-            st.error(f"Error: {response.status_code} - {response.text}")
-            return None
-            
-    except requests.exceptions.ConnectionError:
-        st.error("❌ Cannot connect to backend server. Please make sure it's running.")
-        return None
-    except Exception as e:
-        st.error(f"❌ Error processing document: {str(e)}")
-        return None
+            display_results(result, widget_key=document["digest"])
 
-def display_results(result: Dict[str, Any]):
-    st.subheader("Analysis Results")
+@st.cache_data(show_spinner=False, ttl=RESULT_CACHE_TTL, max_entries=1000)
+def process_document(digest: str, filename: str, content_type: str, _content: bytes) -> Dict[str, Any]:
+    # Memoized on the content hash (the bytes themselves are not hashed
+    # again); failures raise so they are retried on the next run.
+    try:
+        response = get_session().post(
+            f"{BACKEND_URL}/process-document/",
+            files={"file": (filename, _content, content_type)},
+            timeout=REQUEST_TIMEOUT
+        )
+    except requests.exceptions.ConnectionError:
+        raise BackendError("Cannot connect to backend server. Please make sure it's running.")
+    except requests.exceptions.RequestException as e:
+        raise BackendError(f"Error processing document: {str(e)}")
     
-    if result.get("error"):
-        st.error(f"❌ Processing Error: {result['error']}")
-        return
+    if response.status_code != 200:
+        raise BackendError(f"Error: {response.status_code} - {response.text}")
     
+    try:
+        result = response.json()
+    except ValueError:
+        raise BackendError(f"Invalid response from backend: {response.text[:200]}")
+    if not isinstance(result, dict):
+        raise BackendError("Invalid response from backend: expected a JSON object")
+    if result.get("error"):
+        raise BackendError(f"Processing Error: {result['error']}")
+    return result
+
+def display_results(result: Dict[str, Any], widget_key: str):
     col1, col2, col3 = st.columns(3)
     
     with col1:
@@ -151,7 +241,7 @@ def display_results(result: Dict[str, Any]):
     with tab1:
         text_content = extracted.get("text", "")
         if text_content:
-            st.text_area("Extracted/Transcribed Text", text_content, height=200)
+            st.text_area("Extracted/Transcribed Text", text_content, height=200, key=f"text_{widget_key}")
         else:
             st.info("No text content extracted or available.")
     
@@ -190,7 +280,9 @@ def display_results(result: Dict[str, Any]):
         metadata = extracted.get("metadata", {})
         risk_indicators = metadata.get("fraud_risk_indicators", [])
         
-        if risk_indicators:
+        if metadata.get("fraud_analysis") == "skipped":
+            st.warning("⚠️ Fraud risk analysis was skipped: this document was categorised by local heuristics only.")
+        elif risk_indicators:
             st.warning("⚠️ **Potential Risk Indicators Found:**")
             for indicator in risk_indicators:
                 st.write(f"- {indicator}")
@@ -208,8 +300,8 @@ def display_results(result: Dict[str, Any]):
     col1, col2 = st.columns([3, 1])
     
     with col1:
-        with st.expander("Raw JSON Output"):
-            st.json(result)
+        st.write("**Raw JSON Output:**")
+        st.json(result, expanded=False)
     
     with col2:
         st.write("**Export Results:**")
@@ -223,12 +315,13 @@ def display_results(result: Dict[str, Any]):
             data=json_str,
             file_name=filename,
             mime="application/json",
-            help="Download the analysis results as a JSON file"
+            help="Download the analysis results as a JSON file",
+            key=f"download_{widget_key}"
         )
 
 def check_backend_health():
     try:
-        response = requests.get(f"{BACKEND_URL}/health", timeout=5)
+        response = get_session().get(f"{BACKEND_URL}/health", timeout=5)
         if response.status_code == 200:
             st.sidebar.success("✅ Backend is healthy")
         else:
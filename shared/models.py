@@ -1,5 +1,5 @@
-from typing import Dict, Any, Optional
-from pydantic import BaseModel
+from typing import Dict, Any, List, Optional
+from pydantic import BaseModel, ConfigDict, field_validator
 from enum import Enum
 
 
@@ -17,18 +17,152 @@ class ProcessingRequest(BaseModel):
     content_type: str
 
 
+def _as_list(value: Any) -> List[Any]:
+    # Model replies sometimes give a bare value, or null, where a list belongs.
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+class KeyEntities(BaseModel):
+    # Entity types the model invents are kept as extra fields.
+    model_config = ConfigDict(extra="allow")
+
+    company_names: List[Any] = []
+    person_names: List[Any] = []
+    amounts: List[Any] = []
+    addresses: List[Any] = []
+    phone_numbers: List[Any] = []
+    email_addresses: List[Any] = []
+    urls: List[Any] = []
+    product_names: List[Any] = []
+    other_relevant: List[Any] = []
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _listify(cls, value: Any) -> List[Any]:
+        return _as_list(value)
+
+
+class DocumentMetadata(BaseModel):
+    # Long documents add chunk counts and the like as extra fields.
+    model_config = ConfigDict(extra="allow")
+
+    document_type: str = "unknown"
+    urgency_indicators: List[Any] = []
+    fraud_risk_indicators: List[Any] = []
+    quality_score: float = 0.0
+
+    @field_validator("document_type", mode="before")
+    @classmethod
+    def _document_type(cls, value: Any) -> str:
+        return str(value) if value else "unknown"
+
+    @field_validator("urgency_indicators", "fraud_risk_indicators", mode="before")
+    @classmethod
+    def _listify(cls, value: Any) -> List[Any]:
+        return _as_list(value)
+
+    @field_validator("quality_score", mode="before")
+    @classmethod
+    def _score(cls, value: Any) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+
+
+class ExtractedContent(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    text: str = ""
+    key_entities: KeyEntities = KeyEntities()
+    dates: List[Any] = []
+    metadata: DocumentMetadata = DocumentMetadata()
+    file_info: Optional[Dict[str, Any]] = None
+    error_details: Optional[str] = None
+
+    @field_validator("text", mode="before")
+    @classmethod
+    def _text(cls, value: Any) -> str:
+        return "" if value is None else str(value)
+
+    @field_validator("key_entities", "metadata", mode="before")
+    @classmethod
+    def _mapping(cls, value: Any) -> Any:
+        return value if isinstance(value, (dict, BaseModel)) else {}
+
+    @field_validator("dates", mode="before")
+    @classmethod
+    def _listify(cls, value: Any) -> List[Any]:
+        return _as_list(value)
+
+
 class ProcessingResult(BaseModel):
     file_id: str
     filename: str
     category: DocumentCategory
     confidence: float
-    extracted_content: Dict[str, Any]
+    extracted_content: ExtractedContent = ExtractedContent()
     processing_time: float
     error: Optional[str] = None
+    cache_hit: bool = False
+    near_duplicate: Optional[Dict[str, Any]] = None
+    model_tier: Optional[str] = None
+    llm_model: Optional[str] = None
+    hedged: bool = False
+    stage_timings: Dict[str, float] = {}
+    token_usage: Dict[str, int] = {}
 
 
-class ExtractedContent(BaseModel):
-    text: str
-    key_entities: Dict[str, Any]
-    dates: list
-    metadata: Dict[str, Any]
\ No newline at end of file
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class JobInfo(BaseModel):
+    job_id: str
+    status: JobStatus
+    filename: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    queue_depth_at_submit: int = 0
+    queue_position: Optional[int] = None
+    wait_time: Optional[float] = None
+    run_time: Optional[float] = None
+    result: Optional[ProcessingResult] = None
+    error: Optional[str] = None
+
+
+class EntityRef(BaseModel):
+    kind: str
+    value: str
+
+
+class IndexedDocument(BaseModel):
+    file_id: str
+    filename: str
+    category: DocumentCategory
+    indexed_at: float
+
+
+class EntitySearchResult(BaseModel):
+    kind: str
+    value: str
+    documents: List[IndexedDocument]
+    truncated: bool = False
+
+
+class RelatedDocument(IndexedDocument):
+    shared_entities: List[EntityRef]
+
+
+class RelatedDocuments(BaseModel):
+    file_id: str
+    entities: List[EntityRef]
+    documents: List[RelatedDocument]
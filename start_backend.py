@@ -1,19 +1,43 @@
 #!/usr/bin/env python3
+import argparse
 import subprocess
 import sys
 import os
 
+# Production workers share results, the perceptual index and LLM rate-limit
+# budgets through these files; jobs are recovered once by the master.
+PRODUCTION_DEFAULTS = {
+    "RESULT_CACHE_DB_PATH": "cache.db",
+    "PHASH_INDEX_DB_PATH": "phash.db",
+    "SHARED_STATE_DB_PATH": "state.db",
+    "JOB_RECOVER_ON_START": "false"
+}
+
 def main():
+    parser = argparse.ArgumentParser(description="Start the backend server")
+    parser.add_argument("--production", action="store_true", help="run preloaded gunicorn workers instead of a reloading dev server")
+    parser.add_argument("--workers", type=int, help="worker processes in production mode (default: BACKEND_WORKERS or CPU count)")
+    args = parser.parse_args()
+    
     os.chdir("backend")
     
-    try:
-        subprocess.run([
+    if args.production:
+        for name, value in PRODUCTION_DEFAULTS.items():
+            os.environ.setdefault(name, value)
+        if args.workers:
+            os.environ["BACKEND_WORKERS"] = str(args.workers)
+        command = [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn_conf.py"]
+    else:
+        command = [
             sys.executable, "-m", "uvicorn", 
             "main:app", 
             "--host", "0.0.0.0", 
             "--port", "8000", 
             "--reload"
-        ], check=True)
+        ]
+    
+    try:
+        subprocess.run(command, check=True)
     except KeyboardInterrupt:
         print("\n👋 Backend server stopped")
     except Exception as e:
@@ -21,4 +45,4 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()